@@ -0,0 +1,59 @@
+import math
+from typing import Dict, List
+from .workload import Recorder
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def build_report(recorder: Recorder, elapsed: float, meta: dict) -> dict:
+    """
+    Сводка прогона: p50/p95/p99 в миллисекундах и пропускная способность по маршрутам
+    """
+    routes = {}
+    total = 0
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        total += len(values)
+        routes[route] = {
+            "requests": len(values),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+            "errors": recorder.errors.get(route, 0),
+            "statuses": {str(status): count for status, count in sorted(recorder.statuses[route].items())},
+        }
+    return {
+        "meta": dict(meta, duration_s=round(elapsed, 2)),
+        "total": {"requests": total, "throughput_rps": round(total / elapsed, 2),
+                  "errors": sum(recorder.errors.values())},
+        "routes": routes,
+    }
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.15, min_delta_ms: float = 2.0) -> List[str]:
+    """
+    Регрессии относительно сохраненного базового прогона. Задержка считается ухудшенной,
+    если выросла больше чем на tolerance и больше чем на min_delta_ms (шум на быстрых маршрутах)
+    """
+    regressions = []
+    base_routes: Dict[str, dict] = baseline.get("routes", {})
+    for route, stats in current["routes"].items():
+        base = base_routes.get(route)
+        if base is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            before, after = base[key], stats[key]
+            if after > before * (1 + tolerance) and after - before > min_delta_ms:
+                regressions.append(f"{route} {key}: {before} -> {after} (+{(after / before - 1) * 100:.0f}%)"
+                                   if before else f"{route} {key}: {before} -> {after}")
+        before, after = base["throughput_rps"], stats["throughput_rps"]
+        if before and after < before * (1 - tolerance):
+            regressions.append(f"{route} throughput_rps: {before} -> {after} ({(after / before - 1) * 100:.0f}%)")
+        if stats["errors"] > base.get("errors", 0):
+            regressions.append(f"{route} errors: {base.get('errors', 0)} -> {stats['errors']}")
+    return regressions
@@ -0,0 +1,93 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from .report import build_report, compare
+from .workload import DEFAULT_MIX, run_workload
+
+
+# Запуск нагрузочного теста против работающего приложения:
+#
+#   python -m benchmarks.run --base-url http://localhost:8000 --duration 60 --concurrency 32 \
+#       --output benchmarks/results/latest.json --baseline benchmarks/baseline.json
+#
+# Код выхода 1 - есть регрессии относительно базового прогона.
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def parse_mix(value: str) -> dict:
+    """
+    feed_scroll=45,event_search=30,...
+    """
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Неизвестный сценарий {name}")
+        mix[name] = int(weight)
+    return mix
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест: p50/p95/p99 и пропускная способность по маршрутам")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--manifest", default="benchmarks/manifest.json", help="Файл, записанный benchmarks.seed")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Куда записать отчет JSON (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="Базовый отчет для сравнения")
+    parser.add_argument("--save-baseline", action="store_true", help="Записать текущий отчет как базовый")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Допустимое ухудшение (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    with open(args.manifest, encoding="utf-8") as file:
+        manifest = json.load(file)
+
+    recorder, elapsed = run_workload(args.base_url, manifest, args.duration, args.concurrency,
+                                     args.mix, args.seed)
+    report = build_report(recorder, elapsed, {
+        "revision": git_revision(),
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "volumes": manifest["volumes"],
+        "python": platform.python_version(),
+    })
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    else:
+        print(text)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            file.write(text)
+        return 0
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline["meta"].get("volumes") != manifest["volumes"]:
+            print("Внимание: базовый прогон выполнен на других объемах данных", file=sys.stderr)
+        regressions = compare(baseline, report, args.tolerance)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
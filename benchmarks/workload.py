@@ -0,0 +1,148 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+import requests
+from config.jwt_token import jwt_manager
+
+
+# Смешанная нагрузка на запущенное приложение. Каждый поток - отдельный "пользователь",
+# который в цикле выбирает сценарий по весу и выполняет его серию запросов.
+
+
+class Recorder:
+    """
+    Задержки по шаблонам маршрутов, общий для всех потоков
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, route: str, elapsed: float, status: int):
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            self.statuses[route][status] += 1
+            if status >= 500 or status == 0:
+                self.errors[route] += 1
+
+
+class Client:
+    def __init__(self, base_url: str, recorder: Recorder, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._tokens: Dict[int, str] = {}
+
+    def auth(self, user_id: int) -> dict:
+        """
+        Заголовок авторизации от имени пользователя. Токен подписывается локально тем же
+        JWT_SECRET_KEY, что и у приложения, чтобы не смешивать с нагрузкой вход в систему
+        """
+        token = self._tokens.get(user_id)
+        if token is None:
+            token = self._tokens[user_id] = jwt_manager.encode_token(user_id)
+        return {"Authorization": f"Bearer {token}"}
+
+    def call(self, method: str, route: str, path: str = None, **kwargs) -> int:
+        """
+        route - шаблон маршрута для отчета (/events/{event_id}), path - реальный путь
+        """
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + (path or route), timeout=self.timeout, **kwargs)
+            response.content
+            status = response.status_code
+        except requests.RequestException:
+            status = 0
+        self.recorder.record(f"{method} {route}", time.perf_counter() - started, status)
+        return status
+
+
+# ================ Сценарии ================
+
+class Scenarios:
+    def __init__(self, manifest: dict, rng: random.Random):
+        self.volumes = manifest["volumes"]
+        self.free_slots = manifest["free_slots"]
+        self.user_password = manifest.get("user_password", "password")
+        self.rng = rng
+        # Горячие мероприятия для шторма лайков: все потоки бьют в одни и те же строки
+        self.hot_events = list(range(1, min(20, self.volumes["events"]) + 1))
+
+    def _user(self) -> int:
+        return self.rng.randint(1, self.volumes["users"])
+
+    def feed_scroll(self, client: Client):
+        # Пролистывание ленты: несколько страниц подряд, иногда с фильтром по категории
+        params = {"limit": 20}
+        if self.rng.random() < 0.3:
+            params["category_id"] = self.rng.randint(1, self.volumes["sport_categories"])
+        for page in range(self.rng.randint(2, 6)):
+            params["skip"] = page * 20
+            client.call("GET", "/feed/", params=params)
+
+    def event_search(self, client: Client):
+        params = {"limit": 20, "category_id": self.rng.randint(1, self.volumes["sport_categories"])}
+        if self.rng.random() < 0.5:
+            params["status"] = self.rng.choice(("new", "active"))
+        if self.rng.random() < 0.3:
+            params.update(latitude=55.75, longitude=37.6, distance=self.rng.choice((1, 5, 10)))
+        client.call("GET", "/events/", params=params)
+        event_id = self.rng.randint(1, self.volumes["events"])
+        client.call("GET", "/events/{event_id}", f"/events/{event_id}")
+
+    def login(self, client: Client):
+        # Вход по паролю: нагрузка на пул хэширования, остальные сценарии идут параллельно
+        user_id = self._user()
+        client.call("POST", "/users/login", params={"username": f"user{user_id}", "password": self.user_password})
+
+    def like_storm(self, client: Client):
+        event_id = self.rng.choice(self.hot_events)
+        client.call("POST", "/events/{event_id}/like", f"/events/{event_id}/like", headers=client.auth(self._user()))
+
+    def booking_burst(self, client: Client):
+        # Несколько пользователей одновременно целятся в одни и те же свободные слоты популярной площадки
+        venue_id = self.rng.randint(1, min(50, self.volumes["venues"]))
+        per_venue = self.free_slots["per_venue"]
+        slot_id = self.free_slots["first_id"] + (venue_id - 1) * per_venue + self.rng.randrange(per_venue)
+        client.call("GET", "/venues/{venue_id}/time-slots", f"/venues/{venue_id}/time-slots",
+                    params={"is_available": True, "limit": 20})
+        client.call("POST", "/bookings/", params={"venue_id": venue_id, "time_slot_id": slot_id},
+                    headers=client.auth(self._user()))
+
+
+DEFAULT_MIX = {"feed_scroll": 45, "event_search": 30, "like_storm": 15, "booking_burst": 10, "login": 2}
+
+
+def run_workload(base_url: str, manifest: dict, duration: float, concurrency: int,
+                 mix: Dict[str, int] = None, seed: int = 42, timeout: float = 10.0) -> Tuple[Recorder, float]:
+    """
+    Запускает concurrency потоков на duration секунд. Возвращает записанные задержки
+    и фактическую длительность прогона
+    """
+    mix = mix or DEFAULT_MIX
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+
+    def worker(index: int):
+        rng = random.Random(f"{seed}:{index}")
+        scenarios = Scenarios(manifest, rng)
+        client = Client(base_url, recorder, timeout)
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        steps: List[Callable] = [getattr(scenarios, name) for name in names]
+        while time.monotonic() < deadline:
+            rng.choices(steps, weights)[0](client)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.monotonic() - started
@@ -1 +1,28 @@
-TOKEN_CHECK = '19dfgdfgjVFjp$uM8e3Y'
\ No newline at end of file
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException
+
+
+TOKEN_CHECK = '19dfgdfgjVFjp$uM8e3Y'
+
+
+def is_internal_token(token: Optional[str]) -> bool:
+    """
+    Проверяет служебный токен внутренних клиентов
+    """
+    return token is not None and hmac.compare_digest(token, TOKEN_CHECK)
+
+def stream_mode(stream: bool = False, x_internal_token: Optional[str] = Header(None)) -> bool:
+    """
+    Режим потоковой выдачи списка доступен только внутренним клиентам
+    """
+    if stream and not is_internal_token(x_internal_token):
+        raise HTTPException(status_code=403, detail="Потоковый режим доступен только внутренним клиентам")
+    return stream
+
+def require_internal_token(x_internal_token: Optional[str] = Header(None)):
+    """
+    Доступ к служебным эндпоинтам только с заголовком X-Internal-Token
+    """
+    if not is_internal_token(x_internal_token):
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
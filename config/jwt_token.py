@@ -2,30 +2,137 @@ from fastapi import  HTTPException, status, Security
 from datetime import datetime, timedelta, timezone
 from fastapi.security import HTTPBearer
 from jose import JWTError, jwt
+from collections import OrderedDict
+from typing import Optional, Tuple
+import hashlib
+import threading
+import time
+from config import settings
+
+
+class ClaimsCache:
+    """
+    LRU-кэш проверенных токенов: хэш токена -> (claims, exp).
+    Повторный запрос с тем же токеном не проверяет подпись и не ходит в базу
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key: bytes) -> Optional[dict]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return claims
+
+    def put(self, key: bytes, claims: dict):
+        expires_at = claims.get("exp")
+        if not isinstance(expires_at, (int, float)):
+            return
+        with self._lock:
+            self._items[key] = (claims, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
 
 
 class JwtManager():
     def __init__(self):
-        self.SECRET_KEY = "0f8506a2feeae271fc2cac3b07bd4222f76e362d79e9"
-        self.ALGORITHM = "HS256"
-        self.ACCES_TOKEN_EXPIRE_MITUTES = 30000
+        self.SECRET_KEY = settings.JWT_SECRET_KEY
+        self.ALGORITHM = settings.JWT_ALGORITHM
+        self.ACCES_TOKEN_EXPIRE_MITUTES = settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES
+        self.cache = ClaimsCache(settings.JWT_CLAIMS_CACHE_SIZE)
 
-    async def create_token(self):
+    def encode_token(self, user_id: Optional[int] = None) -> str:
         payload = {
             "iat": datetime.now(tz=timezone.utc),  # Время создания токена
             "exp": datetime.now(tz=timezone.utc) + ( timedelta(minutes=self.ACCES_TOKEN_EXPIRE_MITUTES)),  # Время истечения токена
         }
+        if user_id is not None:
+            payload["sub"] = str(user_id)  # Идентификатор пользователя
         return jwt.encode(payload, self.SECRET_KEY, algorithm=self.ALGORITHM)
 
-    async def verify_token(self, credentials = Security(HTTPBearer())):
+    async def create_token(self, user_id: Optional[int] = None):
+        return self.encode_token(user_id)
+
+    def decode_token(self, token: str) -> dict:
+        """
+        Проверяет подпись и срок действия токена, результат кэшируется до exp
+        """
+        key = self.cache.key(token)
+        payload = self.cache.get(key)
+        if payload is not None:
+            return payload
         try:
-            token = credentials.credentials  # Извлекаем строку токена из HTTPAuthorizationCredentials
             payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            return payload
-        
         except JWTError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token",
                 headers={"WWW-Authenticate": "Bearer"},
-            )
\ No newline at end of file
+            )
+        self.cache.put(key, payload)
+        return payload
+
+    async def verify_token(self, credentials = Security(HTTPBearer())):
+        token = credentials.credentials  # Извлекаем строку токена из HTTPAuthorizationCredentials
+        return self.decode_token(token)
+
+
+jwt_manager = JwtManager()
+
+
+async def current_user_id(payload: dict = Security(jwt_manager.verify_token)) -> int:
+    """
+    Идентификатор пользователя из claims токена (зависимость для маршрутов записи)
+    """
+    try:
+        return int(payload["sub"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+def request_user_id(authorization: Optional[str]) -> Optional[int]:
+    """
+    Пользователь из заголовка Authorization: Bearer без ошибки 401 (для middleware и выбора базы).
+    Без токена или с недействительным токеном - None
+    """
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return int(jwt_manager.decode_token(token.strip())["sub"])
+    except (HTTPException, KeyError, TypeError, ValueError):
+        return None
+
+
+def require_owner(owner: Optional[Tuple[Optional[int]]], user_id: int, not_found: str):
+    """
+    Проверяет, что объект существует (owner - строка с идентификатором владельца) и принадлежит пользователю
+    """
+    if owner is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=not_found)
+    if owner[0] != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
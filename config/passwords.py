@@ -0,0 +1,155 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from config import settings
+from monitoring.metrics import REGISTRY, Counter, Gauge, Histogram
+
+
+# Хэширование паролей scrypt (hashlib, без внешних зависимостей).
+# Формат хранения: scrypt$n$r$p$соль$хэш (соль и хэш в base64 без выравнивания).
+# Вычисление занимает десятки миллисекунд CPU и памяти, поэтому идет в отдельном ограниченном
+# пуле потоков: всплеск входов не занимает общий пул синхронных обработчиков. hashlib.scrypt
+# отпускает GIL, так что потоки пула действительно выполняются параллельно.
+
+SCHEME = "scrypt"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+PASSWORD_HASH_SECONDS = REGISTRY.register(Histogram(
+    "password_hash_duration_seconds", "Password hashing and verification time in the hashing pool", ("operation",)))
+PASSWORD_HASH_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "password_hash_queue_seconds", "Time spent waiting for a free hashing worker", ("operation",)))
+PASSWORD_HASH_PENDING = REGISTRY.register(Gauge(
+    "password_hash_pending", "Hashing operations waiting or running in the hashing pool"))
+PASSWORD_HASH_REJECTED = REGISTRY.register(Counter(
+    "password_hash_rejected_total", "Hashing operations rejected because the pool queue was full", ("operation",)))
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+def _current_params() -> Tuple[int, int, int]:
+    return settings.PASSWORD_SCRYPT_N, settings.PASSWORD_SCRYPT_R, settings.PASSWORD_SCRYPT_P
+
+def _derive(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # scrypt требует около 128 * n * r * p байт памяти, запас на служебные структуры OpenSSL
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p + 2 ** 20, dklen=KEY_BYTES)
+
+
+def make_hash(password: str) -> str:
+    """
+    Хэш пароля с текущими параметрами стоимости (блокирующий вызов)
+    """
+    n, r, p = _current_params()
+    salt = os.urandom(SALT_BYTES)
+    return f"{SCHEME}${n}${r}${p}${_b64encode(salt)}${_b64encode(_derive(password, salt, n, r, p))}"
+
+def check_hash(password: str, stored: str) -> Tuple[bool, bool]:
+    """
+    Проверяет пароль (блокирующий вызов). Возвращает (пароль верен, нужно перехэшировать):
+    перехэширование нужно, если хэш создан с другими параметрами или пароль хранится открытым текстом
+    """
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] != SCHEME:
+        # Старые записи, созданные до хэширования: пароль хранится как есть
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+    try:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        salt, expected = _b64decode(parts[4]), _b64decode(parts[5])
+    except ValueError:
+        return False, False
+    valid = hmac.compare_digest(_derive(password, salt, n, r, p), expected)
+    return valid, (n, r, p) != _current_params()
+
+
+class PasswordHasher:
+    """
+    Отдельный пул потоков для хэширования с ограниченной очередью.
+    Если свободного места в очереди нет дольше PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS, запрос получает 503
+    """
+
+    def __init__(self, workers: int, max_pending: int, queue_timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        # Хэш случайного пароля для проверки несуществующих пользователей
+        self._dummy: Optional[str] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    async def _acquire_slot(self, operation: str):
+        # Неблокирующие попытки с короткими паузами: ожидание не занимает ни поток, ни event loop
+        deadline = time.monotonic() + self.queue_timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                PASSWORD_HASH_REJECTED.inc(operation)
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Сервис авторизации перегружен, повторите попытку позже",
+                                    headers={"Retry-After": "1"})
+            await asyncio.sleep(0.01)
+
+    async def run(self, operation: str, func, *args):
+        await self._acquire_slot(operation)
+        PASSWORD_HASH_PENDING.inc()
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            PASSWORD_HASH_QUEUE_SECONDS.observe(operation, value=started - submitted)
+            try:
+                return func(*args)
+            finally:
+                PASSWORD_HASH_SECONDS.observe(operation, value=time.perf_counter() - started)
+
+        try:
+            return await asyncio.wrap_future(self._get_executor().submit(timed))
+        finally:
+            PASSWORD_HASH_PENDING.dec()
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self.run("hash", make_hash, password)
+
+    async def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """
+        Проверяет пароль. Возвращает (пароль верен, новый хэш или None, если перехэширование не нужно).
+        Для несуществующего пользователя (stored=None) проверка все равно выполняется, чтобы время
+        ответа не выдавало, какие имена заняты
+        """
+        if stored is None:
+            if self._dummy is None:
+                self._dummy = await self.hash(os.urandom(8).hex())
+            await self.run("verify", check_hash, password, self._dummy)
+            return False, None
+        valid, outdated = await self.run("verify", check_hash, password, stored)
+        if valid and outdated:
+            return True, await self.hash(password)
+        return valid, None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING,
+                                 settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS)
@@ -1,9 +1,10 @@
 # database/__init__.py
-from .base import Base, engine, SessionLocal, get_db
+from .base import Base, engine, SessionLocal, get_db, get_read_db, replica_engines
 from .models import (SportCategory, FeedItem, FeedLike, Event, EventLike, 
                     EventRegistration, Venue, VenueLike, TimeSlot, VenueService, 
-                    Booking, BookingService, User, Team, TeamMember, TeamRequest, 
-                    TeamStats, EventTeamRegistration)
+                    Booking, BookingService, BookingTimeSlot, User, Team, TeamMember, TeamRequest, 
+                    TeamStats, EventTeamRegistration, TrendingScore, UserCategoryAffinity)
+from . import affinity
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
\ No newline at end of file
@@ -0,0 +1,115 @@
+import math
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from sqlalchemy import bindparam, case, event, func, update
+from sqlalchemy.orm import Session
+from config import settings
+from . import models
+from .base import SessionLocal
+from .crud import LOG_ROUNDING, TRENDING_EPOCH, _log_add, _log_add_sql, _upsert
+
+
+# Интерес пользователей к спортивным категориям для персональной ленты (GET /feed/personal).
+# Строка (пользователь, категория) хранит в логарифмической шкале, как и тренды, сумму весов
+# действий пользователя с затуханием по времени. Действия собираются хуком сессий приложения
+# (SessionLocal) перед flush: создание строки действия добавляет ее вклад одним upsert на flush,
+# удаление - вычитает одним UPDATE, в той же транзакции.
+
+# Модель действия -> (модель объекта, колонка объекта, колонка категории объекта, колонка времени, настройка веса)
+ENGAGEMENTS = {
+    models.FeedLike: (models.FeedItem, "feed_item_id", "category_id", "created_at", "AFFINITY_LIKE_WEIGHT"),
+    models.EventLike: (models.Event, "event_id", "sport_category_id", "created_at", "AFFINITY_LIKE_WEIGHT"),
+    models.VenueLike: (models.Venue, "venue_id", "sport_category_id", "created_at", "AFFINITY_LIKE_WEIGHT"),
+    models.EventRegistration: (models.Event, "event_id", "sport_category_id", "registration_date",
+                               "AFFINITY_REGISTRATION_WEIGHT"),
+    models.TeamMember: (models.Team, "team_id", "sport_category_id", "join_date", "AFFINITY_TEAM_WEIGHT"),
+}
+
+def affinity_points(weight: float, at: datetime) -> float:
+    """
+    Вклад действия с весом weight в момент at в логарифмической шкале
+    """
+    half_life = settings.AFFINITY_HALF_LIFE_DAYS * 86400
+    return math.log(weight) + math.log(2) * (at - TRENDING_EPOCH).total_seconds() / half_life
+
+
+def _engagement(session: Session, instance, remove: bool) -> Optional[Tuple[Tuple[int, int], float]]:
+    item_model, item_column, category_column, time_column, weight = ENGAGEMENTS[type(instance)]
+    at = getattr(instance, time_column)
+    if at is None:
+        if remove:
+            return None
+        # Время выставляется явно, а не умолчанием колонки: вклад при удалении считается от него же
+        at = datetime.utcnow()
+        setattr(instance, time_column, at)
+    item_id = getattr(instance, item_column)
+    item = session.get(item_model, item_id) if item_id is not None else None
+    category_id = getattr(item, category_column) if item is not None else None
+    if category_id is None or instance.user_id is None:
+        return None
+    return (instance.user_id, category_id), affinity_points(getattr(settings, weight), at)
+
+
+def _apply(connection, added: Dict[Tuple[int, int], float], removed: Dict[Tuple[int, int], float]):
+    table = models.UserCategoryAffinity.__table__
+    # Строки обновляются в одном порядке, чтобы параллельные транзакции не ждали друг друга по кругу
+    if added:
+        insert = _upsert(connection.dialect.name, table).values([
+            {"user_id": user_id, "category_id": category_id, "score": points}
+            for (user_id, category_id), points in sorted(added.items())])
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.category_id],
+            set_={"score": case((table.c.score.is_(None), insert.excluded.score),
+                                else_=_log_add_sql(table.c.score, insert.excluded.score))}))
+    if removed:
+        # Вычтены все действия: score становится NULL, строка остается до следующего действия или пересчета.
+        # Вычитать из отсутствующей строки нечего (действие было до пересчета или без категории)
+        points = bindparam("points")
+        score = case((table.c.score - points > LOG_ROUNDING, table.c.score + func.ln(1 - func.exp(points - table.c.score))))
+        connection.execute(
+            update(table).where(table.c.user_id == bindparam("key_user_id"),
+                                table.c.category_id == bindparam("key_category_id")).values(score=score),
+            [{"key_user_id": user_id, "key_category_id": category_id, "points": points}
+             for (user_id, category_id), points in sorted(removed.items())])
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _collect_engagements(session: Session, flush_context, instances):
+    # Вклады одной строки за flush суммируются заранее: одна строка на ключ в каждом запросе
+    changes: Tuple[Dict[Tuple[int, int], float], Dict[Tuple[int, int], float]] = ({}, {})
+    with session.no_autoflush:
+        for pending, remove in ((session.new, False), (session.deleted, True)):
+            for instance in pending:
+                if type(instance) not in ENGAGEMENTS:
+                    continue
+                engagement = _engagement(session, instance, remove)
+                if engagement is not None:
+                    key, points = engagement
+                    totals = changes[remove]
+                    totals[key] = _log_add(totals[key], points) if key in totals else points
+    if any(changes):
+        _apply(session.connection(), *changes)
+
+
+def rebuild_category_affinities(db: Session) -> int:
+    """
+    Пересчитывает интерес пользователей к категориям с нуля по всем действиям (после первого запуска
+    или смены весов). Действия учитываются в категории, в которой объект находится сейчас
+    """
+    scores: Dict[Tuple[int, int], float] = {}
+    for engagement_model, (item_model, item_column, category_column, time_column, weight) in ENGAGEMENTS.items():
+        category = getattr(item_model, category_column)
+        at = getattr(engagement_model, time_column)
+        rows = db.query(engagement_model.user_id, category, at).join(
+            item_model, item_model.id == getattr(engagement_model, item_column)
+        ).filter(engagement_model.user_id.isnot(None), category.isnot(None), at.isnot(None)).yield_per(10000)
+        for user_id, category_id, created_at in rows:
+            points = affinity_points(getattr(settings, weight), created_at)
+            key = (user_id, category_id)
+            scores[key] = _log_add(scores[key], points) if key in scores else points
+    db.query(models.UserCategoryAffinity).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.UserCategoryAffinity, [
+        {"user_id": user_id, "category_id": category_id, "score": score}
+        for (user_id, category_id), score in scores.items()])
+    db.commit()
+    return len(scores)
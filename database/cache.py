@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from config import settings
+from monitoring.metrics import REGISTRY, Counter
+from . import models
+from .base import ROUTE_CLASS_TIMEOUTS, ReplicaSessions, SessionLocal, reads_from_primary, replica_sessionmaker
+from .invalidation import publish
+
+
+logger = logging.getLogger(__name__)
+
+
+# Кэш результатов списочных запросов (stale-while-revalidate) в памяти процесса.
+# Свежая запись отдается как есть; устаревшая, но не старше STALE - тоже отдается, а обновление
+# одной фоновой задачей уходит в отдельный пул. Запись ORM в сущность инвалидирует теги ее
+# категории при коммите: следующий запрос читает базу, старые данные после записи не показываются.
+# С репликами: пользователь в окне read-your-writes читает мимо кэша, а промахи в течение
+# REPLICA_STICKY_SECONDS после инвалидации загружаются из основной базы - реплика может отставать.
+
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "result_cache_requests_total", "List query cache lookups by result", ("namespace", "result")))
+
+ANY = "*"
+
+
+def category_tag(namespace: str, category_id: Optional[int]) -> str:
+    """
+    Тег списка: с фильтром по категории - ее тег, без фильтра - тег всех категорий
+    """
+    return f"{namespace}:category:{ANY if category_id is None else category_id}"
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until", "versions", "refreshing")
+
+    def __init__(self, value, fresh_until: float, stale_until: float, versions: Tuple[Tuple[str, int], ...]):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.versions = versions
+        self.refreshing = False
+
+
+class ResultCache:
+    def __init__(self, max_entries: int, ttl: float, stale: float, refresh_workers: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale = stale
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        # Версии тегов: инвалидация увеличивает версию, записи со старой версией недействительны
+        self._versions: Dict[str, int] = {}
+        # Время последней инвалидации тегов (только с репликами)
+        self._invalidated_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._refresh_workers = refresh_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @staticmethod
+    def key(namespace: str, params: Dict[str, Any]) -> tuple:
+        # Нормализация: порядок и отсутствующие (None) фильтры не влияют на ключ
+        return (namespace,) + tuple(sorted((name, str(value)) for name, value in params.items() if value is not None))
+
+    def _snapshot(self, tags: Iterable[str]) -> Tuple[Tuple[str, int], ...]:
+        return tuple((tag, self._versions.get(tag, 0)) for tag in tags)
+
+    def _valid(self, entry: _Entry) -> bool:
+        return all(self._versions.get(tag, 0) == version for tag, version in entry.versions)
+
+    def _store(self, key: tuple, value, versions):
+        now = time.monotonic()
+        with self._lock:
+            # Инвалидация во время загрузки: результат уже устарел, не сохраняем
+            if any(self._versions.get(tag, 0) != version for tag, version in versions):
+                return
+            self._entries[key] = _Entry(value, now + self.ttl, now + self.ttl + self.stale, versions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _recently_invalidated(self, versions) -> bool:
+        # Реплика могла еще не получить запись, после которой теги инвалидированы
+        if not ReplicaSessions:
+            return False
+        horizon = time.monotonic() - settings.REPLICA_STICKY_SECONDS
+        with self._lock:
+            return any(self._invalidated_at.get(tag, horizon) > horizon for tag, _ in versions)
+
+    def _load(self, key: tuple, loader: Callable[[Session], Any], db: Session, versions):
+        value = jsonable_encoder(loader(db))
+        self._store(key, value, versions)
+        return value
+
+    def _load_from(self, factory, key: tuple, loader: Callable[[Session], Any], versions):
+        db = factory()
+        db.info["timeouts"] = ROUTE_CLASS_TIMEOUTS["read"]
+        try:
+            return self._load(key, loader, db, versions)
+        finally:
+            db.close()
+
+    def _refresh(self, key: tuple, loader: Callable[[Session], Any], versions):
+        # Запрос, запустивший обновление, уже завершился: у фоновой задачи своя сессия
+        factory = SessionLocal if self._recently_invalidated(versions) else (replica_sessionmaker() or SessionLocal)
+        try:
+            self._load_from(factory, key, loader, versions)
+        except Exception:
+            logger.exception("Ошибка фонового обновления кэша %s", key[0])
+        finally:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._refresh_workers, thread_name_prefix="cache-refresh")
+        return self._executor
+
+    def get_or_load(self, namespace: str, params: Dict[str, Any], loader: Callable[[Session], Any],
+                    tags: Iterable[str], db: Session):
+        """
+        Результат loader(db) в JSON-совместимом виде из кэша или из базы
+        """
+        # Пользователь после записи читает основную базу; его ответ не берется из кэша и не кладется в него
+        if not settings.RESULT_CACHE_ENABLED or reads_from_primary(db.info.get("authorization")):
+            return loader(db)
+        key = self.key(namespace, params)
+        tags = (namespace,) + tuple(tags)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._valid(entry) and now < entry.stale_until:
+                self._entries.move_to_end(key)
+                if now < entry.fresh_until:
+                    CACHE_REQUESTS.inc(namespace, "hit")
+                    return entry.value
+                CACHE_REQUESTS.inc(namespace, "stale")
+                if not entry.refreshing:
+                    entry.refreshing = True
+                    self._get_executor().submit(self._refresh, key, loader, self._snapshot(tags))
+                return entry.value
+            versions = self._snapshot(tags)
+        CACHE_REQUESTS.inc(namespace, "miss")
+        if self._recently_invalidated(versions):
+            return self._load_from(SessionLocal, key, loader, versions)
+        return self._load(key, loader, db, versions)
+
+    def invalidate(self, tags: Iterable[str]):
+        now = time.monotonic()
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                if ReplicaSessions:
+                    self._invalidated_at[tag] = now
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+result_cache = ResultCache(settings.RESULT_CACHE_MAX_ENTRIES, settings.RESULT_CACHE_TTL_SECONDS,
+                           settings.RESULT_CACHE_STALE_SECONDS, settings.RESULT_CACHE_REFRESH_WORKERS)
+
+
+# ================ Инвалидация при записи ================
+
+# Модель -> пространство имен кэша. Каждая запись зависит от тега пространства имен и тега категории;
+# запись в сущность инвалидирует ее категорию (при смене - старую и новую) и списки без фильтра
+CACHED_MODELS = {models.Event: "events", models.Venue: "venues", models.Team: "teams"}
+# Модели без кэша списков: запись инвалидирует только пространство имен (его слушает снимок справочников)
+NAMESPACE_MODELS = {models.SportCategory: "categories"}
+
+# Другие потребители тегов инвалидации
+_subscribers: List[Callable[[Set[str]], None]] = []
+
+# Счетчики просмотров и лайков меняются постоянно; в списках они могут отставать на время жизни записи
+COUNTER_COLUMNS = {"views_count", "likes_count"}
+
+
+def _counters_only(instance) -> bool:
+    state = inspect(instance)
+    return all(attr.key in COUNTER_COLUMNS or not attr.history.has_changes() for attr in state.attrs)
+
+
+def _instance_tags(instance, changed: bool) -> Set[str]:
+    namespace = CACHED_MODELS[type(instance)]
+    state = inspect(instance)
+    # Значения берутся без загрузки из базы: у истекшего после коммита объекта прежней категории
+    # в истории нет, тогда инвалидируется все пространство имен
+    history = state.attrs.sport_category_id.history
+    categories = set(history.deleted or ()) | set(history.unchanged or ())
+    if "sport_category_id" in state.dict:
+        categories.add(state.dict["sport_category_id"])
+    if not categories or (changed and history.added and not history.deleted):
+        return {namespace}
+    return {category_tag(namespace, category_id) for category_id in categories} | {category_tag(namespace, None)}
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_tags(session: Session, flush_context):
+    tags: Set[str] = set()
+    for instances, changed in ((session.new, False), (session.dirty, True), (session.deleted, False)):
+        for instance in instances:
+            if type(instance) in CACHED_MODELS and not (changed and _counters_only(instance)):
+                tags |= _instance_tags(instance, changed)
+            elif type(instance) in NAMESPACE_MODELS:
+                tags.add(NAMESPACE_MODELS[type(instance)])
+    if tags:
+        session.info.setdefault("cache_tags", set()).update(tags)
+        # Остальные процессы получат теги после коммита через NOTIFY
+        publish(session, tags)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session: Session):
+    tags = session.info.pop("cache_tags", None)
+    if tags:
+        invalidate(tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_tags(session: Session):
+    session.info.pop("cache_tags", None)
+
+
+def subscribe(callback: Callable[[Set[str]], None]):
+    """
+    Подписка на теги инвалидации: своих коммитов и полученных от других процессов
+    """
+    _subscribers.append(callback)
+
+
+def invalidate(tags: Iterable[str]):
+    tags = set(tags)
+    result_cache.invalidate(tags)
+    for callback in _subscribers:
+        callback(tags)
+
+
+def reset():
+    """
+    Инвалидирует все (после переподключения к каналу уведомлений)
+    """
+    invalidate({*CACHED_MODELS.values(), *NAMESPACE_MODELS.values()})
@@ -0,0 +1,153 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import exc as sa_exc
+from config import settings
+from monitoring.metrics import REGISTRY, Counter, Gauge
+
+
+logger = logging.getLogger(__name__)
+
+
+# Автомат защиты базы для отдельного маршрута: если доля ошибок базы (таймауты запросов,
+# блокировок, ожидания пула, обрывы соединений) за окно превышает порог, маршрут на время
+# отвечает 503 сразу, не занимая поток и соединение. Автоматы свои у каждого маршрута, поэтому
+# перегрузка на одном пути не отключает остальные.
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+BREAKER_STATE = REGISTRY.register(Gauge(
+    "db_circuit_breaker_open", "1 when the route's database circuit breaker rejects requests", ("route",)))
+BREAKER_REJECTED = REGISTRY.register(Counter(
+    "db_circuit_breaker_rejected_total", "Requests rejected by an open database circuit breaker", ("route",)))
+
+
+class DatabaseUnavailable(Exception):
+    """
+    База недоступна или перегружена: обработчик в main.py отвечает 503
+    """
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def is_database_failure(error: BaseException) -> bool:
+    """
+    Ошибки, говорящие о состоянии базы, а не о данных запроса (нарушение ограничений и т.п. не считаются)
+    """
+    return isinstance(error, (sa_exc.OperationalError, sa_exc.TimeoutError, sa_exc.InterfaceError))
+
+
+async def database_unavailable_handler(request: Request, error: Exception) -> JSONResponse:
+    """
+    503 вместо 500 для открытого автомата и ошибок состояния базы (таймауты, пул, соединение)
+    """
+    if isinstance(error, DatabaseUnavailable):
+        detail, retry_after = error.detail, error.retry_after
+    else:
+        detail, retry_after = "База данных не ответила вовремя, повторите попытку позже", 1
+    return JSONResponse(status_code=503, content={"detail": detail},
+                        headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+class CircuitBreaker:
+    BUCKET_SECONDS = 1
+
+    def __init__(self, name: str, error_rate: float, min_requests: int, window_seconds: float, open_seconds: float):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # [начало секунды, всего, ошибок]
+        self._buckets: deque = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._buckets and self._buckets[0][0] <= now - self.window_seconds:
+            self._buckets.popleft()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("Автомат защиты базы для %s: %s -> %s", self.name, self.state, state)
+            self.state = state
+            BREAKER_STATE.set(self.name, value=0 if state == CLOSED else 1)
+
+    def retry_after(self) -> float:
+        return max(self._opened_at + self.open_seconds - time.monotonic(), 1.0)
+
+    def allow(self) -> bool:
+        """
+        Можно ли выполнить запрос. В полуоткрытом состоянии пропускается один пробный запрос
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record(self, failed: bool):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if failed:
+                    self._opened_at = now
+                    self._set_state(OPEN)
+                else:
+                    self._buckets.clear()
+                    self._set_state(CLOSED)
+                return
+            if self.state == OPEN:
+                return
+            start = now // self.BUCKET_SECONDS * self.BUCKET_SECONDS
+            if not self._buckets or self._buckets[-1][0] != start:
+                self._buckets.append([start, 0, 0])
+            self._buckets[-1][1] += 1
+            self._buckets[-1][2] += int(failed)
+            self._trim(now)
+            total = sum(bucket[1] for bucket in self._buckets)
+            failures = sum(bucket[2] for bucket in self._buckets)
+            if total >= self.min_requests and failures / total >= self.error_rate:
+                self._opened_at = now
+                self._set_state(OPEN)
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(name)
+                if breaker is None:
+                    breaker = self._breakers[name] = CircuitBreaker(
+                        name, settings.DB_BREAKER_ERROR_RATE, settings.DB_BREAKER_MIN_REQUESTS,
+                        settings.DB_BREAKER_WINDOW_SECONDS, settings.DB_BREAKER_OPEN_SECONDS)
+        return breaker
+
+    def states(self) -> Dict[str, str]:
+        with self._lock:
+            return {name: breaker.state for name, breaker in self._breakers.items()}
+
+
+breakers = BreakerRegistry()
@@ -1,17 +1,29 @@
+import heapq
+import math
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, case, func, literal
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime
+from config import settings
 from . import models
+from .holds import get_hold_store
 from typing import List, Optional, Dict, Any
 
 
+def _columns(model, exclude=()):
+    """
+    Колонки таблицы модели для запросов без ORM-объектов (потоковое чтение)
+    """
+    return [column for column in model.__table__.columns if column.name not in exclude]
+
+
 # ================ Функции для управления пользователями ================
 
-def create_user(db: Session, username: str, password: str, avatar_url: Optional[str] = None):
+def create_user(db: Session, username: str, password_hash: str, avatar_url: Optional[str] = None):
     """
-    Создает нового пользователя
+    Создает нового пользователя (пароль передается уже захэшированным, см. config.passwords)
     """
-    db_user = models.User(username=username, password=password, avatar_url=avatar_url)
+    db_user = models.User(username=username, password=password_hash, avatar_url=avatar_url)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
@@ -23,11 +35,20 @@ def get_user(db: Session, user_id: int):
     """
     return db.query(models.User).filter(models.User.id == user_id).first()
 
-def get_user_by_username(db: Session, username: str, password: str):
+def get_user_by_username(db: Session, username: str):
     """
-    Получает пользователя по имени пользователя
+    Получает пользователя по имени пользователя (пароль проверяется отдельно, см. config.passwords)
     """
-    return db.query(models.User).filter(models.User.username == username, models.User.password == password).first()
+    return db.query(models.User).filter(models.User.username == username).first()
+
+def update_user_password(db: Session, user_id: int, password_hash: str) -> bool:
+    """
+    Заменяет хэш пароля (перехэширование при входе после смены параметров стоимости)
+    """
+    updated = db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.password: password_hash}, synchronize_session=False)
+    db.commit()
+    return updated > 0
 
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     """
@@ -35,6 +56,12 @@ def get_users(db: Session, skip: int = 0, limit: int = 100):
     """
     return db.query(models.User).offset(skip).limit(limit).all()
 
+def stream_users_query(db: Session, skip: int = 0):
+    """
+    Запрос для потокового чтения пользователей (без паролей)
+    """
+    return db.query(*_columns(models.User, exclude=("password",))).order_by(models.User.id).offset(skip)
+
 def update_user(db: Session, user_id: int, data: Dict[str, Any]):
     """
     Обновляет данные пользователя
@@ -116,6 +143,12 @@ def get_sport_categories(db: Session, skip: int = 0, limit: int = 100):
     """
     return db.query(models.SportCategory).offset(skip).limit(limit).all()
 
+def stream_sport_categories_query(db: Session, skip: int = 0):
+    """
+    Запрос для потокового чтения спортивных категорий
+    """
+    return db.query(*_columns(models.SportCategory)).order_by(models.SportCategory.id).offset(skip)
+
 def update_sport_category(db: Session, category_id: int, data: Dict[str, Any]):
     """
     Обновляет данные спортивной категории
@@ -154,6 +187,10 @@ def create_feed_item(db: Session, title: str, category_id: int, image_url: Optio
         is_interesting=is_interesting
     )
     db.add(db_feed_item)
+    db.flush()
+    # Новый элемент сразу попадает в тренды с начальным весом
+    _add_trending(db, "feed", db_feed_item.id, _trending_points(settings.TRENDING_CREATE_WEIGHT, datetime.utcnow()),
+                  category_id=db_feed_item.category_id)
     db.commit()
     db.refresh(db_feed_item)
     return db_feed_item
@@ -165,19 +202,36 @@ def get_feed_item(db: Session, feed_item_id: int):
     return db.query(models.FeedItem).filter(models.FeedItem.id == feed_item_id).first()
 
 def get_feed_items(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, 
-                   is_interesting: Optional[bool] = None):
+                   is_interesting: Optional[bool] = None, sort: Optional[str] = None):
     """
-    Получает список элементов ленты с пагинацией и фильтрацией
+    Получает список элементов ленты с пагинацией и фильтрацией (sort="trending" - по рейтингу)
+    """
+    query = _feed_items_query(db.query(models.FeedItem), category_id, is_interesting)
+    if sort == "trending":
+        query = _trending_order(query, "feed", models.FeedItem.id)
+    return query.offset(skip).limit(limit).all()
+
+def _feed_items_query(query, category_id: Optional[int] = None, is_interesting: Optional[bool] = None):
+    """
+    Применяет фильтры элементов ленты к запросу
     """
-    query = db.query(models.FeedItem)
-    
     if category_id:
         query = query.filter(models.FeedItem.category_id == category_id)
     
     if is_interesting is not None:
         query = query.filter(models.FeedItem.is_interesting == is_interesting)
     
-    return query.offset(skip).limit(limit).all()
+    return query
+
+def stream_feed_items_query(db: Session, skip: int = 0, category_id: Optional[int] = None, 
+                            is_interesting: Optional[bool] = None, sort: Optional[str] = None):
+    """
+    Запрос для потокового чтения элементов ленты (sort="trending" - по рейтингу)
+    """
+    query = _feed_items_query(db.query(*_columns(models.FeedItem)), category_id, is_interesting)
+    if sort == "trending":
+        return _trending_order(query, "feed", models.FeedItem.id).offset(skip)
+    return query.order_by(models.FeedItem.id).offset(skip)
 
 def update_feed_item(db: Session, feed_item_id: int, data: Dict[str, Any]):
     """
@@ -187,6 +241,8 @@ def update_feed_item(db: Session, feed_item_id: int, data: Dict[str, Any]):
     if db_feed_item:
         for key, value in data.items():
             setattr(db_feed_item, key, value)
+        if "category_id" in data:
+            _move_trending(db, "feed", feed_item_id, db_feed_item.category_id)
         db.commit()
         db.refresh(db_feed_item)
     return db_feed_item
@@ -198,6 +254,7 @@ def delete_feed_item(db: Session, feed_item_id: int):
     db_feed_item = db.query(models.FeedItem).filter(models.FeedItem.id == feed_item_id).first()
     if db_feed_item:
         db.delete(db_feed_item)
+        _delete_trending(db, "feed", feed_item_id)
         db.commit()
         return True
     return False
@@ -215,13 +272,15 @@ def like_feed_item(db: Session, feed_item_id: int, user_id: int):
         return existing_like
     
     # Создаем новый лайк
-    db_like = models.FeedLike(feed_item_id=feed_item_id, user_id=user_id)
+    db_like = models.FeedLike(feed_item_id=feed_item_id, user_id=user_id, created_at=datetime.utcnow())
     db.add(db_like)
     
-    # Увеличиваем счетчик лайков
+    # Увеличиваем счетчик лайков и рейтинг
     db_feed_item = db.query(models.FeedItem).filter(models.FeedItem.id == feed_item_id).first()
     if db_feed_item:
         db_feed_item.likes_count += 1
+        _add_trending(db, "feed", feed_item_id, _trending_points(settings.TRENDING_LIKE_WEIGHT, db_like.created_at),
+                      category_id=db_feed_item.category_id)
     
     db.commit()
     db.refresh(db_like)
@@ -243,6 +302,10 @@ def unlike_feed_item(db: Session, feed_item_id: int, user_id: int):
         db_feed_item = db.query(models.FeedItem).filter(models.FeedItem.id == feed_item_id).first()
         if db_feed_item and db_feed_item.likes_count > 0:
             db_feed_item.likes_count -= 1
+        # Вклад лайка в рейтинг вычитается с учетом времени, когда он был поставлен
+        if db_like.created_at is not None:
+            _add_trending(db, "feed", feed_item_id, 
+                          _trending_points(settings.TRENDING_LIKE_WEIGHT, db_like.created_at), remove=True)
         
         db.commit()
         return True
@@ -256,6 +319,8 @@ def increment_feed_item_views(db: Session, feed_item_id: int):
     db_feed_item = db.query(models.FeedItem).filter(models.FeedItem.id == feed_item_id).first()
     if db_feed_item:
         db_feed_item.views_count += 1
+        _add_trending(db, "feed", feed_item_id, _trending_points(settings.TRENDING_VIEW_WEIGHT, datetime.utcnow()),
+                      category_id=db_feed_item.category_id)
         db.commit()
         return True
     return False
@@ -268,6 +333,9 @@ def create_event(db: Session, data: Dict[str, Any]):
     """
     db_event = models.Event(**data)
     db.add(db_event)
+    db.flush()
+    _add_trending(db, "event", db_event.id, _trending_points(settings.TRENDING_CREATE_WEIGHT, datetime.utcnow()),
+                  category_id=db_event.sport_category_id)
     db.commit()
     db.refresh(db_event)
     return db_event
@@ -278,18 +346,34 @@ def get_event(db: Session, event_id: int):
     """
     return db.query(models.Event).filter(models.Event.id == event_id).first()
 
+def get_event_owner(db: Session, event_id: int):
+    """
+    Получает владельца мероприятия (строку с owner_id) или None, если мероприятия нет
+    """
+    return db.query(models.Event.owner_id).filter(models.Event.id == event_id).first()
+
 def get_events(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, 
                status: Optional[str] = None, owner_id: Optional[int] = None,
                min_date: Optional[datetime] = None, max_date: Optional[datetime] = None,
                latitude: Optional[float] = None, longitude: Optional[float] = None,
-               distance: Optional[float] = None):
+               distance: Optional[float] = None, sort: Optional[str] = None):
     
     """
-    Получает список мероприятий с пагинацией и фильтрацией
+    Получает список мероприятий с пагинацией и фильтрацией (sort="trending" - по рейтингу)
+    """
+    query = _events_query(db.query(models.Event), category_id, status, owner_id, min_date, max_date, 
+                          latitude, longitude, distance)
+    if sort == "trending":
+        query = _trending_order(query, "event", models.Event.id)
+    return query.offset(skip).limit(limit).all()
+
+def _events_query(query, category_id: Optional[int] = None, status: Optional[str] = None, 
+                  owner_id: Optional[int] = None, min_date: Optional[datetime] = None, 
+                  max_date: Optional[datetime] = None, latitude: Optional[float] = None, 
+                  longitude: Optional[float] = None, distance: Optional[float] = None):
+    """
+    Применяет фильтры мероприятий к запросу
     """
-    
-    query = db.query(models.Event)
-    
     if category_id:
         query = query.filter(models.Event.sport_category_id == category_id)
     
@@ -323,7 +407,21 @@ def get_events(db: Session, skip: int = 0, limit: int = 100, category_id: Option
             )
         )
     
-    return query.offset(skip).limit(limit).all()
+    return query
+
+def stream_events_query(db: Session, skip: int = 0, category_id: Optional[int] = None, 
+                        status: Optional[str] = None, owner_id: Optional[int] = None,
+                        min_date: Optional[datetime] = None, max_date: Optional[datetime] = None,
+                        latitude: Optional[float] = None, longitude: Optional[float] = None,
+                        distance: Optional[float] = None, sort: Optional[str] = None):
+    """
+    Запрос для потокового чтения мероприятий (sort="trending" - по рейтингу)
+    """
+    query = _events_query(db.query(*_columns(models.Event)), category_id, status, owner_id, 
+                          min_date, max_date, latitude, longitude, distance)
+    if sort == "trending":
+        return _trending_order(query, "event", models.Event.id).offset(skip)
+    return query.order_by(models.Event.id).offset(skip)
 
 def update_event(db: Session, event_id: int, data: Dict[str, Any]):
     """
@@ -333,6 +431,8 @@ def update_event(db: Session, event_id: int, data: Dict[str, Any]):
     if db_event:
         for key, value in data.items():
             setattr(db_event, key, value)
+        if "sport_category_id" in data:
+            _move_trending(db, "event", event_id, db_event.sport_category_id)
         db.commit()
         db.refresh(db_event)
     return db_event
@@ -345,6 +445,7 @@ def delete_event(db: Session, event_id: int):
     db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
     if db_event:
         db.delete(db_event)
+        _delete_trending(db, "event", event_id)
         db.commit()
         return True
     return False
@@ -361,12 +462,14 @@ def like_event(db: Session, event_id: int, user_id: int):
     if existing_like:
         return existing_like
     
-    db_like = models.EventLike(event_id=event_id, user_id=user_id)
+    db_like = models.EventLike(event_id=event_id, user_id=user_id, created_at=datetime.utcnow())
     db.add(db_like)
     
     db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
     if db_event:
         db_event.likes_count += 1
+        _add_trending(db, "event", event_id, _trending_points(settings.TRENDING_LIKE_WEIGHT, db_like.created_at),
+                      category_id=db_event.sport_category_id)
     
     db.commit()
     db.refresh(db_like)
@@ -387,6 +490,9 @@ def unlike_event(db: Session, event_id: int, user_id: int):
         db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
         if db_event and db_event.likes_count > 0:
             db_event.likes_count -= 1
+        if db_like.created_at is not None:
+            _add_trending(db, "event", event_id, 
+                          _trending_points(settings.TRENDING_LIKE_WEIGHT, db_like.created_at), remove=True)
         
         db.commit()
         return True
@@ -400,6 +506,8 @@ def increment_event_views(db: Session, event_id: int):
     db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
     if db_event:
         db_event.views_count += 1
+        _add_trending(db, "event", event_id, _trending_points(settings.TRENDING_VIEW_WEIGHT, datetime.utcnow()),
+                      category_id=db_event.sport_category_id)
         db.commit()
         return True
     return False
@@ -436,11 +544,33 @@ def register_for_event(db: Session, event_id: int, user_id: int):
     db.refresh(db_registration)
     return db_registration
 
-def check_event_user(db: Session, user_id: int):
+def check_event_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
     """
     Проверяет, зарегистрирован ли пользователь на мероприятие
     """
-    return db.query(models.EventRegistration).filter(models.EventRegistration.user_id == user_id).all()
+    return db.query(models.EventRegistration).filter(
+        models.EventRegistration.user_id == user_id
+    ).order_by(models.EventRegistration.id).offset(skip).limit(limit).all()
+
+def export_event_registrations_query(db: Session, event_id: int, status: Optional[str] = None):
+    """
+    Запрос для потоковой выгрузки регистраций на мероприятие (строки, без ORM-объектов)
+    """
+    query = db.query(
+        models.EventRegistration.id,
+        models.EventRegistration.event_id,
+        models.EventRegistration.user_id,
+        models.User.username,
+        models.EventRegistration.registration_date,
+        models.EventRegistration.status
+    ).outerjoin(models.User, models.EventRegistration.user_id == models.User.id).filter(
+        models.EventRegistration.event_id == event_id
+    )
+    
+    if status:
+        query = query.filter(models.EventRegistration.status == status)
+    
+    return query.order_by(models.EventRegistration.id)
 
 # ================ Функции для управления площадками ================
 
@@ -461,13 +591,25 @@ def get_venue(db: Session, venue_id: int):
     """
     return db.query(models.Venue).filter(models.Venue.id == venue_id).first()
 
+def get_venue_owner(db: Session, venue_id: int):
+    """
+    Получает владельца площадки (строку с owner_id) или None, если площадки нет
+    """
+    return db.query(models.Venue.owner_id).filter(models.Venue.id == venue_id).first()
+
 def get_venues(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, 
                venue_type: Optional[str] = None, owner_id: Optional[int] = None):
     """
     Получает список спортивных площадок с пагинацией и фильтрацией
     """
-    query = db.query(models.Venue)
-    
+    query = _venues_query(db.query(models.Venue), category_id, venue_type, owner_id)
+    return query.offset(skip).limit(limit).all()
+
+def _venues_query(query, category_id: Optional[int] = None, venue_type: Optional[str] = None, 
+                  owner_id: Optional[int] = None):
+    """
+    Применяет фильтры спортивных площадок к запросу
+    """
     if category_id:
         query = query.filter(models.Venue.sport_category_id == category_id)
     
@@ -477,7 +619,15 @@ def get_venues(db: Session, skip: int = 0, limit: int = 100, category_id: Option
     if owner_id:
         query = query.filter(models.Venue.owner_id == owner_id)
     
-    return query.offset(skip).limit(limit).all()
+    return query
+
+def stream_venues_query(db: Session, skip: int = 0, category_id: Optional[int] = None, 
+                        venue_type: Optional[str] = None, owner_id: Optional[int] = None):
+    """
+    Запрос для потокового чтения спортивных площадок
+    """
+    query = _venues_query(db.query(*_columns(models.Venue)), category_id, venue_type, owner_id)
+    return query.order_by(models.Venue.id).offset(skip)
 
 def update_venue(db: Session, venue_id: int, data: Dict[str, Any]):
     """
@@ -589,6 +739,20 @@ def get_team(db: Session, team_id: int):
     """
     return db.query(models.Team).filter(models.Team.id == team_id).first()
 
+def get_team_creator(db: Session, team_id: int):
+    """
+    Получает создателя команды (строку с creator_id) или None, если команды нет
+    """
+    return db.query(models.Team.creator_id).filter(models.Team.id == team_id).first()
+
+def get_team_request_creator(db: Session, request_id: int):
+    """
+    Получает создателя команды, в которую подан запрос, или None, если запроса нет
+    """
+    return db.query(models.Team.creator_id).join(
+        models.TeamRequest, models.TeamRequest.team_id == models.Team.id
+    ).filter(models.TeamRequest.id == request_id).first()
+
 def get_team_member(db: Session, team_id: int, user_id: int):
     """
     Получает команду по ID
@@ -606,8 +770,14 @@ def get_teams(db: Session, skip: int = 0, limit: int = 100,
     """
     Получает список команд с фильтрацией
     """
-    query = db.query(models.Team)
-    
+    query = _teams_query(db.query(models.Team), sport_category_id, event_id, is_auto_team)
+    return query.offset(skip).limit(limit).all()
+
+def _teams_query(query, sport_category_id: Optional[int] = None, event_id: Optional[int] = None, 
+                 is_auto_team: Optional[bool] = None):
+    """
+    Применяет фильтры команд к запросу
+    """
     if sport_category_id:
         query = query.filter(models.Team.sport_category_id == sport_category_id)
     
@@ -617,7 +787,15 @@ def get_teams(db: Session, skip: int = 0, limit: int = 100,
     if is_auto_team is not None:
         query = query.filter(models.Team.is_auto_team == is_auto_team)
     
-    return query.offset(skip).limit(limit).all()
+    return query
+
+def stream_teams_query(db: Session, skip: int = 0, sport_category_id: Optional[int] = None, 
+                       event_id: Optional[int] = None, is_auto_team: Optional[bool] = None):
+    """
+    Запрос для потокового чтения команд
+    """
+    query = _teams_query(db.query(*_columns(models.Team)), sport_category_id, event_id, is_auto_team)
+    return query.order_by(models.Team.id).offset(skip)
 
 def update_team(db: Session, team_id: int, data: Dict[str, Any]):
     """
@@ -647,6 +825,19 @@ def add_team_member(db: Session, team_id: int, user_id: int,
     """
     Добавляет пользователя в команду
     """
+    db_member = _add_team_member(db, team_id, user_id, role, position)
+    if db_member is None:
+        return None
+
+    db.commit()
+    db.refresh(db_member)
+    return db_member
+
+def _add_team_member(db: Session, team_id: int, user_id: int,
+                     role: str = 'player', position: Optional[str] = None):
+    """
+    Добавляет пользователя в команду без фиксации транзакции
+    """
     # Проверяем, существует ли уже членство
     existing_member = db.query(models.TeamMember).filter(
         models.TeamMember.team_id == team_id,
@@ -672,9 +863,6 @@ def add_team_member(db: Session, team_id: int, user_id: int,
     
     # Увеличиваем счетчик членов команды
     team.current_members += 1
-    
-    db.commit()
-    db.refresh(db_member)
     return db_member
 
 def remove_team_member(db: Session, team_id: int, user_id: int):
@@ -781,12 +969,12 @@ def handle_team_request(db: Session, request_id: int, status: str):
         return None
     
     db_request.status = status
-    db.commit()
     
-    # Если запрос принят, добавляем пользователя в команду
+    # Если запрос принят, добавляем пользователя в команду в той же транзакции
     if status == 'accepted':
-        add_team_member(db, db_request.team_id, db_request.user_id)
+        _add_team_member(db, db_request.team_id, db_request.user_id)
     
+    db.commit()
     db.refresh(db_request)
     return db_request
 
@@ -837,8 +1025,17 @@ def get_time_slot(db: Session, time_slot_id: int):
     """
     return db.query(models.TimeSlot).filter(models.TimeSlot.id == time_slot_id).first()
 
+def get_time_slot_owner(db: Session, time_slot_id: int):
+    """
+    Получает владельца площадки временного слота или None, если слота нет
+    """
+    return db.query(models.Venue.owner_id).join(
+        models.TimeSlot, models.TimeSlot.venue_id == models.Venue.id
+    ).filter(models.TimeSlot.id == time_slot_id).first()
+
 def get_venue_time_slots(db: Session, venue_id: int, start_date: Optional[datetime] = None, 
-                         end_date: Optional[datetime] = None, is_available: Optional[bool] = None):
+                         end_date: Optional[datetime] = None, is_available: Optional[bool] = None, 
+                         skip: int = 0, limit: int = 100):
     """
     Получает временные слоты для площадки с фильтрацией
     """
@@ -853,7 +1050,7 @@ def get_venue_time_slots(db: Session, venue_id: int, start_date: Optional[dateti
     if is_available is not None:
         query = query.filter(models.TimeSlot.is_available == is_available)
     
-    return query.order_by(models.TimeSlot.date, models.TimeSlot.start_time).all()
+    return query.order_by(models.TimeSlot.date, models.TimeSlot.start_time).offset(skip).limit(limit).all()
 
 def update_time_slot(db: Session, time_slot_id: int, data: Dict[str, Any]):
     """
@@ -903,6 +1100,14 @@ def get_venue_service(db: Session, service_id: int):
     """
     return db.query(models.VenueService).filter(models.VenueService.id == service_id).first()
 
+def get_venue_service_owner(db: Session, service_id: int):
+    """
+    Получает владельца площадки услуги или None, если услуги нет
+    """
+    return db.query(models.Venue.owner_id).join(
+        models.VenueService, models.VenueService.venue_id == models.Venue.id
+    ).filter(models.VenueService.id == service_id).first()
+
 def get_venue_services(db: Session, venue_id: int, is_active: Optional[bool] = None):
     """
     Получает услуги для площадки с фильтрацией
@@ -939,14 +1144,40 @@ def delete_venue_service(db: Session, service_id: int):
 
 # ================ Функции для управления бронированиями ================
 
+def hold_time_slot(db: Session, time_slot_id: int, user_id: int):
+    """
+    Временно удерживает свободный слот за пользователем на время оформления
+    """
+    time_slot = db.query(models.TimeSlot).filter(models.TimeSlot.id == time_slot_id).first()
+    if not time_slot or not time_slot.is_available:
+        return False
+    return get_hold_store().acquire(time_slot_id, user_id)
+
+def release_time_slot_hold(time_slot_id: int, user_id: int):
+    """
+    Снимает удержание слота пользователем
+    """
+    return get_hold_store().release(time_slot_id, user_id)
+
 def create_booking(db: Session, user_id: int, venue_id: int, time_slot_id: int):
     """
     Создает бронирование площадки
     """
-    # Проверяем доступность временного слота
-    # time_slot = db.query(models.TimeSlot).filter(models.TimeSlot.id == time_slot_id).first()
-    # if not time_slot or not time_slot.is_available:
-    #     return None
+    # Слот, удерживаемый другим пользователем, забронировать нельзя
+    store = get_hold_store()
+    if store.is_blocked(time_slot_id, user_id):
+        return None
+    
+    # Занимаем слот одним условным UPDATE, без долгой транзакции
+    reserved = db.query(models.TimeSlot).filter(
+        models.TimeSlot.id == time_slot_id,
+        models.TimeSlot.venue_id == venue_id,
+        models.TimeSlot.is_available == True
+    ).update({models.TimeSlot.is_available: False}, synchronize_session=False)
+    
+    if not reserved:
+        db.rollback()
+        return None
     
     # Создаем бронирование
     db_booking = models.Booking(
@@ -958,20 +1189,100 @@ def create_booking(db: Session, user_id: int, venue_id: int, time_slot_id: int):
     )
     db.add(db_booking)
     
-    # Помечаем временной слот как недоступный
-    # time_slot.is_available = False
+    db.commit()
+    db.refresh(db_booking)
+    
+    # Слот уже занят строкой бронирования: удержание оформления больше не нужно
+    store.release(time_slot_id, user_id)
+    return db_booking
+
+def create_booking_with_services(db: Session, user_id: int, venue_id: int, 
+                                 time_slot_ids: List[int], service_ids: List[int]):
+    """
+    Создает бронирование нескольких слотов с услугами в одной транзакции
+    """
+    time_slot_ids = sorted(set(time_slot_ids))
+    service_ids = sorted(set(service_ids))
+    if not time_slot_ids:
+        return None
+    
+    store = get_hold_store()
+    if any(store.is_blocked(slot_id, user_id) for slot_id in time_slot_ids):
+        return None
+    
+    # Цены всех услуг одним запросом
+    services = []
+    if service_ids:
+        services = db.query(models.VenueService.id, models.VenueService.price).filter(
+            models.VenueService.id.in_(service_ids),
+            models.VenueService.venue_id == venue_id,
+            models.VenueService.is_active == True
+        ).all()
+        if len(services) != len(service_ids):
+            return None
+    
+    # Занимаем все слоты одним UPDATE: либо все свободны, либо ничего
+    reserved = db.query(models.TimeSlot).filter(
+        models.TimeSlot.id.in_(time_slot_ids),
+        models.TimeSlot.venue_id == venue_id,
+        models.TimeSlot.is_available == True
+    ).update({models.TimeSlot.is_available: False}, synchronize_session=False)
+    
+    if reserved != len(time_slot_ids):
+        db.rollback()
+        return None
+    
+    db_booking = models.Booking(
+        user_id=user_id,
+        venue_id=venue_id,
+        time_slot_id=time_slot_ids[0],
+        status='created',
+        total_price=sum(service.price or 0 for service in services)
+    )
+    db.add(db_booking)
+    db.flush()
+    
+    db.add_all([
+        models.BookingTimeSlot(booking_id=db_booking.id, time_slot_id=slot_id)
+        for slot_id in time_slot_ids
+    ])
+    db.add_all([
+        models.BookingService(booking_id=db_booking.id, service_id=service.id)
+        for service in services
+    ])
     
     db.commit()
     db.refresh(db_booking)
+    
+    # Слоты уже заняты строкой бронирования: удержания оформления больше не нужны
+    for slot_id in time_slot_ids:
+        store.release(slot_id, user_id)
     return db_booking
 
+def get_booking_time_slot_ids(db: Session, booking_id: int, time_slot_id: Optional[int] = None):
+    """
+    Возвращает идентификаторы всех слотов бронирования
+    """
+    slot_ids = {row.time_slot_id for row in db.query(models.BookingTimeSlot.time_slot_id).filter(
+        models.BookingTimeSlot.booking_id == booking_id
+    )}
+    if time_slot_id is not None:
+        slot_ids.add(time_slot_id)
+    return sorted(slot_ids)
+
 def get_booking(db: Session, booking_id: int):
     """
     Получает бронирование по ID
     """
     return db.query(models.Booking).filter(models.Booking.id == booking_id).first()
 
-def get_user_bookings(db: Session, user_id: int, status: Optional[str] = None):
+def get_booking_owner(db: Session, booking_id: int):
+    """
+    Получает пользователя бронирования (строку с user_id) или None, если бронирования нет
+    """
+    return db.query(models.Booking.user_id).filter(models.Booking.id == booking_id).first()
+
+def get_user_bookings(db: Session, user_id: int, status: Optional[str] = None, skip: int = 0, limit: int = 100):
     """
     Получает бронирования пользователя с фильтрацией
     """
@@ -980,21 +1291,23 @@ def get_user_bookings(db: Session, user_id: int, status: Optional[str] = None):
     if status:
         query = query.filter(models.Booking.status == status)
     
-    return query.order_by(models.Booking.booking_date.desc()).all()
+    return query.order_by(models.Booking.booking_date.desc()).offset(skip).limit(limit).all()
 
-def get_venue_bookings(db: Session, venue_id: int, status: Optional[str] = None, 
-                       start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+def _venue_bookings_query(query, venue_id: int, status: Optional[str] = None, 
+                          start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, 
+                          join_time_slots: bool = True):
     """
-    Получает бронирования площадки с фильтрацией
+    Применяет фильтры бронирований площадки к запросу
     """
-    query = db.query(models.Booking).filter(models.Booking.venue_id == venue_id)
+    query = query.filter(models.Booking.venue_id == venue_id)
     
     if status:
         query = query.filter(models.Booking.status == status)
     
     if start_date or end_date:
         # Присоединяем временные слоты для фильтрации по дате
-        query = query.join(models.TimeSlot, models.Booking.time_slot_id == models.TimeSlot.id)
+        if join_time_slots:
+            query = query.join(models.TimeSlot, models.Booking.time_slot_id == models.TimeSlot.id)
         
         if start_date:
             query = query.filter(models.TimeSlot.date >= start_date.date())
@@ -1002,26 +1315,103 @@ def get_venue_bookings(db: Session, venue_id: int, status: Optional[str] = None,
         if end_date:
             query = query.filter(models.TimeSlot.date <= end_date.date())
     
-    return query.order_by(models.Booking.booking_date.desc()).all()
+    return query
+
+def get_venue_bookings(db: Session, venue_id: int, status: Optional[str] = None, 
+                       start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, 
+                       skip: int = 0, limit: int = 100):
+    """
+    Получает бронирования площадки с фильтрацией
+    """
+    query = _venue_bookings_query(db.query(models.Booking), venue_id, status, start_date, end_date)
+    return query.order_by(models.Booking.booking_date.desc()).offset(skip).limit(limit).all()
+
+def export_venue_bookings_query(db: Session, venue_id: int, status: Optional[str] = None, 
+                                start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+    """
+    Запрос для потоковой выгрузки бронирований площадки (строки, без ORM-объектов)
+    """
+    query = db.query(
+        models.Booking.id,
+        models.Booking.user_id,
+        models.Booking.venue_id,
+        models.Booking.time_slot_id,
+        models.TimeSlot.start_time,
+        models.TimeSlot.end_time,
+        models.Booking.booking_date,
+        models.Booking.status,
+        models.Booking.total_price
+    ).outerjoin(models.TimeSlot, models.Booking.time_slot_id == models.TimeSlot.id)
+    
+    query = _venue_bookings_query(query, venue_id, status, start_date, end_date, join_time_slots=False)
+    # Порядок по первичному ключу не требует сортировки всей выборки
+    return query.order_by(models.Booking.id)
 
 def update_booking_status(db: Session, booking_id: int, status: str):
     """
-    Обновляет статус бронирования
+    Обновляет статус бронирования. Менять можно только бронирование в статусе created:
+    возвращает None, если оно уже оплачено, отменено или снято фоновой очисткой
     """
+    # Условный UPDATE: очистка могла отменить бронирование и отдать его слоты другому пользователю
+    changed = db.query(models.Booking).filter(
+        models.Booking.id == booking_id,
+        models.Booking.status == 'created'
+    ).update({models.Booking.status: status}, synchronize_session=False)
+    if not changed:
+        db.rollback()
+        return None
+    
     db_booking = db.query(models.Booking).filter(models.Booking.id == booking_id).first()
-    if db_booking:
-        db_booking.status = status
-        
-        # Если бронирование отменено, освобождаем временной слот
-        if status == 'cancelled':
-            time_slot = db.query(models.TimeSlot).filter(models.TimeSlot.id == db_booking.time_slot_id).first()
-            if time_slot:
-                time_slot.is_available = True
-        
-        db.commit()
-        db.refresh(db_booking)
+    slot_ids = get_booking_time_slot_ids(db, booking_id, db_booking.time_slot_id)
+    
+    # Если бронирование отменено, освобождаем все его временные слоты
+    if status == 'cancelled' and slot_ids:
+        db.query(models.TimeSlot).filter(models.TimeSlot.id.in_(slot_ids)).update(
+            {models.TimeSlot.is_available: True}, synchronize_session=False
+        )
+    
+    db.commit()
+    db.refresh(db_booking)
+    
+    # После оплаты или отмены удержание слотов больше не нужно
+    if status in ('paid', 'cancelled'):
+        store = get_hold_store()
+        for slot_id in slot_ids:
+            store.release(slot_id, db_booking.user_id)
     return db_booking
 
+def expire_stale_bookings(db: Session, older_than: datetime, batch_size: int = 500):
+    """
+    Отменяет пачку брошенных бронирований в статусе created и освобождает их слоты.
+    Возвращает идентификаторы освобожденных слотов.
+    """
+    # SKIP LOCKED позволяет нескольким воркерам чистить параллельно
+    stale = db.query(models.Booking.id, models.Booking.time_slot_id).filter(
+        models.Booking.status == 'created',
+        models.Booking.booking_date < older_than
+    ).order_by(models.Booking.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    
+    if not stale:
+        db.rollback()
+        return []
+    
+    booking_ids = [row.id for row in stale]
+    slot_ids = [row.time_slot_id for row in stale]
+    slot_ids += [row.time_slot_id for row in db.query(models.BookingTimeSlot.time_slot_id).filter(
+        models.BookingTimeSlot.booking_id.in_(booking_ids),
+        models.BookingTimeSlot.time_slot_id.notin_([slot_id for slot_id in slot_ids if slot_id is not None])
+    )]
+    
+    db.query(models.Booking).filter(models.Booking.id.in_(booking_ids)).update(
+        {models.Booking.status: 'cancelled'}, synchronize_session=False
+    )
+    db.query(models.TimeSlot).filter(
+        models.TimeSlot.id.in_([slot_id for slot_id in slot_ids if slot_id is not None])
+    ).update({models.TimeSlot.is_available: True}, synchronize_session=False)
+    
+    db.commit()
+    return slot_ids
+
 def add_service_to_booking(db: Session, booking_id: int, service_id: int):
     """
     Добавляет услугу к бронированию
@@ -1266,4 +1656,169 @@ def calculate_team_registration_total(db: Session, registration_id: int):
     
     return {"total": total, "team_fee": db_registration.team_fee, 
             "individual_fee": db_registration.individual_fee, 
-            "members_count": team.current_members}
\ No newline at end of file
+            "members_count": team.current_members}
+# ================ Функции для трендов ================
+
+# Рейтинг хранится в логарифмической шкале: log(сумма вес * 2^((t - эпоха) / период полураспада)).
+# Вклад каждого лайка и просмотра растет со временем его появления, поэтому относительное затухание
+# старых событий не требует пересчета строк: новое событие - одно сложение в log-шкале
+TRENDING_EPOCH = datetime(2024, 1, 1)
+
+
+def _trending_points(weight: float, at: datetime) -> float:
+    """
+    Вклад события с весом weight в момент at в логарифмической шкале
+    """
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    return math.log(weight) + math.log(2) * (at - TRENDING_EPOCH).total_seconds() / half_life
+
+
+def _log_add(a: float, b: float) -> float:
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+# Погрешность log-шкалы, в пределах которой вычитаемый вклад считается равным остатку
+LOG_ROUNDING = 1e-9
+
+
+def _log_add_sql(a, b):
+    """
+    _log_add в SQL: log(exp(a) + exp(b)) без переполнения
+    """
+    return case((a >= b, a + func.ln(1 + func.exp(b - a))), else_=b + func.ln(1 + func.exp(a - b)))
+
+
+def _log_sub_sql(a, b):
+    """
+    log(exp(a) - exp(b)) в SQL: если вычитаемое не меньше остатка (погрешность округления), остаток не меняется
+    """
+    return case((a - b > LOG_ROUNDING, a + func.ln(1 - func.exp(b - a))), else_=a)
+
+
+# INSERT ... ON CONFLICT по диалекту: PostgreSQL в работе, SQLite в тестах
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _upsert(dialect_name: str, table):
+    return _UPSERT_INSERTS[dialect_name](table)
+
+
+def _add_trending(db: Session, kind: str, item_id: int, points: float, remove: bool = False,
+                  category_id: Optional[int] = None):
+    """
+    Добавляет (или вычитает) вклад события в рейтинг элемента в текущей транзакции одним запросом
+    """
+    table = models.TrendingScore.__table__
+    key = and_(table.c.kind == kind, table.c.item_id == item_id)
+    if remove:
+        db.execute(table.update().where(key).values(score=_log_sub_sql(table.c.score, points)))
+        return
+    insert = _upsert(db.get_bind().dialect.name, table).values(kind=kind, item_id=item_id, category_id=category_id,
+                                                              score=points)
+    db.execute(insert.on_conflict_do_update(
+        index_elements=[table.c.kind, table.c.item_id],
+        set_={"score": _log_add_sql(table.c.score, insert.excluded.score),
+              "category_id": func.coalesce(insert.excluded.category_id, table.c.category_id)}))
+
+
+def _move_trending(db: Session, kind: str, item_id: int, category_id: Optional[int]):
+    """
+    Переносит рейтинг элемента в новую категорию
+    """
+    db.query(models.TrendingScore).filter(
+        models.TrendingScore.kind == kind, models.TrendingScore.item_id == item_id
+    ).update({models.TrendingScore.category_id: category_id}, synchronize_session=False)
+
+
+def _delete_trending(db: Session, kind: str, item_id: int):
+    db.query(models.TrendingScore).filter(
+        models.TrendingScore.kind == kind, models.TrendingScore.item_id == item_id
+    ).delete(synchronize_session=False)
+
+
+def _trending_order(query, kind: str, id_column):
+    """
+    Сортирует запрос элементов по рейтингу. Элементы без рейтинга (созданные до его появления)
+    идут в конце, а не пропадают из выдачи
+    """
+    return query.outerjoin(models.TrendingScore, and_(models.TrendingScore.kind == kind,
+                                                       models.TrendingScore.item_id == id_column)
+                           ).order_by(models.TrendingScore.score.desc().nulls_last(), id_column.desc())
+
+
+def rebuild_trending_scores(db: Session) -> Dict[str, int]:
+    """
+    Пересчитывает рейтинги с нуля: лайки - по времени создания, накопленные просмотры - на текущий момент.
+    Элементы без активности получают начальный вклад на момент эпохи
+    """
+    now = datetime.utcnow()
+    counts = {}
+    for kind, item_model, like_model, item_column, category_column in (
+            ("feed", models.FeedItem, models.FeedLike, models.FeedLike.feed_item_id, models.FeedItem.category_id),
+            ("event", models.Event, models.EventLike, models.EventLike.event_id, models.Event.sport_category_id)):
+        base = _trending_points(settings.TRENDING_CREATE_WEIGHT, TRENDING_EPOCH)
+        categories = dict(db.query(item_model.id, category_column))
+        scores = dict.fromkeys(categories, base)
+        for item_id, views in db.query(item_model.id, item_model.views_count).filter(item_model.views_count > 0):
+            scores[item_id] = _log_add(scores[item_id], _trending_points(settings.TRENDING_VIEW_WEIGHT * views, now))
+        likes = db.query(item_column, like_model.created_at).filter(like_model.created_at.isnot(None)).yield_per(10000)
+        for item_id, created_at in likes:
+            if item_id in scores:
+                scores[item_id] = _log_add(scores[item_id], _trending_points(settings.TRENDING_LIKE_WEIGHT, created_at))
+        db.query(models.TrendingScore).filter(models.TrendingScore.kind == kind).delete(synchronize_session=False)
+        db.bulk_insert_mappings(models.TrendingScore, [
+            {"kind": kind, "item_id": item_id, "category_id": categories[item_id], "score": score}
+            for item_id, score in scores.items()])
+        counts[kind] = len(scores)
+    db.commit()
+    return counts
+
+
+# ================ Функции для персональной ленты ================
+
+def get_personal_feed(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+    """
+    Лента пользователя: тренды интересных ему категорий, слитые с общими трендами.
+    Из каждого списка читается только верх рейтинга по индексу, все элементы ленты не оцениваются
+    """
+    affinities = db.query(models.UserCategoryAffinity.category_id, models.UserCategoryAffinity.score).filter(
+        models.UserCategoryAffinity.user_id == user_id, models.UserCategoryAffinity.score.isnot(None)
+    ).order_by(models.UserCategoryAffinity.score.desc()).limit(settings.PERSONAL_FEED_CATEGORIES).all()
+    # Рейтинг умножается на интерес к категории относительно самой интересной (в log-шкале - сдвиг);
+    # общие тренды (категория None) - на EXPLORATION, чтобы в ленту попадали и другие категории
+    exploration = settings.PERSONAL_FEED_EXPLORATION
+    top = affinities[0].score if affinities else 0.0
+    boosts = [(category_id, math.log(math.exp(score - top) + exploration)) for category_id, score in affinities]
+    boosts.append((None, math.log(exploration)))
+
+    # Для страницы skip + limit из каждого списка достаточно его первых skip + limit элементов
+    depth = skip + limit
+    ranked = []
+    for source, (category_id, _) in enumerate(boosts):
+        query = db.query(models.TrendingScore.item_id, models.TrendingScore.score).filter(
+            models.TrendingScore.kind == "feed")
+        if category_id is not None:
+            query = query.filter(models.TrendingScore.category_id == category_id)
+        top_items = query.order_by(models.TrendingScore.score.desc(), models.TrendingScore.item_id.desc()
+                                   ).limit(depth).subquery()
+        ranked.append(db.query(top_items.c.item_id, top_items.c.score, literal(source).label("source")))
+    lists = [[] for _ in boosts]
+    for item_id, score, source in ranked[0].union_all(*ranked[1:]):
+        lists[source].append((score + boosts[source][1], item_id))
+    for items in lists:
+        items.sort(reverse=True)
+
+    # Элемент категории есть и в общих трендах с меньшим множителем: берется первое вхождение
+    ids, seen = [], set()
+    for _, item_id in heapq.merge(*lists, reverse=True):
+        if item_id not in seen:
+            seen.add(item_id)
+            ids.append(item_id)
+            if len(ids) == depth:
+                break
+    ids = ids[skip:]
+    if not ids:
+        return []
+    items = {item.id: item for item in db.query(models.FeedItem).filter(models.FeedItem.id.in_(ids))}
+    return [items[item_id] for item_id in ids if item_id in items]
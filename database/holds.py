@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from .kv_store import get_redis, redis_errors
+
+
+logger = logging.getLogger(__name__)
+
+
+# ================ Хранилища временных удержаний слотов ================
+
+class MemoryHoldStore:
+    """
+    Удержания слотов в памяти процесса (запасной вариант без Redis)
+    """
+
+    def __init__(self):
+        self._holds: Dict[int, Tuple[int, float]] = {}  # slot_id -> (user_id, expires_at)
+        self._lock = threading.Lock()
+
+    def acquire(self, slot_id: int, user_id: int, ttl: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            current = self._holds.get(slot_id)
+            if current and current[1] > now and current[0] != user_id:
+                return False
+            self._holds[slot_id] = (user_id, now + ttl)
+            return True
+
+    def release(self, slot_id: int, user_id: Optional[int] = None) -> bool:
+        with self._lock:
+            current = self._holds.get(slot_id)
+            if not current or (user_id is not None and current[0] != user_id):
+                return False
+            del self._holds[slot_id]
+            return True
+
+    def owner(self, slot_id: int) -> Optional[int]:
+        current = self._holds.get(slot_id)
+        if current and current[1] > time.monotonic():
+            return current[0]
+        return None
+
+    def purge_expired(self, batch_size: int) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [slot_id for slot_id, (_, expires_at) in self._holds.items() if expires_at <= now]
+            for slot_id in expired[:batch_size]:
+                del self._holds[slot_id]
+        return min(len(expired), batch_size)
+
+
+# Захват слота: если ключ свободен или уже принадлежит пользователю - продлеваем
+_ACQUIRE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+# Снятие удержания только его владельцем (или без проверки, если владелец не передан)
+_RELEASE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if not owner then
+    return 0
+end
+if ARGV[1] ~= '' and owner ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+
+class RedisHoldStore:
+    """
+    Удержания слотов в Redis: истечение TTL выполняет сам Redis
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._acquire = client.register_script(_ACQUIRE_SCRIPT)
+        self._release = client.register_script(_RELEASE_SCRIPT)
+
+    @staticmethod
+    def _key(slot_id: int) -> str:
+        return f"booking:hold:slot:{slot_id}"
+
+    def acquire(self, slot_id: int, user_id: int, ttl: int) -> bool:
+        return bool(self._acquire(keys=[self._key(slot_id)], args=[str(user_id), ttl * 1000]))
+
+    def release(self, slot_id: int, user_id: Optional[int] = None) -> bool:
+        owner = "" if user_id is None else str(user_id)
+        return bool(self._release(keys=[self._key(slot_id)], args=[owner]))
+
+    def owner(self, slot_id: int) -> Optional[int]:
+        value = self._client.get(self._key(slot_id))
+        return int(value) if value is not None else None
+
+    def purge_expired(self, batch_size: int) -> int:
+        return 0
+
+
+class HoldStore:
+    """
+    Хранилище удержаний: Redis, если он настроен, иначе память процесса.
+    При ошибках Redis операции выполняются в памяти процесса.
+    """
+
+    def __init__(self):
+        self._memory = MemoryHoldStore()
+        client = get_redis()
+        self._redis = RedisHoldStore(client) if client is not None else None
+
+    def _call(self, method: str, *args):
+        if self._redis is not None:
+            try:
+                return getattr(self._redis, method)(*args)
+            except redis_errors() as exc:
+                logger.warning("Redis недоступен, удержания слотов в памяти процесса: %s", exc)
+        return getattr(self._memory, method)(*args)
+
+    def acquire(self, slot_id: int, user_id: int, ttl: Optional[int] = None) -> bool:
+        return self._call("acquire", slot_id, user_id, ttl or settings.BOOKING_HOLD_TTL_SECONDS)
+
+    def release(self, slot_id: int, user_id: Optional[int] = None) -> bool:
+        return self._call("release", slot_id, user_id)
+
+    def owner(self, slot_id: int) -> Optional[int]:
+        return self._call("owner", slot_id)
+
+    def is_blocked(self, slot_id: int, user_id: int) -> bool:
+        owner = self.owner(slot_id)
+        return owner is not None and owner != user_id
+
+    def purge_expired(self, batch_size: int) -> int:
+        # Память процесса чистим всегда: туда попадают удержания при сбоях Redis
+        return self._memory.purge_expired(batch_size)
+
+
+_store: Optional[HoldStore] = None
+
+
+def get_hold_store() -> HoldStore:
+    """
+    Возвращает общее хранилище удержаний
+    """
+    global _store
+    if _store is None:
+        _store = HoldStore()
+    return _store
+
+
+# ================ Фоновая очистка ================
+
+def sweep_once(batch_size: int = settings.BOOKING_SWEEP_BATCH_SIZE) -> int:
+    """
+    Снимает истекшие удержания и отменяет брошенные бронирования пачками.
+    Возвращает количество освобожденных слотов.
+    """
+    from . import crud
+    from .base import SessionLocal
+
+    store = get_hold_store()
+    store.purge_expired(batch_size)
+
+    older_than = datetime.utcnow() - timedelta(seconds=settings.BOOKING_CHECKOUT_TTL_SECONDS)
+    released = 0
+    db = SessionLocal()
+    try:
+        while True:
+            slot_ids: List[Optional[int]] = crud.expire_stale_bookings(db, older_than=older_than, batch_size=batch_size)
+            for slot_id in slot_ids:
+                if slot_id is not None:
+                    store.release(slot_id)
+                    released += 1
+            if len(slot_ids) < batch_size:
+                break
+    finally:
+        db.close()
+    return released
+
+async def run_sweeper(stop: asyncio.Event):
+    """
+    Периодически запускает очистку в пуле потоков, пока не выставлен stop
+    """
+    while not stop.is_set():
+        try:
+            released = await asyncio.to_thread(sweep_once)
+            if released:
+                logger.info("Освобождено слотов брошенных бронирований: %s", released)
+        except Exception:
+            logger.exception("Ошибка фоновой очистки бронирований")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.BOOKING_SWEEP_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Callable, Iterable, Set
+from sqlalchemy.orm import Session
+from config import settings
+from monitoring.metrics import REGISTRY, Counter
+from .base import engine
+
+
+logger = logging.getLogger(__name__)
+
+
+# Инвалидация кэшей между процессами через LISTEN/NOTIFY PostgreSQL.
+# Теги публикуются pg_notify в той же транзакции, что и запись: PostgreSQL доставляет
+# уведомление только после коммита и отбрасывает его при откате. Каждый процесс слушает
+# канал на отдельном соединении вне пула и инвалидирует полученные теги у себя.
+
+# Идентификатор процесса: свои уведомления уже применены при коммите и пропускаются
+ORIGIN = uuid.uuid4().hex
+
+# Лимит payload NOTIFY - 8000 байт; длинный список тегов заменяется пространствами имен
+MAX_PAYLOAD = 7000
+
+INVALIDATION_MESSAGES = REGISTRY.register(Counter(
+    "cache_invalidation_messages_total", "Cache invalidation notifications by direction", ("direction",)))
+
+
+def enabled(dialect_name: str) -> bool:
+    return settings.CACHE_INVALIDATION_NOTIFY and dialect_name == "postgresql"
+
+
+def _payload(tags: Set[str]) -> str:
+    payload = json.dumps({"origin": ORIGIN, "tags": sorted(tags)})
+    if len(payload) > MAX_PAYLOAD:
+        payload = json.dumps({"origin": ORIGIN, "tags": sorted({tag.split(":", 1)[0] for tag in tags})})
+    return payload
+
+
+def publish(session: Session, tags: Set[str]):
+    """
+    Ставит уведомление с тегами в текущую транзакцию сессии
+    """
+    connection = session.connection()
+    if not tags or not enabled(connection.dialect.name):
+        return
+    # Курсором драйвера, как и таймауты: служебный запрос не попадает в счетчики SQL запроса
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute("SELECT pg_notify(%s, %s)", (settings.CACHE_INVALIDATION_CHANNEL, _payload(tags)))
+    finally:
+        cursor.close()
+    INVALIDATION_MESSAGES.inc("published")
+
+
+def _connect():
+    # Соединение отсоединяется от пула: оно занято LISTEN на все время работы процесса
+    raw = engine.raw_connection()
+    raw.detach()
+    connection = raw.driver_connection
+    connection.autocommit = True
+    cursor = connection.cursor()
+    try:
+        cursor.execute('LISTEN "%s"' % settings.CACHE_INVALIDATION_CHANNEL.replace('"', '""'))
+    finally:
+        cursor.close()
+    return connection
+
+
+def _ping(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+    finally:
+        cursor.close()
+
+
+def _drain(connection) -> Set[str]:
+    connection.poll()
+    tags: Set[str] = set()
+    while connection.notifies:
+        notify = connection.notifies.pop(0)
+        try:
+            message = json.loads(notify.payload)
+        except ValueError:
+            logger.warning("Некорректное уведомление инвалидации: %r", notify.payload)
+            continue
+        if message.get("origin") != ORIGIN:
+            tags.update(message.get("tags", ()))
+    return tags
+
+
+async def _listen(connection, invalidate: Callable[[Iterable[str]], None]):
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    fileno = connection.fileno()
+    loop.add_reader(fileno, readable.set)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(readable.wait(), timeout=settings.CACHE_INVALIDATION_PING_SECONDS)
+            except asyncio.TimeoutError:
+                # Без трафика обрыв соединения иначе не заметить. Уведомления, пришедшие
+                # во время проверки, драйвер уже прочитал - они разбираются ниже
+                await asyncio.to_thread(_ping, connection)
+            readable.clear()
+            tags = _drain(connection)
+            if tags:
+                INVALIDATION_MESSAGES.inc("received")
+                invalidate(tags)
+    finally:
+        loop.remove_reader(fileno)
+
+
+async def run_listener(invalidate: Callable[[Iterable[str]], None], reset: Callable[[], None]):
+    """
+    Слушает канал инвалидации до отмены задачи, переподключаясь при ошибках.
+    После (пере)подключения вызывает reset: уведомления за время обрыва потеряны
+    """
+    while True:
+        connection = None
+        try:
+            connection = await asyncio.to_thread(_connect)
+            reset()
+            await _listen(connection, invalidate)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ошибка канала инвалидации кэша, переподключение")
+        finally:
+            if connection is not None:
+                connection.close()
+        await asyncio.sleep(settings.CACHE_INVALIDATION_RECONNECT_SECONDS)
@@ -0,0 +1,32 @@
+from typing import Optional
+from config import settings
+
+try:
+    import redis
+except ImportError:  # Redis - необязательная зависимость
+    redis = None
+
+
+_client = None
+
+
+def get_redis() -> Optional["redis.Redis"]:
+    """
+    Возвращает общий клиент Redis или None, если Redis не настроен или не установлен
+    """
+    global _client
+    if _client is None and redis is not None and settings.REDIS_URL:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return _client
+
+def redis_errors() -> tuple:
+    """
+    Исключения Redis, при которых нужно переключаться на хранилище в памяти
+    """
+    if redis is None:
+        return ()
+    return (redis.RedisError,)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 from .base import Base
 from datetime import datetime
@@ -150,6 +150,7 @@ class TimeSlot(Base):
     # Отношения
     venue = relationship("Venue", back_populates="time_slots")
     bookings = relationship("Booking", back_populates="time_slot")
+    booking_time_slots = relationship("BookingTimeSlot", back_populates="time_slot")
 
 class VenueService(Base):
     __tablename__ = 'venue_services'
@@ -181,6 +182,18 @@ class Booking(Base):
     venue = relationship("Venue", back_populates="bookings")
     time_slot = relationship("TimeSlot", back_populates="bookings")
     booking_services = relationship("BookingService", back_populates="booking")
+    booking_time_slots = relationship("BookingTimeSlot", back_populates="booking")
+
+class BookingTimeSlot(Base):
+    __tablename__ = 'booking_time_slots'
+
+    id = Column(Integer, primary_key=True)
+    booking_id = Column(Integer, ForeignKey('bookings.id'), index=True)
+    time_slot_id = Column(Integer, ForeignKey('time_slots.id'), index=True)
+
+    # Отношения
+    booking = relationship("Booking", back_populates="booking_time_slots")
+    time_slot = relationship("TimeSlot", back_populates="booking_time_slots")
 
 class BookingService(Base):
     __tablename__ = 'booking_services'
@@ -294,4 +307,28 @@ class EventTeamRegistration(Base):
     
     # Отношения
     event = relationship("Event", back_populates="team_registrations")
-    team = relationship("Team", back_populates="event_registrations")
\ No newline at end of file
+    team = relationship("Team", back_populates="event_registrations")
+
+# Раздел трендов
+class TrendingScore(Base):
+    __tablename__ = 'trending_scores'
+    # Топ по тренду - обратный проход по индексу (kind, score, item_id)
+    # Топ категории (персональная лента) - по индексу (kind, category_id, score, item_id)
+    __table_args__ = (Index('ix_trending_scores_kind_score', 'kind', 'score', 'item_id'),
+                      Index('ix_trending_scores_kind_category_score', 'kind', 'category_id', 'score', 'item_id'))
+
+    kind = Column(String, primary_key=True)  # feed, event
+    item_id = Column(Integer, primary_key=True)
+    category_id = Column(Integer)  # категория элемента (FeedItem.category_id, Event.sport_category_id)
+    # log(сумма весов лайков и просмотров * 2^(время от эпохи / период полураспада)), см. crud
+    score = Column(Float, nullable=False)
+
+# Раздел рекомендаций
+class UserCategoryAffinity(Base):
+    __tablename__ = 'user_category_affinities'
+
+    user_id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    # log(сумма весов действий пользователя в категории * 2^(время от эпохи / период полураспада)), см. database.affinity;
+    # NULL - все действия пользователя в категории удалены
+    score = Column(Float)
@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+from .kv_store import get_redis, redis_errors
+
+
+logger = logging.getLogger(__name__)
+
+
+# ================ Окно "прилипания" к основной базе после записи ================
+
+class MemoryStickyStore:
+    """
+    Время последней записи пользователей в памяти процесса (запасной вариант без Redis)
+    """
+
+    MAX_ITEMS = 100000
+
+    def __init__(self):
+        self._until: Dict[int, float] = {}  # user_id -> момент окончания окна
+        self._lock = threading.Lock()
+
+    def mark(self, user_id: int, seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._until) >= self.MAX_ITEMS:
+                self._until = {key: until for key, until in self._until.items() if until > now}
+            self._until[user_id] = now + seconds
+
+    def is_sticky(self, user_id: int) -> bool:
+        until = self._until.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+class RedisStickyStore:
+    """
+    Окна в Redis: общие для всех экземпляров приложения, истечение - через TTL ключа
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"db:sticky:user:{user_id}"
+
+    def mark(self, user_id: int, seconds: float):
+        self._client.set(self._key(user_id), 1, px=max(int(seconds * 1000), 1))
+
+    def is_sticky(self, user_id: int) -> bool:
+        return bool(self._client.exists(self._key(user_id)))
+
+
+class StickyStore:
+    """
+    Redis, если он настроен, иначе память процесса. При ошибках Redis - память процесса
+    """
+
+    def __init__(self):
+        self._memory = MemoryStickyStore()
+        client = get_redis()
+        self._redis = RedisStickyStore(client) if client is not None else None
+
+    def _call(self, method: str, *args):
+        if self._redis is not None:
+            try:
+                return getattr(self._redis, method)(*args)
+            except redis_errors() as exc:
+                logger.warning("Redis недоступен, окна чтения из основной базы в памяти процесса: %s", exc)
+        return getattr(self._memory, method)(*args)
+
+    def mark(self, user_id: int, seconds: float):
+        if seconds > 0:
+            self._call("mark", user_id, seconds)
+
+    def is_sticky(self, user_id: int) -> bool:
+        return self._call("is_sticky", user_id)
+
+
+_store: Optional[StickyStore] = None
+
+
+def get_sticky_store() -> StickyStore:
+    """
+    Возвращает общее хранилище окон
+    """
+    global _store
+    if _store is None:
+        _store = StickyStore()
+    return _store
+
@@ -0,0 +1,347 @@
+import asyncio
+import fcntl
+import json
+import logging
+import math
+import mmap
+import os
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Dict, Generator, Iterable, List, Optional, Tuple, Union
+from fastapi import Request
+from sqlalchemy.orm import Session
+from config import settings
+from monitoring.metrics import REGISTRY, Counter, Gauge
+from . import cache, models
+from .base import ROUTE_CLASS_TIMEOUTS, SessionLocal, get_read_db, reads_from_primary
+
+
+logger = logging.getLogger(__name__)
+
+
+# Снимок справочных данных (категории, каталог площадок, сводки активных мероприятий) в файле,
+# который процессы отображают в память только для чтения. Колонки лежат массивами фиксированной
+# ширины, строки - смещениями в общий буфер UTF-8: чтение идет прямо из отображения без
+# десериализации, а все процессы узла делят одну физическую копию в page cache.
+# Пересобирает снимок один процесс узла (держатель блокировки), остальные подхватывают новый файл.
+
+MAGIC = b"REFSNAP1"
+ALIGN = 8
+# NULL в целочисленных колонках; в вещественных и датах - NaN
+INT_NULL = -2 ** 63
+
+SNAPSHOT_BUILDS = REGISTRY.register(Counter(
+    "reference_snapshot_builds_total", "Reference snapshot rebuilds by result", ("result",)))
+SNAPSHOT_BYTES = REGISTRY.register(Gauge(
+    "reference_snapshot_bytes", "Size of the mapped reference snapshot"))
+SNAPSHOT_GENERATION = REGISTRY.register(Gauge(
+    "reference_snapshot_generation", "Build time (unix seconds) of the mapped reference snapshot"))
+
+# Таблица -> (модель, колонки с типами, условие отбора строк).
+# Типы: q - целое, d - вещественное, t - дата и время (UTC, секунды), s - строка
+TABLES = {
+    "categories": (models.SportCategory, [("id", "q"), ("name", "s"), ("icon_url", "s")], None),
+    "venues": (models.Venue, [("id", "q"), ("name", "s"), ("address", "s"), ("image_url", "s"),
+                              ("owner_id", "q"), ("venue_type", "s"), ("sport_category_id", "q")], None),
+    # Без счетчиков и свободных мест: они меняются постоянно и читаются из базы
+    "events": (models.Event, [("id", "q"), ("title", "s"), ("image_url", "s"), ("sport_category_id", "q"),
+                              ("event_date", "t"), ("registration_end_date", "t"), ("price", "d"),
+                              ("location", "s"), ("longitude", "d"), ("latitude", "d"), ("owner_id", "q"),
+                              ("status", "s")],
+               models.Event.status != "completed"),
+}
+
+# Пространства имен тегов инвалидации, от которых зависит снимок
+NAMESPACES = {"categories", "venues", "events"}
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    if value is None:
+        return math.nan
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+# ================ Сборка ================
+
+class _Writer:
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def add(self, data: bytes) -> int:
+        padding = -self.size % ALIGN
+        if padding:
+            self.chunks.append(b"\0" * padding)
+            self.size += padding
+        offset = self.size
+        self.chunks.append(data)
+        self.size += len(data)
+        return offset
+
+
+def _write_table(writer: _Writer, rows: List[tuple], columns: List[Tuple[str, str]]) -> dict:
+    spec = {"rows": len(rows), "columns": {}}
+    for position, (name, kind) in enumerate(columns):
+        values = [row[position] for row in rows]
+        if kind == "q":
+            data = array("q", (INT_NULL if value is None else value for value in values))
+            spec["columns"][name] = {"type": kind, "values": writer.add(data.tobytes())}
+        elif kind in ("d", "t"):
+            convert = _timestamp if kind == "t" else (lambda value: math.nan if value is None else value)
+            data = array("d", (convert(value) for value in values))
+            spec["columns"][name] = {"type": kind, "values": writer.add(data.tobytes())}
+        else:
+            encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+            offsets = array("q", [0])
+            for item in encoded:
+                offsets.append(offsets[-1] + len(item))
+            spec["columns"][name] = {
+                "type": kind,
+                "offsets": writer.add(offsets.tobytes()),
+                "nulls": writer.add(bytes(value is None for value in values)),
+                "data": writer.add(b"".join(encoded)),
+            }
+    # Строки отсортированы по id; для выборки по категории - перестановка, упорядоченная по (категория, id)
+    names = [name for name, _ in columns]
+    if "sport_category_id" in names:
+        position = names.index("sport_category_id")
+        order = sorted(range(len(rows)), key=lambda index: (
+            INT_NULL if rows[index][position] is None else rows[index][position], index))
+        spec["by_category"] = writer.add(array("q", order).tobytes())
+    return spec
+
+
+def build_snapshot(db: Session) -> bytes:
+    """
+    Снимок справочных данных в виде байтов файла
+    """
+    writer = _Writer()
+    directory = {"built_at": time.time(), "tables": {}}
+    for name, (model, columns, condition) in TABLES.items():
+        query = db.query(*[getattr(model, column) for column, _ in columns])
+        if condition is not None:
+            query = query.filter(condition)
+        rows = query.order_by(model.id).all()
+        directory["tables"][name] = _write_table(writer, rows, columns)
+    header = json.dumps(directory).encode()
+    prefix = MAGIC + len(header).to_bytes(8, "little") + header
+    prefix += b"\0" * (-len(prefix) % ALIGN)
+    return prefix + b"".join(writer.chunks)
+
+
+# ================ Чтение ================
+
+class SnapshotTable:
+    """
+    Таблица снимка: строки отсортированы по id, значения читаются прямо из отображенного файла
+    """
+
+    def __init__(self, data: memoryview, spec: dict):
+        self.size = spec["rows"]
+        self._columns: Dict[str, tuple] = {}
+        for name, column in spec["columns"].items():
+            kind = column["type"]
+            if kind == "s":
+                offsets = data[column["offsets"]:column["offsets"] + (self.size + 1) * 8].cast("q")
+                nulls = data[column["nulls"]:column["nulls"] + self.size]
+                self._columns[name] = (kind, offsets, nulls, data[column["data"]:])
+            else:
+                code = "q" if kind == "q" else "d"
+                self._columns[name] = (kind, data[column["values"]:column["values"] + self.size * 8].cast(code))
+        self.ids = self._columns["id"][1]
+        self._by_category = None
+        if "by_category" in spec:
+            self._by_category = data[spec["by_category"]:spec["by_category"] + self.size * 8].cast("q")
+
+    def __len__(self) -> int:
+        return self.size
+
+    def value(self, column: str, index: int):
+        entry = self._columns[column]
+        kind = entry[0]
+        if kind == "s":
+            _, offsets, nulls, blob = entry
+            if nulls[index]:
+                return None
+            return bytes(blob[offsets[index]:offsets[index + 1]]).decode("utf-8")
+        value = entry[1][index]
+        if kind == "q":
+            return None if value == INT_NULL else value
+        if math.isnan(value):
+            return None
+        if kind == "t":
+            return datetime.fromtimestamp(value, tz=timezone.utc).replace(tzinfo=None)
+        return value
+
+    def row(self, index: int) -> dict:
+        return {column: self.value(column, index) for column in self._columns}
+
+    def find(self, row_id: int) -> Optional[dict]:
+        index = bisect_left(self.ids, row_id)
+        if index < self.size and self.ids[index] == row_id:
+            return self.row(index)
+        return None
+
+    def page(self, skip: int = 0, limit: int = 100) -> List[dict]:
+        return [self.row(index) for index in range(skip, min(skip + limit, self.size))]
+
+    def by_category(self, category_id: int, skip: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """
+        Строки категории по возрастанию id (бинарный поиск по индексу категории)
+        """
+        categories = self._columns["sport_category_id"][1]
+        order = self._by_category
+        start = bisect_left(order, category_id, key=lambda index: categories[index])
+        end = bisect_right(order, category_id, lo=start, key=lambda index: categories[index])
+        start = min(start + skip, end)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [self.row(order[position]) for position in range(start, end)]
+
+
+class Snapshot:
+    def __init__(self, buffer: mmap.mmap, identity: Tuple[int, int]):
+        self.identity = identity
+        self.size = len(buffer)
+        view = memoryview(buffer)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Неизвестный формат снимка")
+        length = int.from_bytes(view[len(MAGIC):len(MAGIC) + 8], "little")
+        start = len(MAGIC) + 8
+        directory = json.loads(bytes(view[start:start + length]))
+        data = view[start + length + (-(start + length) % ALIGN):]
+        self.built_at: float = directory["built_at"]
+        self.tables = {name: SnapshotTable(data, spec) for name, spec in directory["tables"].items()}
+        self.categories = self.tables["categories"]
+        self.venues = self.tables["venues"]
+        self.events = self.tables["events"]
+
+    @classmethod
+    def open(cls, path: str) -> "Snapshot":
+        # Отображение живет, пока на него ссылаются представления: старый снимок освобождается,
+        # когда его дочитают все запросы, а файл после замены остается до снятия отображения
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, (stat.st_ino, stat.st_mtime_ns))
+
+
+# ================ Хранилище снимка ================
+
+class SnapshotStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._snapshot: Optional[Snapshot] = None
+        self._checked = 0.0
+        self._dirty = True
+        self._lock_file = None
+
+    def current(self) -> Optional[Snapshot]:
+        """
+        Текущий снимок или None, если его нет или он устарел (тогда читаем из базы)
+        """
+        now = time.monotonic()
+        if now - self._checked >= settings.SNAPSHOT_CHECK_INTERVAL_SECONDS:
+            self._checked = now
+            self._reload()
+        snapshot = self._snapshot
+        if snapshot is None or time.time() - snapshot.built_at > settings.SNAPSHOT_MAX_AGE_SECONDS * 2:
+            return None
+        return snapshot
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if self._snapshot is not None and self._snapshot.identity == (stat.st_ino, stat.st_mtime_ns):
+            return
+        try:
+            snapshot = Snapshot.open(self.path)
+        except (OSError, ValueError, KeyError):
+            logger.exception("Не удалось открыть снимок справочников %s", self.path)
+            return
+        self._snapshot = snapshot
+        SNAPSHOT_BYTES.set(value=snapshot.size)
+        SNAPSHOT_GENERATION.set(value=snapshot.built_at)
+
+    def mark_dirty(self, tags: Iterable[str]):
+        if any(tag.split(":", 1)[0] in NAMESPACES for tag in tags):
+            self._dirty = True
+
+    def _is_builder(self) -> bool:
+        # Снимок узла собирает один процесс: тот, кто держит блокировку (после его остановки - следующий)
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def rebuild(self):
+        db = SessionLocal()
+        db.info["timeouts"] = ROUTE_CLASS_TIMEOUTS["export"]
+        try:
+            content = build_snapshot(db)
+        finally:
+            db.close()
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(content)
+        os.replace(temporary, self.path)
+        self._checked = 0.0
+
+    async def run_builder(self, stop: asyncio.Event):
+        """
+        Пересобирает снимок после изменений (не чаще раза в SNAPSHOT_REBUILD_DELAY_SECONDS)
+        и не реже раза в SNAPSHOT_MAX_AGE_SECONDS, пока не выставлен stop
+        """
+        while not stop.is_set():
+            try:
+                if self._is_builder():
+                    self._reload()
+                    snapshot = self._snapshot
+                    if self._dirty or snapshot is None or time.time() - snapshot.built_at > settings.SNAPSHOT_MAX_AGE_SECONDS:
+                        # Изменения во время сборки снова пометят снимок
+                        self._dirty = False
+                        await asyncio.to_thread(self.rebuild)
+                        SNAPSHOT_BUILDS.inc("ok")
+            except Exception:
+                self._dirty = True
+                SNAPSHOT_BUILDS.inc("error")
+                logger.exception("Ошибка сборки снимка справочников")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=settings.SNAPSHOT_REBUILD_DELAY_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def close(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+snapshot_store = SnapshotStore(settings.SNAPSHOT_PATH)
+cache.subscribe(snapshot_store.mark_dirty)
+
+
+def get_reference_source(request: Request) -> Generator[Union[Snapshot, Session], None, None]:
+    """
+    Источник справочных данных: снимок, если он есть, иначе сессия чтения.
+    Пользователь, который недавно что-то записал, читает из базы
+    """
+    snapshot = None
+    if settings.SNAPSHOT_ENABLED and not reads_from_primary(request.headers.get("authorization")):
+        snapshot = snapshot_store.current()
+    if snapshot is not None:
+        yield snapshot
+    else:
+        yield from get_read_db(request)
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator
+from sqlalchemy.orm import Query, Session
+from .base import ROUTE_CLASS_TIMEOUTS, SessionLocal, replica_sessionmaker
+
+
+# Сколько строк забирать с серверного курсора за один раз
+STREAM_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _csv_value(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return "" if value is None else value
+
+def encode_rows(rows: Iterator[Dict[str, Any]], fmt: str, columns, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[bytes]:
+    """
+    Кодирует строки в CSV, NDJSON или JSON-массив, отдавая данные пачками
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+
+    # Заголовок отправляем сразу, до первого обращения к базе
+    if fmt == "csv":
+        writer.writerow(columns)
+    elif fmt == "json":
+        buffer.write("[")
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    count = 0
+    for row in rows:
+        if fmt == "csv":
+            writer.writerow([_csv_value(row[column]) for column in columns])
+        elif fmt == "ndjson":
+            buffer.write(json.dumps(row, default=_json_default, ensure_ascii=False))
+            buffer.write("\n")
+        else:
+            if count:
+                buffer.write(",")
+            buffer.write(json.dumps(row, default=_json_default, ensure_ascii=False))
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if fmt == "json":
+        buffer.write("]")
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def stream_query(build_query: Callable[[Session], Query], fmt: str, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[bytes]:
+    """
+    Потоково выгружает результат запроса через серверный курсор.
+    Генератор сам открывает и закрывает сессию: сессия из get_db закрывается
+    раньше, чем StreamingResponse начинает отдавать данные.
+    Выгрузки читаются с реплики, если она есть (окно после записи здесь не учитывается).
+    """
+    db = (replica_sessionmaker() or SessionLocal)()
+    db.info["timeouts"] = ROUTE_CLASS_TIMEOUTS["export"]
+    try:
+        query = build_query(db)
+        columns = [column["name"] for column in query.column_descriptions]
+        rows = (dict(row._mapping) for row in query.yield_per(batch_size))
+        yield from encode_rows(rows, fmt, columns, batch_size)
+    finally:
+        db.close()
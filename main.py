@@ -1,10 +1,114 @@
+from contextlib import asynccontextmanager, suppress
+import asyncio
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from routes import (booking, event, feed, sport_category, team, user, venue, database)
+from sqlalchemy import exc as sa_exc
+from routes import (booking, event, feed, sport_category, team, user, venue, database, metrics, admin, health)
+from database import crud
+from database.base import engine, SessionLocal, replica_engines, ReplicaSessions
+from database import cache, invalidation
+from database.cache import result_cache
+from database.snapshot import snapshot_store
+from database.circuit_breaker import DatabaseUnavailable, database_unavailable_handler
+from database.holds import run_sweeper
+from middleware.admission import AdmissionControlMiddleware
+from middleware.idempotency import IdempotencyMiddleware
+from middleware.rate_limit import RateLimitMiddleware
+from monitoring.metrics import MetricsMiddleware, register_pool
+from monitoring.sql import instrument_engine
+from monitoring.query_debug import QueryDebugMiddleware, enable_raiseload
+from monitoring.server_timing import ServerTimingMiddleware
+from monitoring.sampling import ProfilingMiddleware, start_background_sampler, stop_background_sampler
+from monitoring.tracing import TracingMiddleware, instrument_engine_tracing, instrument_module, setup_tracing, tracer
+from config import settings
+from config.passwords import password_hasher
 import uvicorn
 
 
-app = FastAPI(debug=False)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.TRACING_ENABLED:
+        setup_tracing()
+    if settings.PROFILER_BACKGROUND_ENABLED:
+        start_background_sampler()
+    # Фоновая очистка истекших удержаний и брошенных бронирований
+    stop = asyncio.Event()
+    sweeper = asyncio.create_task(run_sweeper(stop))
+    # Инвалидация кэша списков по записям других процессов
+    listener = None
+    if settings.RESULT_CACHE_ENABLED and invalidation.enabled(engine.dialect.name):
+        listener = asyncio.create_task(invalidation.run_listener(cache.invalidate, cache.reset))
+    # Сборка снимка справочников (выполняет один процесс узла)
+    snapshot_builder = asyncio.create_task(snapshot_store.run_builder(stop)) if settings.SNAPSHOT_ENABLED else None
+    # Прогрев: пока не завершен, /health/ready отвечает 503
+    warmup = asyncio.create_task(health.run_warmup(stop))
+    yield
+    health.readiness.draining = True
+    stop.set()
+    await warmup
+    await sweeper
+    if snapshot_builder is not None:
+        await snapshot_builder
+    snapshot_store.close()
+    if listener is not None:
+        listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await listener
+    tracer.shutdown()
+    stop_background_sampler()
+    password_hasher.shutdown()
+    result_cache.shutdown()
+
+
+app = FastAPI(debug=False, lifespan=lifespan)
+
+# Перегрузка или недоступность базы - 503 с Retry-After (см. database/circuit_breaker.py)
+for error_class in (DatabaseUnavailable, sa_exc.OperationalError, sa_exc.TimeoutError, sa_exc.InterfaceError):
+    app.add_exception_handler(error_class, database_unavailable_handler)
+
+# Учет SQL-запросов: метрики на запрос и профилировщик
+for db_engine in [engine, *replica_engines]:
+    instrument_engine(db_engine)
+
+# Отладка запросов: счетчик SQL, поиск N+1 и бюджеты эндпоинтов (только dev/test)
+if settings.QUERY_DEBUG:
+    app.add_middleware(QueryDebugMiddleware)
+    if settings.QUERY_DEBUG_RAISELOAD:
+        for session_factory in [SessionLocal, *ReplicaSessions]:
+            enable_raiseload(session_factory)
+
+# Профилирование отдельных запросов по флагу администратора
+app.add_middleware(ProfilingMiddleware)
+
+# Разбивка времени ответа в заголовке Server-Timing
+if settings.SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
+# Адаптивное ограничение одновременных запросов по группам маршрутов с вытеснением лишних (503)
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware)
+
+# Повторы запросов с Idempotency-Key получают сохраненный ответ без обращения к обработчику
+if settings.IDEMPOTENCY_ENABLED:
+    app.add_middleware(IdempotencyMiddleware)
+
+# Ограничение частоты запросов записи: до лимита одновременных запросов и до базы
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
+# Метрики Prometheus (добавляются после отладки, чтобы быть внешним слоем и делить счетчики запроса)
+if settings.METRICS_ENABLED:
+    register_pool(engine)
+    for index, replica in enumerate(replica_engines, 1):
+        register_pool(replica, f"replica{index}")
+    app.add_middleware(MetricsMiddleware)
+
+# Трассировка: внешний слой, чтобы корневой спан покрывал весь запрос
+if settings.TRACING_ENABLED:
+    for db_engine in [engine, *replica_engines]:
+        instrument_engine_tracing(db_engine)
+    instrument_module(crud)
+    app.add_middleware(TracingMiddleware)
 
 # Register routes
 app.include_router(user.user_router,  prefix="/users")
@@ -16,6 +120,11 @@ app.include_router(team.team_router, prefix="/teams")
 app.include_router(booking.booking_router, prefix="/bookings")
 
 app.include_router(database.database_router, prefix="/database")
+app.include_router(health.health_router)
+app.include_router(admin.admin_router, prefix="/admin")
+
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.metrics_router)
 
 
 if __name__ == "__main__":
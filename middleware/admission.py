@@ -0,0 +1,216 @@
+import asyncio
+import heapq
+import itertools
+import re
+import time
+from typing import List, Tuple
+from starlette.responses import JSONResponse
+from config import settings
+from monitoring.metrics import REGISTRY, Counter, Gauge, Histogram
+
+
+# Адаптивное ограничение одновременных запросов (AIMD) по группам маршрутов.
+# Пока задержка ниже целевой, лимит группы растет на 1 за "окно" (+1/limit на каждый ответ),
+# при превышении - умножается на ADMISSION_BACKOFF. Запросы сверх лимита коротко ждут в очереди
+# с приоритетами, затем получают 503 с Retry-After. Все операции выполняются в потоке event loop,
+# поэтому блокировки не нужны.
+
+HIGH, NORMAL, LOW = 0, 1, 2
+PRIORITY_NAMES = {HIGH: "high", NORMAL: "normal", LOW: "low"}
+
+# Первое совпадение (метод, шаблон пути) задает приоритет, остальные запросы - NORMAL
+PRIORITY_RULES: List[Tuple[str, "re.Pattern", int]] = [
+    ("POST", re.compile(r"^/bookings/(batch|holds)?$"), HIGH),
+    ("PUT", re.compile(r"^/bookings/\d+$"), HIGH),
+    ("POST", re.compile(r"^/events/\d+/register$"), HIGH),
+    ("POST", re.compile(r"^/users/login$"), HIGH),
+    ("POST", re.compile(r"/views/increment$"), LOW),
+    ("POST", re.compile(r"^/users/\d+/(followers|reviews)/(increment|decrement)$"), LOW),
+    ("POST", re.compile(r"^/(events|feed|venues)/\d+/like$"), LOW),
+    ("DELETE", re.compile(r"^/(events|feed|venues)/\d+/like$"), LOW),
+]
+
+ADMIN_PREFIXES = ("/admin", "/database", "/metrics")
+# Проверки состояния не ограничиваются: отказ liveness-проверке перезапустил бы процесс
+EXEMPT_PREFIXES = ("/health/",)
+# Выгрузки длятся секунды и минуты: в группе чтения они бы постоянно снижали лимит
+BULK_PATH = re.compile(r"/export$")
+
+ADMISSION_LIMIT = REGISTRY.register(Gauge(
+    "admission_concurrency_limit", "Current adaptive concurrency limit", ("group",)))
+ADMISSION_IN_FLIGHT = REGISTRY.register(Gauge(
+    "admission_in_flight", "Requests admitted and not yet finished", ("group",)))
+ADMISSION_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "admission_queue_seconds", "Time spent waiting for admission", ("group", "priority")))
+ADMISSION_SHED = REGISTRY.register(Counter(
+    "admission_shed_total", "Requests rejected with 503 by admission control", ("group", "priority")))
+
+
+def classify(method: str, path: str, query_string: bytes = b"") -> Tuple[str, int]:
+    """
+    Группа маршрута (read, write, admin) и приоритет запроса.
+    Служебные маршруты и потоковые выгрузки относятся к группе admin
+    """
+    if path.startswith(ADMIN_PREFIXES) or BULK_PATH.search(path) or b"stream=true" in query_string:
+        return "admin", NORMAL
+    group = "read" if method in ("GET", "HEAD", "OPTIONS") else "write"
+    for rule_method, pattern, priority in PRIORITY_RULES:
+        if method == rule_method and pattern.search(path):
+            return group, priority
+    return group, NORMAL
+
+
+class AdaptiveLimiter:
+    def __init__(self, group: str, target_latency: float, initial: int, min_limit: int, max_limit: int,
+                 queue_size: int, queue_timeout: float, backoff: float = 0.9, low_priority_share: float = 0.8):
+        self.group = group
+        self.target_latency = target_latency
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        # Низкий приоритет не занимает последние слоты: они остаются важным запросам
+        self.low_priority_share = low_priority_share
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._last_decrease = 0.0
+        ADMISSION_LIMIT.set(group, value=int(self.limit))
+
+    def _capacity(self, priority: int) -> int:
+        limit = int(self.limit)
+        if priority == LOW:
+            return max(int(limit * self.low_priority_share), 1)
+        return limit
+
+    def _admit_waiters(self):
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= self._capacity(priority):
+                return
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            future.set_result(True)
+
+    def _remove_waiter(self, entry):
+        try:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        except ValueError:
+            pass
+
+    async def acquire(self, priority: int) -> bool:
+        """
+        True - запрос допущен (слот нужно вернуть через release), False - запрос отклонен
+        """
+        ahead = self._waiters and self._waiters[0][0] <= priority
+        if not ahead and self.in_flight < self._capacity(priority):
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            # Очередь полна: вытесняем самый низкоприоритетный запрос, если он ниже текущего
+            worst = max(self._waiters)
+            if worst[0] <= priority:
+                return False
+            self._remove_waiter(worst)
+            # Ожидание вытесняемого могло уже закончиться таймаутом или отменой: задача еще не убрала его из очереди
+            if not worst[2].done():
+                worst[2].set_result(False)
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            return await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._cancel_waiter(entry)
+            return False
+        except asyncio.CancelledError:
+            self._cancel_waiter(entry)
+            raise
+
+    def _cancel_waiter(self, entry):
+        self._remove_waiter(entry)
+        # Слот мог быть выдан в тот же момент, когда истекло ожидание
+        future = entry[2]
+        if future.done() and not future.cancelled() and future.result():
+            self.release()
+
+    def release(self):
+        self.in_flight -= 1
+        self._admit_waiters()
+
+    def record(self, latency: float, overloaded: bool = False):
+        """
+        AIMD: медленный или перегруженный ответ уменьшает лимит (не чаще раза за целевую задержку),
+        быстрый ответ при загруженной группе - увеличивает
+        """
+        now = time.monotonic()
+        if overloaded or latency > self.target_latency:
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        ADMISSION_LIMIT.set(self.group, value=int(self.limit))
+        self._admit_waiters()
+
+
+def _limiter(group: str, target_ms: float) -> AdaptiveLimiter:
+    return AdaptiveLimiter(group, target_ms / 1000, settings.ADMISSION_INITIAL_LIMIT, settings.ADMISSION_MIN_LIMIT,
+                           settings.ADMISSION_MAX_LIMIT, settings.ADMISSION_QUEUE_SIZE,
+                           settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000, settings.ADMISSION_BACKOFF,
+                           settings.ADMISSION_LOW_PRIORITY_SHARE)
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware: адаптивный лимит одновременных запросов для групп read, write и admin
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.limiters = {
+            "read": _limiter("read", settings.ADMISSION_TARGET_LATENCY_READ_MS),
+            "write": _limiter("write", settings.ADMISSION_TARGET_LATENCY_WRITE_MS),
+            "admin": _limiter("admin", settings.ADMISSION_TARGET_LATENCY_ADMIN_MS),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        group, priority = classify(scope["method"], scope["path"], scope.get("query_string", b""))
+        limiter = self.limiters[group]
+        queued = time.perf_counter()
+        admitted = await limiter.acquire(priority)
+        ADMISSION_QUEUE_SECONDS.observe(group, PRIORITY_NAMES[priority], value=time.perf_counter() - queued)
+        if not admitted:
+            ADMISSION_SHED.inc(group, PRIORITY_NAMES[priority])
+            response = JSONResponse({"detail": "Сервер перегружен, повторите попытку позже"}, status_code=503,
+                                    headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)})
+            await response(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        ADMISSION_IN_FLIGHT.inc(group)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            ADMISSION_IN_FLIGHT.dec(group)
+            # 503 изнутри (автомат защиты базы, пул хэширования) - тоже признак перегрузки
+            limiter.record(time.perf_counter() - started, overloaded=status == 503)
+            limiter.release()
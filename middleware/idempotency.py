@@ -0,0 +1,345 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from config import settings
+from config.jwt_token import request_user_id
+from database.kv_store import get_redis, redis_errors
+from monitoring.metrics import REGISTRY, Counter
+
+
+logger = logging.getLogger(__name__)
+
+
+# Заголовок Idempotency-Key для POST бронирований и регистраций: повтор запроса с тем же ключом
+# получает сохраненный ответ без выполнения обработчика, одновременные повторы ждут первый.
+# Ключ действует в пределах пользователя; отпечаток (метод, путь, параметры, тело) защищает
+# от повторного использования ключа для другого запроса.
+
+HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENT_ROUTES = [
+    ("POST", re.compile(r"^/bookings/(batch)?$")),
+    ("POST", re.compile(r"^/bookings/\d+/services$")),
+    ("POST", re.compile(r"^/events/\d+/register$")),
+]
+
+# Заголовки ответа, которые сохраняются вместе с телом
+STORED_HEADERS = {b"content-type", b"location"}
+
+IDEMPOTENCY_REQUESTS = REGISTRY.register(Counter(
+    "idempotency_requests_total", "Requests carrying an Idempotency-Key by outcome", ("outcome",)))
+
+IN_PROGRESS, DONE = "in_progress", "done"
+
+
+class Record:
+    """
+    Состояние ключа: выполняется (owner - кто выполняет) или готовый ответ (тело сжато zlib)
+    """
+
+    __slots__ = ("state", "fingerprint", "owner", "status", "headers", "body")
+
+    def __init__(self, state: str, fingerprint: str, owner: str = "", status: int = 0,
+                 headers: Optional[List[Tuple[bytes, bytes]]] = None, body: bytes = b""):
+        self.state = state
+        self.fingerprint = fingerprint
+        self.owner = owner
+        self.status = status
+        self.headers = headers or []
+        self.body = body
+
+    def dumps(self) -> str:
+        return json.dumps({"s": self.state, "f": self.fingerprint, "o": self.owner, "c": self.status,
+                           "h": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in self.headers],
+                           "b": base64.b64encode(self.body).decode()})
+
+    @classmethod
+    def loads(cls, raw) -> "Record":
+        data = json.loads(raw)
+        return cls(data["s"], data["f"], data["o"], data["c"],
+                   [(name.encode("latin-1"), value.encode("latin-1")) for name, value in data["h"]],
+                   base64.b64decode(data["b"]))
+
+
+# ================ Хранилища ================
+
+class MemoryIdempotencyStore:
+    """
+    Ключи в памяти процесса: LRU с ограничением размера и сроком жизни записей
+    """
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, Tuple[Record, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[Record]:
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._items[key]
+            return None
+        return entry[0]
+
+    def begin(self, key: str, record: Record, ttl: float) -> Optional[Record]:
+        """
+        Занимает ключ записью в состоянии in_progress. Если ключ уже есть - возвращает его запись
+        """
+        with self._lock:
+            existing = self._get(key)
+            if existing is not None:
+                return existing
+            self._put(key, record, ttl)
+            return None
+
+    def _put(self, key: str, record: Record, ttl: float):
+        self._items[key] = (record, time.monotonic() + ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Record]:
+        with self._lock:
+            return self._get(key)
+
+    def complete(self, key: str, record: Record, ttl: float):
+        with self._lock:
+            self._put(key, record, ttl)
+
+    def abandon(self, key: str, owner: str):
+        with self._lock:
+            existing = self._get(key)
+            if existing is not None and existing.state == IN_PROGRESS and existing.owner == owner:
+                del self._items[key]
+
+
+# Удаление незавершенной записи только ее владельцем: поля записи сравниваются точно, а не поиском подстроки
+_ABANDON_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return 0
+end
+local record = cjson.decode(raw)
+if record['s'] == ARGV[1] and record['o'] == ARGV[2] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+class RedisIdempotencyStore:
+    """
+    Ключи в Redis: повтор может прийти на другой экземпляр приложения
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._abandon = client.register_script(_ABANDON_SCRIPT)
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return f"idempotency:{key}"
+
+    def begin(self, key: str, record: Record, ttl: float) -> Optional[Record]:
+        if self._client.set(self._key(key), record.dumps(), nx=True, px=int(ttl * 1000)):
+            return None
+        return self.get(key) or record
+
+    def get(self, key: str) -> Optional[Record]:
+        raw = self._client.get(self._key(key))
+        return Record.loads(raw) if raw is not None else None
+
+    def complete(self, key: str, record: Record, ttl: float):
+        self._client.set(self._key(key), record.dumps(), px=int(ttl * 1000))
+
+    def abandon(self, key: str, owner: str):
+        self._abandon(keys=[self._key(key)], args=[IN_PROGRESS, owner])
+
+
+class IdempotencyStore:
+    """
+    Redis, если он настроен, иначе память процесса. При ошибках Redis - память процесса
+    """
+
+    def __init__(self):
+        self._memory = MemoryIdempotencyStore(settings.IDEMPOTENCY_MAX_KEYS)
+        client = get_redis()
+        self._redis = RedisIdempotencyStore(client) if client is not None else None
+
+    @property
+    def shared(self) -> bool:
+        return self._redis is not None
+
+    def _call(self, method: str, *args):
+        if self._redis is not None:
+            try:
+                return getattr(self._redis, method)(*args)
+            except redis_errors() as exc:
+                logger.warning("Redis недоступен, ключи идемпотентности в памяти процесса: %s", exc)
+        return getattr(self._memory, method)(*args)
+
+    def begin(self, key: str, record: Record, ttl: float) -> Optional[Record]:
+        return self._call("begin", key, record, ttl)
+
+    def get(self, key: str) -> Optional[Record]:
+        return self._call("get", key)
+
+    def complete(self, key: str, record: Record, ttl: float):
+        self._call("complete", key, record, ttl)
+
+    def abandon(self, key: str, owner: str):
+        self._call("abandon", key, owner)
+
+
+# ================ Middleware ================
+
+def _error(status: int, detail: str) -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=status)
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware для маршрутов из IDEMPOTENT_ROUTES с заголовком Idempotency-Key
+    """
+
+    def __init__(self, app, store: Optional[IdempotencyStore] = None):
+        self.app = app
+        self.store = store or IdempotencyStore()
+        # Ключи, которые сейчас выполняются в этом процессе: повторы ждут результат здесь
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def _store_call(self, method: str, *args):
+        if self.store.shared:
+            return await run_in_threadpool(getattr(self.store, method), *args)
+        return getattr(self.store, method)(*args)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(
+                scope["method"] == method and pattern.search(scope["path"]) for method, pattern in IDEMPOTENT_ROUTES):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        key = headers.get(HEADER)
+        # Без токена ключ не к кому привязать; обработчик сам ответит 401
+        user_id = request_user_id(headers.get(b"authorization", b"").decode("latin-1"))
+        if key is None or user_id is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _error(400, f"Idempotency-Key должен быть от 1 до {MAX_KEY_LENGTH} символов")(scope, receive, send)
+            return
+
+        body, receive = await self._read_body(receive)
+        digest = hashlib.sha256()
+        for part in (scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body):
+            digest.update(len(part).to_bytes(8, "big") + part)
+        fingerprint = digest.hexdigest()
+        store_key = f"{user_id}:{hashlib.sha256(key).hexdigest()}"
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            pending = self._pending.get(store_key)
+            if pending is not None:
+                # Тот же ключ уже выполняется в этом процессе: ждем его ответ
+                await asyncio.shield(pending)
+                continue
+            owner = uuid.uuid4().hex
+            existing = await self._store_call("begin", store_key, Record(IN_PROGRESS, fingerprint, owner),
+                                              settings.IDEMPOTENCY_LOCK_SECONDS)
+            if existing is None:
+                break
+            if existing.fingerprint != fingerprint:
+                IDEMPOTENCY_REQUESTS.inc("mismatch")
+                await _error(422, "Idempotency-Key уже использован для другого запроса")(scope, receive, send)
+                return
+            if existing.state == DONE:
+                IDEMPOTENCY_REQUESTS.inc("replayed")
+                await self._replay(existing, send)
+                return
+            # Выполняется на другом экземпляре: ждем сохраненный ответ
+            if time.monotonic() >= deadline:
+                IDEMPOTENCY_REQUESTS.inc("conflict")
+                await _error(409, "Запрос с этим Idempotency-Key еще выполняется")(scope, receive, send)
+                return
+            await asyncio.sleep(0.05)
+
+        IDEMPOTENCY_REQUESTS.inc("executed")
+        future = asyncio.get_running_loop().create_future()
+        self._pending[store_key] = future
+        try:
+            await self._execute(scope, receive, send, store_key, fingerprint, owner)
+        finally:
+            self._pending.pop(store_key, None)
+            future.set_result(None)
+
+    async def _read_body(self, receive):
+        chunks = []
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            more = message.get("more_body", False)
+        body = b"".join(chunks)
+        sent = False
+
+        async def replay_receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return body, replay_receive
+
+    async def _execute(self, scope, receive, send, store_key: str, fingerprint: str, owner: str):
+        status = 500
+        headers: List[Tuple[bytes, bytes]] = []
+        chunks = []
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers.extend((name, value) for name, value in message.get("headers", [])
+                               if name.lower() in STORED_HEADERS)
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if size <= settings.IDEMPOTENCY_MAX_BODY_BYTES:
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        completed = False
+        try:
+            await self.app(scope, receive, send_wrapper)
+            # 5xx и отказы по перегрузке не сохраняются: повтор должен выполниться заново
+            if status < 500 and status != 429 and size <= settings.IDEMPOTENCY_MAX_BODY_BYTES:
+                record = Record(DONE, fingerprint, status=status, headers=headers, body=zlib.compress(b"".join(chunks)))
+                await self._store_call("complete", store_key, record, settings.IDEMPOTENCY_TTL_SECONDS)
+                completed = True
+        finally:
+            if not completed:
+                await self._store_call("abandon", store_key, owner)
+
+    async def _replay(self, record: Record, send):
+        body = zlib.decompress(record.body)
+        await send({"type": "http.response.start", "status": record.status,
+                    "headers": record.headers + [(b"content-length", str(len(body)).encode()),
+                                                 (b"idempotent-replayed", b"true")]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,247 @@
+import ipaddress
+import logging
+import math
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from config import settings
+from config.jwt_token import request_user_id
+from database.kv_store import get_redis, redis_errors
+from monitoring.metrics import REGISTRY, Counter
+
+
+logger = logging.getLogger(__name__)
+
+
+# Ограничение частоты запросов записи (token bucket) по пользователю и по IP.
+# Проверка идет до маршрутизации и зависимостей, поэтому отклоненный запрос не берет
+# ни поток, ни соединение с базой.
+
+RATE_LIMITED = REGISTRY.register(Counter(
+    "rate_limited_total", "Requests rejected with 429 by the rate limiter", ("rule", "scope")))
+
+
+class Rule:
+    """
+    Правило: метод, шаблон пути и ведро (rate токенов в секунду, вместимость burst).
+    Для IP лимит умножается на RATE_LIMIT_IP_MULTIPLIER: за одним адресом бывает много пользователей
+    """
+
+    def __init__(self, name: str, method: str, pattern: str, per_minute: float, burst: int):
+        self.name = name
+        self.method = method
+        self.pattern = re.compile(pattern)
+        self.rate = per_minute / 60
+        self.burst = burst
+
+    def matches(self, method: str, path: str) -> bool:
+        return method == self.method and self.pattern.search(path) is not None
+
+
+# Первое подходящее правило; запросы чтения не ограничиваются
+RULES: List[Rule] = [
+    Rule("like", "POST", r"^/(events|venues|feed)/\d+/like$",
+         settings.RATE_LIMIT_LIKES_PER_MINUTE, settings.RATE_LIMIT_LIKES_BURST),
+    Rule("unlike", "DELETE", r"^/(events|venues|feed)/\d+/like$",
+         settings.RATE_LIMIT_LIKES_PER_MINUTE, settings.RATE_LIMIT_LIKES_BURST),
+    Rule("team_request", "POST", r"^/teams/\d+/requests$",
+         settings.RATE_LIMIT_TEAM_REQUESTS_PER_MINUTE, settings.RATE_LIMIT_TEAM_REQUESTS_BURST),
+    Rule("login", "POST", r"^/users/login$",
+         settings.RATE_LIMIT_LOGIN_PER_MINUTE, settings.RATE_LIMIT_LOGIN_BURST),
+] + [
+    Rule("write", method, r"^/", settings.RATE_LIMIT_WRITES_PER_MINUTE, settings.RATE_LIMIT_WRITES_BURST)
+    for method in ("POST", "PUT", "PATCH", "DELETE")
+]
+
+# (ключ, токенов в секунду, вместимость)
+Bucket = Tuple[str, float, float]
+
+
+# ================ Хранилища ведер ================
+
+class MemoryBucketStore:
+    """
+    Ведра в памяти процесса (один узел или запасной вариант без Redis)
+    """
+
+    MAX_ITEMS = 100000
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # ключ -> (токены, время обновления)
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        # Ведро, которое успело бы наполниться, ничем не отличается от отсутствующего
+        self._buckets = {key: state for key, state in self._buckets.items() if now - state[1] < 3600}
+
+    def consume(self, buckets: Sequence[Bucket]) -> float:
+        """
+        Списывает по токену из всех ведер сразу или ни из одного.
+        Возвращает 0, если запрос разрешен, иначе сколько секунд ждать
+        """
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) >= self.MAX_ITEMS:
+                self._prune(now)
+            states = []
+            wait = 0.0
+            for key, rate, burst in buckets:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * rate)
+                states.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            for (key, _, _), tokens in zip(buckets, states):
+                self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            return wait
+
+
+# Все ведра проверяются и списываются атомарно; время берется из Redis, чтобы не зависеть
+# от часов узлов (TIME до записи допустим при репликации эффектов, Redis 5+)
+_CONSUME_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local current = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    current = math.min(burst, current + math.max(0, now - updated) * rate)
+    tokens[i] = current
+    if current < 1 then
+        wait = math.max(wait, (1 - current) / rate)
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local left = tokens[i]
+    if wait == 0 then
+        left = left - 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(left), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """
+    Ведра в Redis: общий лимит для всех экземпляров приложения
+    """
+
+    def __init__(self, client):
+        self._consume = client.register_script(_CONSUME_SCRIPT)
+
+    def consume(self, buckets: Sequence[Bucket]) -> float:
+        args = []
+        for _, rate, burst in buckets:
+            args.extend((repr(rate), repr(float(burst))))
+        return float(self._consume(keys=[f"ratelimit:{key}" for key, _, _ in buckets], args=args))
+
+
+class BucketStore:
+    """
+    Redis, если он настроен, иначе память процесса. При ошибках Redis - память процесса
+    """
+
+    def __init__(self):
+        self._memory = MemoryBucketStore()
+        client = get_redis()
+        self._redis = RedisBucketStore(client) if client is not None else None
+
+    @property
+    def shared(self) -> bool:
+        return self._redis is not None
+
+    def consume(self, buckets: Sequence[Bucket]) -> float:
+        if self._redis is not None:
+            try:
+                return self._redis.consume(buckets)
+            except redis_errors() as exc:
+                logger.warning("Redis недоступен, лимиты запросов в памяти процесса: %s", exc)
+        return self._memory.consume(buckets)
+
+
+# ================ Middleware ================
+
+TRUSTED_PROXIES = [ipaddress.ip_network(proxy, strict=False) for proxy in settings.RATE_LIMIT_TRUSTED_PROXIES]
+
+
+def _trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_ip(scope) -> str:
+    """
+    Адрес клиента. X-Forwarded-For учитывается, только если соединение пришло от доверенного прокси:
+    справа налево пропускаются адреса доверенных прокси, первый остальной - клиент
+    (более ранние адреса клиент может подделать)
+    """
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if not _trusted(peer):
+        return peer
+    forwarded = _header(scope, b"x-forwarded-for")
+    if forwarded is None:
+        return peer
+    for address in reversed([address.strip() for address in forwarded.split(",")]):
+        if address and not _trusted(address):
+            return address
+    return peer
+
+
+def _header(scope, header: bytes) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == header:
+            return value.decode("latin-1")
+    return None
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware: 429 с Retry-After, если у пользователя или у его IP закончились токены
+    """
+
+    def __init__(self, app, store: Optional[BucketStore] = None):
+        self.app = app
+        self.store = store or BucketStore()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rule = next((rule for rule in RULES if rule.matches(scope["method"], scope["path"])), None)
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        ip = client_ip(scope)
+        ip_factor = settings.RATE_LIMIT_IP_MULTIPLIER
+        buckets: List[Bucket] = [(f"{rule.name}:ip:{ip}", rule.rate * ip_factor, rule.burst * ip_factor)]
+        user_id = request_user_id(_header(scope, b"authorization"))
+        if user_id is not None:
+            buckets.append((f"{rule.name}:user:{user_id}", rule.rate, rule.burst))
+
+        # В памяти проверка занимает микросекунды и идет прямо в event loop, вызов Redis - в пуле потоков
+        if self.store.shared:
+            wait = await run_in_threadpool(self.store.consume, buckets)
+        else:
+            wait = self.store.consume(buckets)
+        if wait > 0:
+            RATE_LIMITED.inc(rule.name, "user" if user_id is not None else "ip")
+            response = JSONResponse({"detail": "Слишком много запросов, повторите попытку позже"}, status_code=429,
+                                    headers={"Retry-After": str(max(math.ceil(wait), 1))})
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -0,0 +1,52 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+from monitoring.metrics import REGISTRY, Counter
+
+
+# Объединение одинаковых одновременных запросов (single-flight): первый запрос с ключом
+# выполняется, остальные, пришедшие до его завершения, получают тот же результат.
+# Работает в event loop процесса, поэтому блокировки не нужны.
+
+COALESCED = REGISTRY.register(Counter(
+    "single_flight_requests_total", "GET requests by single-flight role", ("route", "role")))
+
+T = TypeVar("T")
+
+# Результат, который нельзя раздать (лидер отменен или ответ потоковый): ожидающие выполняют запрос сами
+RETRY = object()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]],
+                 shareable: Callable[[T], bool] = lambda result: True) -> Tuple[T, bool]:
+        """
+        Возвращает (результат, выполнен ли он этим вызовом). Исключение лидера получают все ожидающие
+        """
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            result = await asyncio.shield(future)
+            if result is not RETRY:
+                return result, False
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.set_result(RETRY)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Исключение уже поднимается у лидера; без ожидающих future не должен писать в лог
+            future.exception()
+            raise
+        else:
+            future.set_result(result if shareable(result) else RETRY)
+            return result, True
+        finally:
+            self._calls.pop(key, None)
@@ -0,0 +1,37 @@
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+
+class RequestStats:
+    """
+    Счетчики одного HTTP-запроса. Объект общий для event loop и потока из пула:
+    contextvars копируются в поток, а сам объект изменяемый.
+    """
+
+    __slots__ = ("sql_count", "sql_time", "fingerprints", "queue_wait", "db_wait", "handler_time",
+                 "handler_sql_time", "serialize_time", "handler_done")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        # Этапы обработки (сек): ожидание потока, ожидание соединения из пула,
+        # работа обработчика (и SQL внутри него), сериализация ответа
+        self.queue_wait = 0.0
+        self.db_wait = 0.0
+        self.handler_time = 0.0
+        self.handler_sql_time = 0.0
+        self.serialize_time = 0.0
+        self.handler_done = 0.0
+        # Счетчик отпечатков запросов, заполняется только в режиме отладки запросов
+        self.fingerprints: Optional[Counter] = None
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """
+    Счетчики текущего запроса или None вне запроса (фоновые задачи)
+    """
+    return request_stats.get()
@@ -0,0 +1,102 @@
+from collections import Counter
+from html import escape
+from typing import Dict, List
+
+
+# Отрисовка flamegraph в SVG из свернутых стеков ("корень;...;лист" -> число сэмплов)
+
+WIDTH = 1200
+ROW_HEIGHT = 16
+FONT_SIZE = 11
+MIN_WIDTH = 0.5
+# Кадры кода приложения (остальное - стандартная библиотека и зависимости)
+APP_PATHS = ("(database/", "(routes/", "(monitoring/", "(config/", "(main.py")
+
+
+class _Node:
+    __slots__ = ("name", "total", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.total = 0
+        self.children: Dict[str, "_Node"] = {}
+
+
+def _build_tree(stacks: Counter) -> _Node:
+    root = _Node("all")
+    for stack, count in stacks.items():
+        root.total += count
+        node = root
+        for frame in stack.split(";"):
+            node = node.children.setdefault(frame, _Node(frame))
+            node.total += count
+    return root
+
+def _depth(node: _Node) -> int:
+    return 1 + max((_depth(child) for child in node.children.values()), default=0)
+
+def _color(name: str) -> str:
+    # Наш код - теплые тона, библиотеки - холодные, чтобы сразу видеть границу
+    value = sum(map(ord, name)) % 60
+    if any(path in name for path in APP_PATHS) or "(" not in name:
+        return f"rgb({220 + value // 2},{100 + value},{40})"
+    return f"rgb({80 + value},{150 + value // 2},200)"
+
+def render_svg(stacks: Counter, title: str = "Flamegraph") -> str:
+    root = _build_tree(stacks)
+    height = (_depth(root) + 2) * ROW_HEIGHT
+    scale = WIDTH / root.total if root.total else 0
+    parts: List[str] = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{height}" '
+        f'font-family="monospace" font-size="{FONT_SIZE}">',
+        f'<text x="4" y="{ROW_HEIGHT - 4}">{escape(title)} ({root.total} samples)</text>',
+    ]
+
+    def draw(node: _Node, x: float, level: int):
+        width = node.total * scale
+        if width < MIN_WIDTH:
+            return
+        y = height - (level + 1) * ROW_HEIGHT
+        percent = node.total * 100 / root.total
+        label = escape(node.name)
+        parts.append(
+            f'<g><title>{label} ({node.total} samples, {percent:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{ROW_HEIGHT - 1}" fill="{_color(node.name)}"/>'
+        )
+        chars = int(width / (FONT_SIZE * 0.6))
+        if chars >= 4:
+            text = node.name if len(node.name) <= chars else node.name[:chars - 2] + ".."
+            parts.append(f'<text x="{x + 2:.1f}" y="{y + ROW_HEIGHT - 4}">{escape(text)}</text>')
+        parts.append("</g>")
+        child_x = x
+        for child in sorted(node.children.values(), key=lambda child: child.name):
+            draw(child, child_x, level + 1)
+            child_x += child.total * scale
+
+    if root.total:
+        draw(root, 0.0, 0)
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+def render_collapsed(stacks: Counter) -> str:
+    """
+    Формат flamegraph.pl / speedscope: "кадр;кадр;кадр число"
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def top_functions(stacks: Counter, limit: int = 30) -> List[dict]:
+    """
+    Функции с наибольшим собственным (лист стека) и полным временем в сэмплах
+    """
+    own, inclusive = Counter(), Counter()
+    total = sum(stacks.values())
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            inclusive[frame] += count
+    return [
+        {"function": frame, "own_samples": count, "own_percent": round(count * 100 / total, 2),
+         "inclusive_percent": round(inclusive[frame] * 100 / total, 2)}
+        for frame, count in own.most_common(limit)
+    ]
@@ -0,0 +1,105 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from .sql import fingerprint
+
+
+# Бюджеты запросов к базе по эндпоинтам: "МЕТОД /шаблон/маршрута" -> максимум SQL-запросов.
+# Проверяются middleware в режиме QUERY_DEBUG и в tests/test_query_budgets.py (check_endpoint_budget).
+QUERY_BUDGETS: Dict[str, int] = {
+    "GET /events/": 1,
+    "GET /events/{event_id}": 1,
+    "GET /feed/": 1,
+    "GET /feed/personal": 3,
+    "GET /venues/": 1,
+    "GET /teams/": 1,
+    "POST /events/{event_id}/like": 7,
+    "PUT /teams/requests/{request_id}": 9,
+    "DELETE /teams/{team_id}/members/{user_id}": 6,
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """
+    Собирает все SQL-запросы движка, выполненные внутри блока (из любых потоков)
+    """
+
+    def __init__(self):
+        self.statements: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.statements.append(statement)
+
+    def report(self) -> str:
+        lines = [f"{self.count} SQL-запросов:"]
+        lines += [f"  {index + 1}. {fingerprint(statement)}" for index, statement in enumerate(self.statements)]
+        return "\n".join(lines)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Считает SQL-запросы внутри блока:
+
+        with count_queries() as counter:
+            client.get("/events/1")
+        assert counter.count == 1
+    """
+    if engine is None:
+        from database.base import engine
+    counter = QueryCounter()
+    event.listen(engine, "after_cursor_execute", counter._on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "after_cursor_execute", counter._on_execute)
+
+@contextmanager
+def assert_max_queries(max_queries: int, engine=None):
+    """
+    Падает с QueryBudgetExceeded, если внутри блока выполнено больше max_queries запросов
+    """
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > max_queries:
+        raise QueryBudgetExceeded(f"Бюджет {max_queries} превышен. {counter.report()}")
+
+def route_key(app, method: str, path: str) -> Optional[str]:
+    """
+    Ключ бюджета ("МЕТОД /шаблон") для реального пути запроса
+    """
+    from starlette.routing import Match
+
+    scope = {"type": "http", "method": method.upper(), "path": path, "root_path": ""}
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{method.upper()} {route.path}"
+    return None
+
+def check_endpoint_budget(client, method: str, url: str, max_queries: Optional[int] = None, **kwargs):
+    """
+    Выполняет запрос тестовым клиентом и проверяет бюджет запросов эндпоинта.
+    Если max_queries не передан, берется значение из QUERY_BUDGETS.
+
+        response = check_endpoint_budget(client, "PUT", "/teams/requests/1", params={"status": "accepted"})
+    """
+    if max_queries is None:
+        key = route_key(client.app, method, url.split("?", 1)[0])
+        if key not in QUERY_BUDGETS:
+            raise KeyError(f"Для {key or url} не задан бюджет запросов")
+        max_queries = QUERY_BUDGETS[key]
+    with assert_max_queries(max_queries):
+        response = client.request(method, url, **kwargs)
+    return response
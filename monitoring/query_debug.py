@@ -0,0 +1,80 @@
+import logging
+from collections import Counter
+from sqlalchemy import event
+from sqlalchemy.orm import raiseload
+from config import settings
+from .context import RequestStats, request_stats
+from .metrics import route_label
+from .query_budget import QUERY_BUDGETS
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryDebugMiddleware:
+    """
+    Режим отладки запросов: число SQL-запросов в заголовке ответа,
+    предупреждения о N+1 и о превышении бюджета эндпоинта
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = request_stats.get()
+        token = None
+        if stats is None:
+            stats = RequestStats()
+            token = request_stats.set(stats)
+        stats.fingerprints = Counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers += self._inspect(scope, stats)
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if token is not None:
+                request_stats.reset(token)
+
+    @staticmethod
+    def _inspect(scope, stats: RequestStats):
+        key = f"{scope['method']} {route_label(scope)}"
+        headers = [(b"x-query-count", str(stats.sql_count).encode())]
+
+        repeated = {
+            statement: count for statement, count in stats.fingerprints.items()
+            if count >= settings.N_PLUS_ONE_THRESHOLD
+        }
+        if repeated:
+            headers.append((b"x-n-plus-one", str(max(repeated.values())).encode()))
+            for statement, count in repeated.items():
+                logger.warning("Возможный N+1 в %s: %s раз %s", key, count, statement)
+
+        budget = QUERY_BUDGETS.get(key)
+        if budget is not None and stats.sql_count > budget:
+            headers.append((b"x-query-budget-exceeded", f"{stats.sql_count}/{budget}".encode()))
+            logger.error("Бюджет запросов %s превышен: %s из %s", key, stats.sql_count, budget)
+        return headers
+
+
+def _raise_on_lazy_load(orm_execute_state):
+    if (orm_execute_state.is_select and not orm_execute_state.is_column_load
+            and not orm_execute_state.is_relationship_load):
+        orm_execute_state.statement = orm_execute_state.statement.options(raiseload("*"))
+
+def enable_raiseload(session_factory):
+    """
+    Запрещает ленивую загрузку связей для всех сессий фабрики:
+    скрытый N+1 превращается в ошибку вместо лишних запросов
+    """
+    if not event.contains(session_factory, "do_orm_execute", _raise_on_lazy_load):
+        event.listen(session_factory, "do_orm_execute", _raise_on_lazy_load)
@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import time
+from fastapi.dependencies.utils import get_flat_dependant
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+from config import settings
+from database.base import ReplicaSessions, reads_from_primary
+from middleware.single_flight import COALESCED, SingleFlight
+from .context import current_stats
+from .sampling import enter_handler_thread, exit_handler_thread, request_route
+from .tracing import tracer
+
+
+def instrument_endpoint(endpoint):
+    """
+    Синхронный обработчик запускается в пуле потоков явно, чтобы отделить
+    ожидание свободного потока от работы самого обработчика
+    """
+    if asyncio.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        queued = time.perf_counter()
+        queued_ns = time.time_ns()
+
+        def run():
+            stats = current_stats()
+            started = time.perf_counter()
+            if stats is not None:
+                stats.queue_wait += started - queued
+                sql_before = stats.sql_time
+            enter_handler_thread()
+            try:
+                if not tracer.enabled:
+                    return endpoint(*args, **kwargs)
+                wait = tracer.start_span("threadpool.wait", start_ns=queued_ns)
+                tracer.end_span(wait)
+                with tracer.span(f"handler {endpoint.__name__}"):
+                    return endpoint(*args, **kwargs)
+            finally:
+                exit_handler_thread()
+                if stats is not None:
+                    stats.handler_done = time.perf_counter()
+                    stats.handler_time += stats.handler_done - started
+                    stats.handler_sql_time += stats.sql_time - sql_before
+
+        return await run_in_threadpool(run)
+
+    return wrapper
+
+
+_single_flight = SingleFlight()
+
+
+def coalesced(endpoint):
+    """
+    Разрешает объединять одинаковые одновременные GET-запросы маршрута (single-flight).
+    Только для публичных маршрутов: ответ должен зависеть лишь от пути, параметров запроса
+    и объявленных заголовков, маршруты с авторизацией не допускаются
+    """
+    endpoint.single_flight = True
+    return endpoint
+
+
+def _is_shareable(response) -> bool:
+    return isinstance(response, Response) and not isinstance(response, StreamingResponse)
+
+def _copy_response(response: Response) -> Response:
+    copy = Response(status_code=response.status_code)
+    copy.body = response.body
+    copy.raw_headers = list(response.raw_headers)
+    return copy
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    Маршрут с замером этапов обработки (route_class для APIRouter).
+    Одинаковые одновременные GET-запросы маршрутов с @coalesced выполняются один раз: остальные
+    получают копию готового ответа (один SQL-запрос и одна сериализация на всю волну)
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        self.single_flight = getattr(endpoint, "single_flight", False)
+        super().__init__(path, instrument_endpoint(endpoint), **kwargs)
+
+    def _flight_params(self):
+        # Зависимости выполняются только у лидера: ответ не должен зависеть от того, кто спрашивает
+        flat = get_flat_dependant(self.dependant)
+        if flat.security_requirements:
+            raise ValueError(f"Маршрут с авторизацией не может объединять запросы: {self.path}")
+        # Объявленные заголовки и cookies входят в ключ: запросы с разными значениями не объединяются
+        return (tuple(sorted({field.alias for field in flat.header_params})),
+                tuple(sorted({field.alias for field in flat.cookie_params})))
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        label = f"{','.join(sorted(self.methods))} {self.path}"
+        flight_headers, flight_cookies = self._flight_params() if self.single_flight else ((), ())
+        coalesce = settings.SINGLE_FLIGHT_ENABLED and self.single_flight and self.methods == {"GET"}
+
+        async def flight_key(request):
+            # Пользователь, недавно писавший в базу, читает из основной базы: его волна отдельная
+            primary = False
+            authorization = request.headers.get("authorization")
+            if authorization and ReplicaSessions:
+                primary = await run_in_threadpool(reads_from_primary, authorization)
+            headers = tuple(request.headers.get(name) for name in flight_headers)
+            cookies = tuple(request.cookies.get(name) for name in flight_cookies)
+            return label, request.url.path, tuple(sorted(request.query_params.multi_items())), headers, cookies, primary
+
+        async def run(request):
+            if not coalesce or "stream" in request.query_params:
+                return await handler(request)
+            response, leader = await _single_flight.do(await flight_key(request), lambda: handler(request),
+                                                       _is_shareable)
+            COALESCED.inc(self.path, "leader" if leader else "follower")
+            return response if leader else _copy_response(response)
+
+        async def timed_handler(request):
+            # Шаблон маршрута для профилировщика; контекст копируется в поток обработчика
+            token = request_route.set(label)
+            try:
+                response = await run(request)
+            finally:
+                request_route.reset(token)
+            # После обработчика FastAPI сериализует результат и формирует тело ответа
+            stats = current_stats()
+            if stats is not None and stats.handler_done:
+                stats.serialize_time += time.perf_counter() - stats.handler_done
+            return response
+
+        return timed_handler
@@ -0,0 +1,302 @@
+import itertools
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Tuple
+from config import settings
+from config.create_token_check import is_internal_token
+from .metrics import route_label
+
+
+# Сэмплирующий профилировщик: отдельный поток периодически снимает стеки рабочих потоков
+# через sys._current_frames(). Код приложения не инструментируется, накладные расходы
+# определяются только частотой сэмплирования.
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_LIBRARY_ROOTS = sorted({path + os.sep for path in (sysconfig.get_paths()["purelib"], sysconfig.get_paths()["stdlib"])},
+                        key=len, reverse=True)
+# Верхний кадр простаивающего event loop
+_IDLE_FILES = ("selectors.py",)
+MAX_STACK_DEPTH = 128
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_REPO_ROOT):
+        return filename[len(_REPO_ROOT):]
+    for root in _LIBRARY_ROOTS:
+        if filename.startswith(root):
+            return filename[len(root):]
+    return os.path.basename(filename)
+
+_frame_names: Dict[object, str] = {}
+
+def _frame_name(code) -> str:
+    name = _frame_names.get(code)
+    if name is None:
+        name = _frame_names[code] = f"{code.co_name} ({_short_path(code.co_filename)})"
+    return name
+
+def collapse(frame) -> Optional[str]:
+    """
+    Стек потока в свернутом виде "корень;...;лист"
+    """
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+def _is_idle(frame) -> bool:
+    return frame.f_code.co_filename.endswith(_IDLE_FILES)
+
+
+# ================ Учет потоков, обрабатывающих запросы ================
+
+class RequestProfile:
+    """
+    Профиль одного запроса: стеки его рабочих потоков и потока event loop
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str, loop_thread: int):
+        self.id = f"{int(time.time())}-{next(self._ids)}"
+        self.method = method
+        self.path = path
+        self.route = path
+        self.loop_thread = loop_thread
+        self.threads = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+        self.duration = 0.0
+
+    def summary(self) -> dict:
+        return {"id": self.id, "method": self.method, "route": self.route, "path": self.path,
+                "started_at": self.started_at, "duration_ms": round(self.duration * 1000, 1),
+                "samples": self.samples}
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+request_route: ContextVar[Optional[str]] = ContextVar("request_route", default=None)
+
+# id потока -> шаблон маршрута, который он сейчас обрабатывает
+_active_threads: Dict[int, str] = {}
+
+
+def enter_handler_thread():
+    """
+    Вызывается в потоке пула перед обработчиком: поток попадает в выборку профилировщиков
+    """
+    ident = threading.get_ident()
+    _active_threads[ident] = request_route.get() or "<unknown>"
+    profile = current_profile.get()
+    if profile is not None:
+        profile.threads.add(ident)
+
+def exit_handler_thread():
+    ident = threading.get_ident()
+    _active_threads.pop(ident, None)
+    profile = current_profile.get()
+    if profile is not None:
+        profile.threads.discard(ident)
+
+
+# ================ Сэмплер ================
+
+class _SamplerThread(threading.Thread):
+    def __init__(self, interval: float, name: str):
+        super().__init__(name=name, daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample(sys._current_frames())
+
+    def sample(self, frames: Dict[int, object]):
+        raise NotImplementedError
+
+
+class RequestSampler(_SamplerThread):
+    """
+    Сэмплирует потоки одного запроса, пока он выполняется
+    """
+
+    def __init__(self, profile: RequestProfile, interval: float):
+        super().__init__(interval, f"profile-{profile.id}")
+        self.profile = profile
+
+    def sample(self, frames):
+        profile = self.profile
+        profile.samples += 1
+        for ident in list(profile.threads):
+            frame = frames.get(ident)
+            if frame is not None:
+                profile.stacks[collapse(frame)] += 1
+        # Event loop общий для всех запросов: при параллельной нагрузке в профиль попадет и чужая работа
+        frame = frames.get(profile.loop_thread)
+        if frame is not None and not _is_idle(frame):
+            profile.stacks["event-loop;" + collapse(frame)] += 1
+
+
+class BackgroundSampler(_SamplerThread):
+    """
+    Постоянное сэмплирование всех занятых потоков с агрегацией по окнам времени.
+    Стеки предваряются шаблоном маршрута, чтобы горячие места было видно по эндпоинтам
+    """
+
+    BUCKET_SECONDS = 10
+
+    def __init__(self, interval: float, window_seconds: float):
+        super().__init__(interval, "profile-background")
+        self.loop_thread: Optional[int] = None
+        self._buckets: deque = deque(maxlen=max(int(window_seconds // self.BUCKET_SECONDS), 1))
+        self._lock = threading.Lock()
+
+    def _bucket(self) -> Counter:
+        start = int(time.time()) // self.BUCKET_SECONDS * self.BUCKET_SECONDS
+        if not self._buckets or self._buckets[-1][0] != start:
+            self._buckets.append((start, Counter()))
+        return self._buckets[-1][1]
+
+    def sample(self, frames):
+        collected = []
+        for ident, route in list(_active_threads.items()):
+            frame = frames.get(ident)
+            if frame is not None:
+                collected.append(f"{route};{collapse(frame)}")
+        if self.loop_thread is not None:
+            frame = frames.get(self.loop_thread)
+            if frame is not None and not _is_idle(frame):
+                collected.append("event-loop;" + collapse(frame))
+        if collected:
+            with self._lock:
+                bucket = self._bucket()
+                for stack in collected:
+                    bucket[stack] += 1
+
+    def hotspots(self, seconds: float) -> Tuple[Counter, float]:
+        """
+        Сумма стеков за последние seconds секунд и фактическое начало окна
+        """
+        since = time.time() - seconds
+        merged = Counter()
+        first = time.time()
+        with self._lock:
+            for start, stacks in self._buckets:
+                if start + self.BUCKET_SECONDS >= since:
+                    merged.update(stacks)
+                    first = min(first, start)
+        return merged, first
+
+
+background_sampler: Optional[BackgroundSampler] = None
+
+
+def start_background_sampler():
+    """
+    Запускает фоновое сэмплирование (вызывается из lifespan в потоке event loop)
+    """
+    global background_sampler
+    if background_sampler is None:
+        background_sampler = BackgroundSampler(settings.PROFILER_BACKGROUND_INTERVAL_MS / 1000,
+                                               settings.PROFILER_BACKGROUND_WINDOW_SECONDS)
+        background_sampler.loop_thread = threading.get_ident()
+        background_sampler.start()
+    return background_sampler
+
+def stop_background_sampler():
+    global background_sampler
+    if background_sampler is not None:
+        background_sampler.stop()
+        background_sampler = None
+
+
+# ================ Профили отдельных запросов ================
+
+class ProfileStore:
+    """
+    Последние профили запросов в памяти процесса
+    """
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._items[profile.id] = profile
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return self._items.get(profile_id)
+
+    def list(self) -> Iterable[RequestProfile]:
+        with self._lock:
+            return list(reversed(self._items.values()))
+
+
+profiles = ProfileStore(settings.PROFILER_MAX_STORED)
+
+
+def _profiling_requested(scope) -> bool:
+    token = flag = None
+    for name, value in scope["headers"]:
+        if name == b"x-internal-token":
+            token = value.decode("latin-1")
+        elif name == b"x-profile":
+            flag = value.decode("latin-1")
+    if flag is None and b"_profile=1" in scope.get("query_string", b""):
+        flag = "1"
+    return flag not in (None, "", "0") and is_internal_token(token)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование одного запроса по заголовку X-Profile: 1 или параметру _profile=1
+    (только с X-Internal-Token). В ответе - X-Profile-Id, сам профиль - в /admin/profiles/{id}
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], threading.get_ident())
+        token = current_profile.set(profile)
+        sampler = RequestSampler(profile, settings.PROFILER_REQUEST_INTERVAL_MS / 1000)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode()),
+                    (b"x-profile-url", f"/admin/profiles/{profile.id}?format=svg".encode()),
+                ]
+            await send(message)
+
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            current_profile.reset(token)
+            profile.duration = time.perf_counter() - started
+            profile.route = route_label(scope)
+            profiles.add(profile)
@@ -0,0 +1,55 @@
+import time
+from .context import RequestStats, request_stats
+
+
+def _metric(name: str, seconds: float, description: str = "") -> str:
+    value = f"{name};dur={seconds * 1000:.1f}"
+    return f'{value};desc="{description}"' if description else value
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    """
+    Значение заголовка Server-Timing по этапам обработки запроса
+    """
+    app_time = max(stats.handler_time - stats.handler_sql_time, 0.0)
+    return ", ".join((
+        _metric("queue", stats.queue_wait, "threadpool wait"),
+        _metric("db-wait", stats.db_wait, "pool checkout"),
+        _metric("sql", stats.sql_time, f"{stats.sql_count} queries"),
+        _metric("app", app_time, "crud and business logic"),
+        _metric("serialize", stats.serialize_time, "JSON serialization"),
+        _metric("total", total),
+    ))
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware: заголовок Server-Timing с разбивкой времени ответа
+    (видна во вкладке Network инструментов разработчика браузера)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = request_stats.get()
+        token = None
+        if stats is None:
+            stats = RequestStats()
+            token = request_stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                header = server_timing(stats, time.perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if token is not None:
+                request_stats.reset(token)
@@ -0,0 +1,196 @@
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List
+from sqlalchemy import event
+from config import settings
+from .context import current_stats
+
+
+logger = logging.getLogger(__name__)
+
+
+# ================ Отпечатки запросов ================
+
+_IN_LIST = re.compile(r"\(\s*(?:%\(\w+\)s|\?|\$\d+)(?:\s*,\s*(?:%\(\w+\)s|\?|\$\d+))*\s*\)")
+_PARAM = re.compile(r"%\(\w+\)s|\$\d+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """
+    Нормализует SQL: параметры и литералы заменяются на ?, списки IN сворачиваются
+    """
+    normalized = _STRING.sub("?", statement)
+    normalized = _IN_LIST.sub("(?)", normalized)
+    normalized = _PARAM.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    return _SPACES.sub(" ", normalized).strip()
+
+def calling_crud_function(max_depth: int = 40) -> str:
+    """
+    Имя функции database.crud, из которой выполняется запрос
+    """
+    frame = sys._getframe(2)
+    depth = 0
+    while frame is not None and depth < max_depth:
+        if frame.f_globals.get("__name__") == "database.crud":
+            return frame.f_code.co_name
+        frame = frame.f_back
+        depth += 1
+    return "<other>"
+
+
+# ================ Статистика запросов ================
+
+class StatementStats:
+    __slots__ = ("fingerprint", "calls", "total_time", "max_time", "rows", "callers")
+
+    def __init__(self, statement_fingerprint: str):
+        self.fingerprint = statement_fingerprint
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.callers = Counter()
+
+    def as_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "calls": self.calls,
+            "total_time_ms": round(self.total_time * 1000, 3),
+            "mean_time_ms": round(self.total_time * 1000 / self.calls, 3) if self.calls else 0,
+            "max_time_ms": round(self.max_time * 1000, 3),
+            "rows": self.rows,
+            "callers": dict(self.callers.most_common(5)),
+        }
+
+
+class SqlProfiler:
+    """
+    Накопительная статистика SQL с момента запуска процесса
+    """
+
+    def __init__(self, max_statements: int):
+        self.max_statements = max_statements
+        self.started_at = time.time()
+        self._stats: Dict[str, StatementStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement_fingerprint: str, elapsed: float, rows: int, caller: str):
+        with self._lock:
+            stats = self._stats.get(statement_fingerprint)
+            if stats is None:
+                if len(self._stats) >= self.max_statements:
+                    statement_fingerprint = "<overflow>"
+                    stats = self._stats.get(statement_fingerprint)
+                if stats is None:
+                    stats = self._stats[statement_fingerprint] = StatementStats(statement_fingerprint)
+            stats.calls += 1
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+            stats.rows += max(rows, 0)
+            stats.callers[caller] += 1
+
+    def top(self, limit: int = 20, order_by: str = "total_time") -> List[dict]:
+        with self._lock:
+            items = [stats.as_dict() for stats in self._stats.values()]
+        key = f"{order_by}_ms" if order_by in ("total_time", "mean_time", "max_time") else order_by
+        return sorted(items, key=lambda item: item[key], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started_at = time.time()
+
+
+profiler = SqlProfiler(settings.SQL_PROFILER_MAX_STATEMENTS)
+
+
+# ================ Журнал медленных запросов ================
+
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-explain")
+# Отпечаток -> время последнего плана; не больше SQL_PROFILER_MAX_STATEMENTS записей
+_last_explain: Dict[str, float] = {}
+_explain_lock = threading.Lock()
+
+
+def _explain(engine, statement: str, parameters, statement_fingerprint: str):
+    try:
+        with engine.connect().execution_options(sql_profiler_skip=True) as conn:
+            plan = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters).fetchall()
+            conn.rollback()
+        logger.warning("План медленного запроса [%s]:\n%s", statement_fingerprint, "\n".join(row[0] for row in plan))
+    except Exception:
+        logger.exception("Не удалось получить план запроса [%s]", statement_fingerprint)
+
+def _maybe_explain(conn, statement: str, parameters, statement_fingerprint: str):
+    if conn.dialect.name != "postgresql" or not statement.lstrip().upper().startswith("SELECT"):
+        return
+    now = time.monotonic()
+    horizon = now - settings.SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS
+    with _explain_lock:
+        # Один план на отпечаток за интервал: EXPLAIN ANALYZE выполняет запрос повторно
+        if _last_explain.get(statement_fingerprint, horizon) > horizon:
+            return
+        if len(_last_explain) >= settings.SQL_PROFILER_MAX_STATEMENTS:
+            for expired in [key for key, explained_at in _last_explain.items() if explained_at <= horizon]:
+                del _last_explain[expired]
+            # Все отпечатки получили план за интервал: новых планов до его окончания не будет
+            if len(_last_explain) >= settings.SQL_PROFILER_MAX_STATEMENTS:
+                return
+        _last_explain[statement_fingerprint] = now
+    _explain_executor.submit(_explain, conn.engine, statement, parameters, statement_fingerprint)
+
+
+# ================ Обработчики событий движка ================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Курсор соединения выполняет один запрос за раз: достаточно одного значения
+    conn.info["query_start"] = time.perf_counter()
+
+def _handle_error(exception_context):
+    # Запрос завершился ошибкой: after_cursor_execute не будет, время начала не должно остаться
+    if exception_context.connection is not None:
+        exception_context.connection.info.pop("query_start", None)
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_start", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = current_stats()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_time += elapsed
+        if stats.fingerprints is not None:
+            stats.fingerprints[fingerprint(statement)] += 1
+
+    if not settings.SQL_PROFILER_ENABLED or conn.get_execution_options().get("sql_profiler_skip"):
+        return
+
+    statement_fingerprint = fingerprint(statement)
+    caller = calling_crud_function()
+    profiler.record(statement_fingerprint, elapsed, cursor.rowcount, caller)
+
+    if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning("Медленный запрос %.1f мс в %s: %s", elapsed * 1000, caller, statement_fingerprint)
+        if settings.SLOW_QUERY_EXPLAIN and not executemany:
+            _maybe_explain(conn, statement, parameters, statement_fingerprint)
+
+def instrument_engine(engine):
+    """
+    Подключает обработчики событий курсора к движку (повторный вызов безопасен)
+    """
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,391 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from config import settings
+from .metrics import route_label
+from .sql import fingerprint
+
+
+# Легковесная трассировка без внешних зависимостей. Спаны совместимы с OpenTelemetry:
+# W3C traceparent на входе и экспорт в OTLP/HTTP (JSON), в консоль или файл.
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "sampled")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 kind: str = "internal", start_ns: Optional[int] = None, span_id: Optional[str] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id or os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, object] = {}
+        self.status = "unset"
+        self.sampled = sampled
+
+    def set_attribute(self, key: str, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.status = "error"
+        self.set_attribute("exception.type", type(exc).__name__)
+        self.set_attribute("exception.message", str(exc)[:500])
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+# ================ Экспорт ================
+
+class ConsoleExporter:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def export(self, spans: List[Span]):
+        self.stream.write("".join(json.dumps(span.as_dict(), ensure_ascii=False) + "\n" for span in spans))
+        self.stream.flush()
+
+    def shutdown(self):
+        pass
+
+
+class FileExporter(ConsoleExporter):
+    def __init__(self, path: str):
+        super().__init__(open(path, "a", encoding="utf-8"))
+
+    def shutdown(self):
+        self.stream.close()
+
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+_OTLP_STATUS = {"unset": 0, "ok": 1, "error": 2}
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpHttpExporter:
+    """
+    Отправка спанов в коллектор OpenTelemetry по OTLP/HTTP в кодировке JSON
+    """
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 2.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.resource = {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]}
+
+    def _encode(self, span: Span) -> dict:
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": _OTLP_KINDS.get(span.kind, 1),
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": _OTLP_STATUS[span.status]},
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+    def export(self, spans: List[Span]):
+        body = {"resourceSpans": [{
+            "resource": self.resource,
+            "scopeSpans": [{"scope": {"name": "sports-aggregator"}, "spans": [self._encode(span) for span in spans]}],
+        }]}
+        request = urllib.request.Request(self.endpoint, data=json.dumps(body).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def shutdown(self):
+        pass
+
+
+class BatchProcessor:
+    """
+    Копит завершенные спаны и отдает их экспортеру из фонового потока,
+    чтобы запись и сеть не попадали во время ответа
+    """
+
+    def __init__(self, exporter, max_queue: int = 20000, batch_size: int = 512, interval: float = 2.0):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def on_end(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stopping = True
+                    break
+                batch.append(span)
+            if batch:
+                try:
+                    self.exporter.export(batch)
+                except Exception as exc:
+                    logger.warning("Не удалось экспортировать %s спанов: %s", len(batch), exc)
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self.exporter.shutdown()
+
+
+# ================ Трассировщик ================
+
+class Tracer:
+    def __init__(self, processor: Optional[BatchProcessor] = None, sample_ratio: float = 1.0):
+        self.processor = processor
+        self.sample_ratio = sample_ratio
+
+    @property
+    def enabled(self) -> bool:
+        return self.processor is not None
+
+    def start_span(self, name: str, kind: str = "internal", parent: Optional[Span] = None,
+                   start_ns: Optional[int] = None) -> Span:
+        parent = parent or _current_span.get()
+        if parent is None:
+            # Решение о сэмплировании принимается на корневом спане и наследуется всей трассой
+            return Span(name, os.urandom(16).hex(), None, random.random() < self.sample_ratio, kind, start_ns)
+        return Span(name, parent.trace_id, parent.span_id, parent.sampled, kind, start_ns)
+
+    def end_span(self, span: Span, end_ns: Optional[int] = None):
+        span.end_ns = end_ns or time.time_ns()
+        if span.sampled:
+            self.processor.on_end(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", parent: Optional[Span] = None, **attributes):
+        if not self.enabled:
+            yield None
+            return
+        span = self.start_span(name, kind, parent)
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def shutdown(self):
+        if self.processor is not None:
+            self.processor.shutdown()
+            self.processor = None
+
+
+def _make_exporter():
+    if settings.TRACING_EXPORTER == "otlp":
+        return OtlpHttpExporter(settings.TRACING_OTLP_ENDPOINT, settings.TRACING_SERVICE_NAME)
+    if settings.TRACING_EXPORTER == "file":
+        return FileExporter(settings.TRACING_FILE)
+    return ConsoleExporter()
+
+
+tracer = Tracer()
+
+
+def setup_tracing() -> Tracer:
+    """
+    Запускает экспорт спанов согласно настройкам (повторный вызов безопасен)
+    """
+    if not tracer.enabled:
+        tracer.processor = BatchProcessor(_make_exporter())
+        tracer.sample_ratio = settings.TRACING_SAMPLE_RATIO
+    return tracer
+
+
+# ================ HTTP ================
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def parse_traceparent(value: str) -> Optional[Span]:
+    """
+    Родительский спан из заголовка W3C traceparent вызывающего сервиса
+    """
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None or match.group(1) == "0" * 32:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return Span("remote", trace_id, None, bool(int(flags, 16) & 1), span_id=span_id)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware: корневой спан на каждый HTTP-запрос с шаблоном маршрута в имени
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+
+        method = scope["method"]
+        with tracer.span(method, kind="server", parent=parent) as span:
+            span.set_attribute("http.method", method)
+            span.set_attribute("http.target", scope["path"])
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    span.set_attribute("http.status_code", status)
+                    if status >= 500:
+                        span.status = "error"
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"traceresponse", span.traceparent().encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = route_label(scope)
+                span.name = f"{method} {route}"
+                span.set_attribute("http.route", route)
+
+
+# ================ Функции crud и SQL ================
+
+def traced(name: str):
+    """
+    Декоратор: вызов функции оборачивается в спан
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrument_module(module, prefix: Optional[str] = None):
+    """
+    Оборачивает в спаны все публичные функции модуля (например, database.crud).
+    Вызовы идут через атрибуты модуля, поэтому спаны видны и во внутренних вызовах
+    """
+    prefix = prefix or module.__name__.rsplit(".", 1)[-1]
+    for name, func in list(vars(module).items()):
+        if (name.startswith("_") or not inspect.isfunction(func) or func.__module__ != module.__name__
+                or getattr(func, "__wrapped__", None) is not None):
+            continue
+        setattr(module, name, traced(f"{prefix}.{name}")(func))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not tracer.enabled or _current_span.get() is None:
+        # Запросы вне трассы (фоновые задачи без корневого спана) не порождают отдельных трасс
+        conn.info.setdefault("trace_spans", []).append(None)
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    span = tracer.start_span(f"SQL {operation}", kind="client")
+    span.set_attribute("db.system", conn.dialect.name)
+    span.set_attribute("db.statement", fingerprint(statement)[:2000])
+    if executemany:
+        span.set_attribute("db.executemany", True)
+    conn.info.setdefault("trace_spans", []).append(span)
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = conn.info["trace_spans"].pop()
+    if span is not None:
+        span.set_attribute("db.rows", cursor.rowcount)
+        tracer.end_span(span)
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    spans = conn.info.get("trace_spans") if conn is not None else None
+    if spans:
+        span = spans.pop()
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            tracer.end_span(span)
+
+def instrument_engine_tracing(engine):
+    """
+    Спан на каждый SQL-запрос движка (повторный вызов безопасен)
+    """
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,122 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response
+from config.create_token_check import require_internal_token
+from database import affinity, crud
+from database.base import ROUTE_CLASS_TIMEOUTS, SessionLocal
+from database.circuit_breaker import breakers
+from monitoring import sampling
+from monitoring.flamegraph import render_collapsed, render_svg, top_functions
+from monitoring.sql import profiler
+
+
+# Служебные маршруты (требуют заголовок X-Internal-Token)
+admin_router = APIRouter(dependencies=[Depends(require_internal_token)])
+
+@admin_router.get("/sql/top")
+def read_top_statements(limit: int = Query(20, ge=1, le=500), 
+                        order_by: str = Query("total_time", pattern="^(total_time|calls|mean_time|max_time|rows)$")):
+    """
+    Возвращает самые тяжелые SQL-запросы с момента запуска процесса.
+
+    - **limit**: Количество запросов (по умолчанию 20).
+    - **order_by**: Поле сортировки: total_time, calls, mean_time, max_time или rows (по умолчанию total_time).
+    - Возвращает отпечатки запросов с числом вызовов, суммарным, средним и максимальным временем,
+      числом строк и функциями crud, из которых они вызывались.
+    """
+    return {"since": profiler.started_at, "statements": profiler.top(limit=limit, order_by=order_by)}
+
+@admin_router.post("/sql/reset")
+def reset_statements():
+    """
+    Сбрасывает накопленную статистику SQL-запросов.
+
+    - Возвращает True после сброса.
+    """
+    profiler.reset()
+    return {"success": True}
+
+@admin_router.get("/db/breakers")
+def read_breakers():
+    """
+    Возвращает состояние автоматов защиты базы по маршрутам.
+
+    - Возвращает маршруты, по которым были обращения к базе, и состояние: closed, open или half_open.
+    """
+    return {"breakers": breakers.states()}
+
+@admin_router.post("/trending/rebuild")
+def rebuild_trending():
+    """
+    Пересчитывает рейтинги трендов ленты и мероприятий с нуля (после первого запуска или смены весов).
+
+    - Возвращает число элементов с рейтингом по видам: feed и event.
+    """
+    # Пересчет читает все лайки: таймаут как у выгрузок, а не как у обычной записи
+    db = SessionLocal()
+    db.info["timeouts"] = ROUTE_CLASS_TIMEOUTS["export"]
+    try:
+        return {"scores": crud.rebuild_trending_scores(db)}
+    finally:
+        db.close()
+
+@admin_router.post("/affinity/rebuild")
+def rebuild_affinity():
+    """
+    Пересчитывает интерес пользователей к категориям для персональной ленты с нуля (после первого запуска или смены весов).
+
+    - Возвращает число пар пользователь-категория.
+    """
+    db = SessionLocal()
+    db.info["timeouts"] = ROUTE_CLASS_TIMEOUTS["export"]
+    try:
+        return {"affinities": affinity.rebuild_category_affinities(db)}
+    finally:
+        db.close()
+
+def _render_stacks(stacks, output_format: str, title: str, limit: int):
+    if output_format == "svg":
+        return Response(render_svg(stacks, title), media_type="image/svg+xml")
+    if output_format == "collapsed":
+        return PlainTextResponse(render_collapsed(stacks))
+    return {"title": title, "samples": sum(stacks.values()), "functions": top_functions(stacks, limit)}
+
+@admin_router.get("/profiles")
+def read_profiles():
+    """
+    Возвращает последние профили отдельных запросов (заголовок X-Profile: 1 или параметр _profile=1).
+
+    - Возвращает список профилей: id, маршрут, длительность и число сэмплов.
+    """
+    return [profile.summary() for profile in sampling.profiles.list()]
+
+@admin_router.get("/profiles/{profile_id}")
+def read_profile(profile_id: str, output_format: str = Query("svg", alias="format", pattern="^(svg|collapsed|json)$"),
+                 limit: int = Query(30, ge=1, le=500)):
+    """
+    Возвращает профиль запроса.
+
+    - **profile_id**: Значение заголовка X-Profile-Id из ответа профилированного запроса.
+    - **format**: svg (flamegraph), collapsed (для flamegraph.pl и speedscope) или json (самые горячие функции).
+    - **limit**: Количество функций для формата json (по умолчанию 30).
+    """
+    profile = sampling.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    title = f"{profile.method} {profile.route} {profile.duration * 1000:.1f} ms"
+    return _render_stacks(profile.stacks, output_format, title, limit)
+
+@admin_router.get("/profiler/hotspots")
+def read_hotspots(seconds: int = Query(300, ge=10, le=86400),
+                  output_format: str = Query("svg", alias="format", pattern="^(svg|collapsed|json)$"),
+                  limit: int = Query(30, ge=1, le=500)):
+    """
+    Возвращает горячие места по всем маршрутам из фонового сэмплирования (PROFILER_BACKGROUND_ENABLED).
+
+    - **seconds**: Глубина окна в секундах (по умолчанию 300).
+    - **format**: svg, collapsed или json.
+    - **limit**: Количество функций для формата json (по умолчанию 30).
+    """
+    if sampling.background_sampler is None:
+        raise HTTPException(status_code=409, detail="Фоновое сэмплирование выключено")
+    stacks, _ = sampling.background_sampler.hotspots(seconds)
+    return _render_stacks(stacks, output_format, f"Все маршруты за {seconds} с", limit)
@@ -1,34 +1,101 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from database import crud
-from database.base import get_db
+from database.base import get_db, get_read_db
+from database.streaming import stream_query, MEDIA_TYPES
+from config import settings
+from config.jwt_token import current_user_id, require_owner
+from monitoring.routing import InstrumentedRoute
 
 
 # Маршруты для бронирований
-booking_router = APIRouter()
+booking_router = APIRouter(route_class=InstrumentedRoute)
 
 @booking_router.post("/")
-def create_booking(user_id: int, venue_id: int, time_slot_id: int, db: Session = Depends(get_db)):
+def create_booking(venue_id: int, time_slot_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Создает бронирование спортивной площадки.
     
     Параметры:
-    - user_id (int): Идентификатор пользователя.
+    - user_id (int): Пользователь из токена авторизации.
     - venue_id (int): Идентификатор спортивной площадки.
     - time_slot_id (int): Идентификатор временного слота.
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Созданное бронирование.
-    - Если бронирование не удалось (временной слот занят), возвращает None.
+    - Если бронирование не удалось (временной слот занят или удерживается другим пользователем), возвращает None.
     """
     booking = crud.create_booking(db, user_id=user_id, venue_id=venue_id, time_slot_id=time_slot_id)
     return booking
 
+@booking_router.post("/batch")
+def create_booking_with_services(venue_id: int, time_slot_ids: List[int] = Query(...), 
+                                 service_ids: List[int] = Query([]), user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
+    """
+    Создает бронирование нескольких временных слотов с услугами за один запрос.
+    
+    Параметры:
+    - user_id (int): Пользователь из токена авторизации.
+    - venue_id (int): Идентификатор спортивной площадки.
+    - time_slot_ids (List[int]): Идентификаторы временных слотов.
+    - service_ids (List[int]): Идентификаторы услуг площадки (опционально).
+    - db (Session): Сессия базы данных.
+    
+    Возвращает:
+    - Созданное бронирование с итоговой стоимостью, списком слотов и услуг.
+    - Если хотя бы один слот занят или услуга недоступна, возвращает ошибку 409 Conflict.
+    """
+    booking = crud.create_booking_with_services(db, user_id=user_id, venue_id=venue_id, 
+                                                time_slot_ids=time_slot_ids, service_ids=service_ids)
+    if booking is None:
+        raise HTTPException(status_code=409, detail="Временные слоты заняты или услуги недоступны")
+    booking_dict = {
+        column.name: getattr(booking, column.name)
+        for column in booking.__table__.columns
+    }
+    booking_dict["time_slot_ids"] = sorted(set(time_slot_ids))
+    booking_dict["service_ids"] = sorted(set(service_ids))
+    return booking_dict
+
+@booking_router.post("/holds")
+def hold_time_slot(time_slot_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
+    """
+    Временно удерживает временной слот за пользователем на время оформления бронирования.
+    
+    Параметры:
+    - user_id (int): Пользователь из токена авторизации.
+    - time_slot_id (int): Идентификатор временного слота.
+    - db (Session): Сессия базы данных.
+    
+    Возвращает:
+    - Словарь с ключом "success" и временем удержания в секундах "expires_in".
+    - Если слот занят или удерживается другим пользователем, возвращает ошибку 409 Conflict.
+    """
+    if not crud.hold_time_slot(db, time_slot_id=time_slot_id, user_id=user_id):
+        raise HTTPException(status_code=409, detail="Временной слот занят")
+    return {"success": True, "expires_in": settings.BOOKING_HOLD_TTL_SECONDS}
+
+@booking_router.delete("/holds/{time_slot_id}")
+def release_time_slot_hold(time_slot_id: int, user_id: int = Depends(current_user_id)):
+    """
+    Снимает удержание временного слота.
+    
+    Параметры:
+    - time_slot_id (int): Идентификатор временного слота.
+    - user_id (int): Пользователь, удерживающий слот (из токена авторизации).
+    
+    Возвращает:
+    - Словарь с ключом "success" и значением True, если удержание снято, иначе False.
+    """
+    success = crud.release_time_slot_hold(time_slot_id=time_slot_id, user_id=user_id)
+    return {"success": success}
+
 @booking_router.get("/{booking_id}")
-def read_booking(booking_id: int, db: Session = Depends(get_db)):
+def read_booking(booking_id: int, db: Session = Depends(get_read_db)):
     """
     Получает бронирование по его идентификатору.
     
@@ -48,23 +115,27 @@ def read_booking(booking_id: int, db: Session = Depends(get_db)):
     return db_booking
 
 @booking_router.get("/users/{user_id}")
-def read_user_bookings(user_id: int, status: Optional[str] = None, db: Session = Depends(get_db)):
+def read_user_bookings(user_id: int, status: Optional[str] = None, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), 
+                       db: Session = Depends(get_read_db)):
     """
     Получает бронирования пользователя с фильтрацией по статусу.
     
     Параметры:
     - user_id (int): Идентификатор пользователя.
     - status (str): Фильтр по статусу бронирования (опционально).
+    - skip (int): Количество бронирований, которые нужно пропустить (по умолчанию: 0).
+    - limit (int): Максимальное количество бронирований (по умолчанию: 100, не больше MAX_PAGE_SIZE).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Список бронирований пользователя.
     """
-    bookings = crud.get_user_bookings(db, user_id=user_id, status=status)
+    bookings = crud.get_user_bookings(db, user_id=user_id, status=status, skip=skip, limit=limit)
     return bookings
 
 @booking_router.get("/venues/{venue_id}")
-def read_venue_bookings(venue_id: int, status: Optional[str] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, db: Session = Depends(get_db)):
+def read_venue_bookings(venue_id: int, status: Optional[str] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, 
+                        skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), db: Session = Depends(get_read_db)):
     """
     Получает бронирования спортивной площадки с фильтрацией по статусу и дате.
     
@@ -73,60 +144,114 @@ def read_venue_bookings(venue_id: int, status: Optional[str] = None, start_date:
     - status (str): Фильтр по статусу бронирования (опционально).
     - start_date (datetime): Фильтр по начальной дате бронирования (опционально).
     - end_date (datetime): Фильтр по конечной дате бронирования (опционально).
+    - skip (int): Количество бронирований, которые нужно пропустить (по умолчанию: 0).
+    - limit (int): Максимальное количество бронирований (по умолчанию: 100, не больше MAX_PAGE_SIZE).
+      Для полной истории используйте /bookings/venues/{venue_id}/export.
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Список бронирований спортивной площадки.
     """
-    bookings = crud.get_venue_bookings(db, venue_id=venue_id, status=status, start_date=start_date, end_date=end_date)
+    bookings = crud.get_venue_bookings(db, venue_id=venue_id, status=status, start_date=start_date, end_date=end_date, 
+                                       skip=skip, limit=limit)
     return bookings
 
+@booking_router.get("/venues/{venue_id}/export")
+def export_venue_bookings(venue_id: int, export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"), 
+                          status: Optional[str] = None, start_date: Optional[datetime] = None, 
+                          end_date: Optional[datetime] = None, current_user: int = Depends(current_user_id), 
+                          db: Session = Depends(get_read_db)):
+    """
+    Потоково выгружает бронирования спортивной площадки в CSV или NDJSON.
+    
+    Параметры:
+    - venue_id (int): Идентификатор спортивной площадки.
+    - format (str): Формат выгрузки: csv или ndjson (по умолчанию: csv).
+    - status (str): Фильтр по статусу бронирования (опционально).
+    - start_date (datetime): Фильтр по начальной дате бронирования (опционально).
+    - end_date (datetime): Фильтр по конечной дате бронирования (опционально).
+    - current_user (int): Пользователь из токена авторизации (только владелец площадки).
+    - db (Session): Сессия базы данных для проверки владельца.
+    
+    Возвращает:
+    - Поток строк бронирований; данные читаются через серверный курсор.
+    
+    Исключения:
+    - HTTPException (status_code=404): Если спортивная площадка не найдена.
+    - HTTPException (status_code=403): Если площадка чужая.
+    """
+    require_owner(crud.get_venue_owner(db, venue_id), current_user, "Спортивная площадка не найдена")
+    
+    def build_query(stream_db: Session):
+        return crud.export_venue_bookings_query(stream_db, venue_id=venue_id, status=status, 
+                                                start_date=start_date, end_date=end_date)
+    
+    return StreamingResponse(
+        stream_query(build_query, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="venue_{venue_id}_bookings.{export_format}"'},
+    )
+
 @booking_router.put("/{booking_id}")
-def update_booking_status(booking_id: int, status: str, db: Session = Depends(get_db)):
+def update_booking_status(booking_id: int, status: str, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Обновляет статус бронирования.
     
     Параметры:
     - booking_id (int): Идентификатор бронирования.
     - status (str): Новый статус бронирования.
+    - current_user (int): Пользователь из токена авторизации (только автор бронирования).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Обновленное бронирование.
-    - Если бронирование не найдено, возвращает None.
+    
+    Исключения:
+    - HTTPException (status_code=404): Если бронирование не найдено.
+    - HTTPException (status_code=403): Если бронирование чужое.
+    - HTTPException (status_code=409): Если бронирование уже оплачено или отменено.
     """
+    require_owner(crud.get_booking_owner(db, booking_id), current_user, "Бронирование не найдено")
     updated_booking = crud.update_booking_status(db, booking_id=booking_id, status=status)
+    if updated_booking is None:
+        raise HTTPException(status_code=409, detail="Статус бронирования уже изменен")
     return updated_booking
 
 @booking_router.post("/{booking_id}/services")
-def add_service_to_booking(booking_id: int, service_id: int, db: Session = Depends(get_db)):
+def add_service_to_booking(booking_id: int, service_id: int, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Добавляет услугу к бронированию.
     
     Параметры:
     - booking_id (int): Идентификатор бронирования.
     - service_id (int): Идентификатор услуги.
+    - current_user (int): Пользователь из токена авторизации (только автор бронирования).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Объект добавленной услуги бронирования.
     - Если бронирование или услуга не найдены, возвращает None.
+    - Если бронирование чужое, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_booking_owner(db, booking_id), current_user, "Бронирование не найдено")
     booking_service = crud.add_service_to_booking(db, booking_id=booking_id, service_id=service_id)
     return booking_service
 
 @booking_router.delete("/{booking_id}/services/{service_id}")
-def remove_service_from_booking(booking_id: int, service_id: int, db: Session = Depends(get_db)):
+def remove_service_from_booking(booking_id: int, service_id: int, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет услугу из бронирования.
     
     Параметры:
     - booking_id (int): Идентификатор бронирования.
     - service_id (int): Идентификатор услуги.
+    - current_user (int): Пользователь из токена авторизации (только автор бронирования).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Словарь с ключом "success" и значением True, если услуга успешно удалена, иначе False.
+    - Если бронирование чужое, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_booking_owner(db, booking_id), current_user, "Бронирование не найдено")
     success = crud.remove_service_from_booking(db, booking_id=booking_id, service_id=service_id)
     return {"success": success}
\ No newline at end of file
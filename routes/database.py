@@ -1,9 +1,11 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from database import Base, engine, create_tables
+from config.create_token_check import require_internal_token
+from monitoring.routing import InstrumentedRoute
 
 
-# Маршруты для ленты новостей
-database_router = APIRouter()
+# Маршруты для ленты новостей (создание и удаление таблиц - только с заголовком X-Internal-Token)
+database_router = APIRouter(route_class=InstrumentedRoute, dependencies=[Depends(require_internal_token)])
 
 @database_router.post("/")
 def create_table():
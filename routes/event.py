@@ -3,15 +3,23 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from database import crud
-from database.base import get_db
+from database.base import get_db, get_read_db
+from database.cache import result_cache, category_tag
+from config import settings
+from config.create_token_check import stream_mode
+from config.jwt_token import current_user_id, require_owner
+from database.streaming import stream_query, MEDIA_TYPES
 from fastapi import Query
+from fastapi.responses import StreamingResponse
+from monitoring.routing import InstrumentedRoute, coalesced
 
 
 # Маршруты для мероприятий
-event_router = APIRouter()
+event_router = APIRouter(route_class=InstrumentedRoute)
 
 @event_router.get("/check_user")
-def check_user_events(user_id: int, db: Session = Depends(get_db)):
+def check_user_events(user_id: int, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), 
+                      db: Session = Depends(get_read_db)):
     """
     Проверка есть ли у пользователя мероприятия.
 
@@ -20,7 +28,7 @@ def check_user_events(user_id: int, db: Session = Depends(get_db)):
     - Возвращает объект меропрития пользователя.
 .
     """
-    registration = crud.check_event_user(db, user_id=user_id)
+    registration = crud.check_event_user(db, user_id=user_id, skip=skip, limit=limit)
     if registration is None:
         raise HTTPException(status_code=400, detail="Пользователь не зарегистрирован на мероприятие.")
     return registration
@@ -32,8 +40,8 @@ def create_event(title: str, description: str, sport_category_id: int, event_dat
                  registration_end_date: Optional[datetime] = None, price: float = 0, 
                  available_seats: int = 0, total_seats: int = 0, location: Optional[str] = None, 
                  longitude: Optional[float] = None, latitude: Optional[float] = None, 
-                 competition_rules: Optional[str] = None, owner_id: Optional[int] = None, 
-                 status: str = "new", db: Session = Depends(get_db)):
+                 competition_rules: Optional[str] = None, status: str = "new", 
+                 owner_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Создает новое мероприятие.
 
@@ -50,7 +58,7 @@ def create_event(title: str, description: str, sport_category_id: int, event_dat
     - **longitude**: Долгота места проведения (опционально).
     - **latitude**: Широта места проведения (опционально).
     - **competition_rules**: Правила соревнований (опционально).
-    - **owner_id**: Идентификатор владельца мероприятия (опционально).
+    - **owner_id**: Владелец мероприятия - пользователь из токена авторизации.
     - **status**: Статус мероприятия (по умолчанию "new").
     - **db**: Сессия базы данных.
     - Возвращает созданное мероприятие.
@@ -75,7 +83,8 @@ def create_event(title: str, description: str, sport_category_id: int, event_dat
     return crud.create_event(db=db, data=event_data)
 
 @event_router.get("/{event_id}")
-def read_event(event_id: int, db: Session = Depends(get_db)):
+@coalesced
+def read_event(event_id: int, db: Session = Depends(get_read_db)):
     """
     Получает мероприятие по его идентификатору.
 
@@ -90,16 +99,19 @@ def read_event(event_id: int, db: Session = Depends(get_db)):
     return db_event
 
 @event_router.get("/")
-def read_events(skip: int = 0, limit: int = 100, category_id: Optional[int] = None, 
+@coalesced
+def read_events(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), 
+                category_id: Optional[int] = None, 
                 status: Optional[str] = None, owner_id: Optional[int] = None, 
                 min_date: Optional[datetime] = None, max_date: Optional[datetime] = None, 
                 latitude: Optional[float] = None, longitude: Optional[float] = None, 
-                distance: Optional[float] = None, db: Session = Depends(get_db)):
+                distance: Optional[float] = None, sort: Optional[str] = Query(None, pattern="^trending$"), 
+                stream: bool = Depends(stream_mode), db: Session = Depends(get_read_db)):
     """
     Получает список мероприятий с пагинацией и фильтрацией.
 
     - **skip**: Количество мероприятий, которые нужно пропустить (по умолчанию 0).
-    - **limit**: Максимальное количество мероприятий, которые нужно вернуть (по умолчанию 100).
+    - **limit**: Максимальное количество мероприятий, которые нужно вернуть (по умолчанию 100, не больше MAX_PAGE_SIZE).
     - **category_id**: Фильтр по идентификатору спортивной категории (опционально).
     - **status**: Фильтр по статусу мероприятия (опционально).
     - **owner_id**: Фильтр по идентификатору владельца мероприятия (опционально).
@@ -108,13 +120,36 @@ def read_events(skip: int = 0, limit: int = 100, category_id: Optional[int] = No
     - **latitude**: Фильтр по широте места проведения (опционально).
     - **longitude**: Фильтр по долготе места проведения (опционально).
     - **distance**: Фильтр по расстоянию от указанных координат (опционально).
+    - **sort**: trending - по убыванию рейтинга с учетом давности лайков и просмотров (опционально).
+    - **stream**: Потоковая выдача всех мероприятий начиная со skip в порядке sort, limit не применяется (только с заголовком X-Internal-Token).
     - **db**: Сессия базы данных.
     - Возвращает список мероприятий.
     """
-    events = crud.get_events(db, skip=skip, limit=limit, category_id=category_id, status=status, 
-                             owner_id=owner_id, min_date=min_date, max_date=max_date, 
-                             latitude=latitude, longitude=longitude, distance=distance)
-    return events
+    if stream:
+        def build_query(stream_db: Session):
+            return crud.stream_events_query(stream_db, skip=skip, category_id=category_id, status=status, 
+                                            owner_id=owner_id, min_date=min_date, max_date=max_date, 
+                                            latitude=latitude, longitude=longitude, distance=distance, sort=sort)
+        return StreamingResponse(stream_query(build_query, "json"), media_type=MEDIA_TYPES["json"])
+    # Поиск по координатам почти не повторяется: такие запросы идут мимо кэша
+    if latitude is not None or longitude is not None or distance is not None:
+        return crud.get_events(db, skip=skip, limit=limit, category_id=category_id, status=status, 
+                               owner_id=owner_id, min_date=min_date, max_date=max_date, 
+                               latitude=latitude, longitude=longitude, distance=distance, sort=sort)
+    return cached_events(db, skip=skip, limit=limit, category_id=category_id, status=status, owner_id=owner_id, 
+                         min_date=min_date, max_date=max_date, sort=sort)
+
+def cached_events(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, 
+                  status: Optional[str] = None, owner_id: Optional[int] = None, 
+                  min_date: Optional[datetime] = None, max_date: Optional[datetime] = None, 
+                  sort: Optional[str] = None):
+    """
+    Страница мероприятий через кэш результатов (GET /events/ и прогрев): ключ и загрузка из одних параметров
+    """
+    params = dict(skip=skip, limit=limit, category_id=category_id, status=status, owner_id=owner_id, 
+                  min_date=min_date, max_date=max_date, sort=sort)
+    return result_cache.get_or_load("events", params, lambda session: crud.get_events(session, **params), 
+                                    [category_tag("events", category_id)], db)
 
 @event_router.put("/{event_id}")
 def update_event(event_id: int, title: Optional[str] = None, description: Optional[str] = None,
@@ -124,8 +159,8 @@ def update_event(event_id: int, title: Optional[str] = None, description: Option
                  available_seats: Optional[int] = None, total_seats: Optional[int] = None, 
                  location: Optional[str] = None, longitude: Optional[float] = None, 
                  latitude: Optional[float] = None, competition_rules: Optional[str] = None, 
-                 owner_id: Optional[int] = None, status: Optional[str] = None, 
-                 db: Session = Depends(get_db)):
+                 status: Optional[str] = None, 
+                 current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Обновляет данные мероприятия.
 
@@ -143,12 +178,14 @@ def update_event(event_id: int, title: Optional[str] = None, description: Option
     - **longitude**: Новая долгота места проведения (опционально).
     - **latitude**: Новая широта места проведения (опционально).
     - **competition_rules**: Новые правила соревнований (опционально).
-    - **owner_id**: Новый идентификатор владельца мероприятия (опционально).
     - **status**: Новый статус мероприятия (опционально).
+    - **current_user**: Пользователь из токена авторизации (только владелец мероприятия).
     - **db**: Сессия базы данных.
     - Возвращает обновленное мероприятие.
     - Если мероприятие не найдено, возвращает ошибку 404 Not Found.
+    - Если мероприятие чужое, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_event_owner(db, event_id), current_user, "Мероприятие не найдено")
     event_data = {}
     if title is not None:
         event_data["title"] = title
@@ -176,8 +213,6 @@ def update_event(event_id: int, title: Optional[str] = None, description: Option
         event_data["latitude"] = latitude
     if competition_rules is not None:
         event_data["competition_rules"] = competition_rules
-    if owner_id is not None:
-        event_data["owner_id"] = owner_id
     if status is not None:
         event_data["status"] = status
     
@@ -187,24 +222,27 @@ def update_event(event_id: int, title: Optional[str] = None, description: Option
     return updated_event
 
 @event_router.delete("/{event_id}")
-def delete_event(event_id: int, db: Session = Depends(get_db)):
+def delete_event(event_id: int, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет мероприятие.
 
     - **event_id**: Идентификатор мероприятия.
+    - **current_user**: Пользователь из токена авторизации (только владелец мероприятия).
     - **db**: Сессия базы данных.
     - Возвращает True, если мероприятие успешно удалено, иначе False.
+    - Если мероприятие чужое, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_event_owner(db, event_id), current_user, "Мероприятие не найдено")
     success = crud.delete_event(db, event_id=event_id)
     return {"success": success}
 
 @event_router.post("/{event_id}/like")
-def like_event(event_id: int, user_id: int, db: Session = Depends(get_db)):
+def like_event(event_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Добавляет лайк к мероприятию от пользователя.
 
     - **event_id**: Идентификатор мероприятия.
-    - **user_id**: Идентификатор пользователя, который ставит лайк.
+    - **user_id**: Пользователь, который ставит лайк (из токена авторизации).
     - **db**: Сессия базы данных.
     - Возвращает объект лайка.
     """
@@ -212,19 +250,19 @@ def like_event(event_id: int, user_id: int, db: Session = Depends(get_db)):
     return like
 
 @event_router.delete("/{event_id}/like")
-def unlike_event(event_id: int, user_id: int, db: Session = Depends(get_db)):
+def unlike_event(event_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет лайк пользователя от мероприятия.
 
     - **event_id**: Идентификатор мероприятия.
-    - **user_id**: Идентификатор пользователя, который удаляет лайк.
+    - **user_id**: Пользователь, который удаляет лайк (из токена авторизации).
     - **db**: Сессия базы данных.
     - Возвращает True, если лайк успешно удален, иначе False.
     """
     success = crud.unlike_event(db, event_id=event_id, user_id=user_id)
     return {"success": success}
 
-@event_router.post("/{event_id}/views/increment")
+@event_router.post("/{event_id}/views/increment", dependencies=[Depends(current_user_id)])
 def increment_event_views(event_id: int, db: Session = Depends(get_db)):
     """
     Увеличивает счетчик просмотров мероприятия.
@@ -237,12 +275,12 @@ def increment_event_views(event_id: int, db: Session = Depends(get_db)):
     return {"success": success}
 
 @event_router.post("/{event_id}/register")
-def register_for_event(event_id: int, user_id: int, db: Session = Depends(get_db)):
+def register_for_event(event_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Регистрирует пользователя на мероприятие.
 
     - **event_id**: Идентификатор мероприятия.
-    - **user_id**: Идентификатор пользователя, который регистрируется на мероприятие.
+    - **user_id**: Пользователь, который регистрируется на мероприятие (из токена авторизации).
     - **db**: Сессия базы данных.
     - Возвращает объект регистрации.
     - Если регистрация не удалась (нет свободных мест), возвращает ошибку 400 Bad Request.
@@ -252,3 +290,31 @@ def register_for_event(event_id: int, user_id: int, db: Session = Depends(get_db
         raise HTTPException(status_code=400, detail="Регистрация не удалась. Нет свободных мест.")
     return registration
 
+
+
+@event_router.get("/{event_id}/registrations/export")
+def export_event_registrations(event_id: int, export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"), 
+                               status: Optional[str] = None, current_user: int = Depends(current_user_id), 
+                               db: Session = Depends(get_read_db)):
+    """
+    Потоково выгружает регистрации участников мероприятия в CSV или NDJSON.
+
+    - **event_id**: Идентификатор мероприятия.
+    - **format**: Формат выгрузки: csv или ndjson (по умолчанию csv).
+    - **status**: Фильтр по статусу регистрации (опционально).
+    - **current_user**: Пользователь из токена авторизации (только организатор мероприятия).
+    - **db**: Сессия базы данных для проверки организатора.
+    - Возвращает поток строк регистраций; данные читаются через серверный курсор.
+    - Если мероприятие не найдено, возвращает ошибку 404 Not Found.
+    - Если мероприятие чужое, возвращает ошибку 403 Forbidden.
+    """
+    require_owner(crud.get_event_owner(db, event_id), current_user, "Мероприятие не найдено")
+
+    def build_query(stream_db: Session):
+        return crud.export_event_registrations_query(stream_db, event_id=event_id, status=status)
+
+    return StreamingResponse(
+        stream_query(build_query, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="event_{event_id}_registrations.{export_format}"'},
+    )
\ No newline at end of file
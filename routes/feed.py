@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from database import crud
-from database.base import get_db
+from database.base import get_db, get_read_db
+from database.streaming import stream_query, MEDIA_TYPES
+from config import settings
+from config.create_token_check import require_internal_token, stream_mode
+from config.jwt_token import current_user_id
+from monitoring.routing import InstrumentedRoute, coalesced
 
 
 # Маршруты для ленты новостей
-feed_router = APIRouter()
+feed_router = APIRouter(route_class=InstrumentedRoute)
 
-@feed_router.post("/")
+@feed_router.post("/", dependencies=[Depends(require_internal_token)])
 def create_feed_item(title: str, category_id: int, image_url: Optional[str] = None, is_interesting: bool = False, db: Session = Depends(get_db)):
     """
     Создает новый элемент ленты новостей.
@@ -26,8 +32,27 @@ def create_feed_item(title: str, category_id: int, image_url: Optional[str] = No
     """
     return crud.create_feed_item(db=db, title=title, category_id=category_id, image_url=image_url, is_interesting=is_interesting)
 
+@feed_router.get("/personal")
+def read_personal_feed(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE),
+                       user_id: int = Depends(current_user_id), db: Session = Depends(get_read_db)):
+    """
+    Получает персональную ленту новостей пользователя.
+    
+    Параметры:
+    - skip (int): Количество элементов, которые нужно пропустить (по умолчанию: 0).
+    - limit (int): Максимальное количество элементов, которые нужно вернуть (по умолчанию: 100, не больше MAX_PAGE_SIZE).
+    - user_id (int): Пользователь (из токена авторизации).
+    - db (Session): Сессия базы данных.
+    
+    Возвращает:
+    - Список элементов ленты: тренды категорий, которые пользователь лайкал, в которых регистрировался
+      на мероприятия или состоит в командах, вперемешку с общими трендами.
+    """
+    return crud.get_personal_feed(db, user_id=user_id, skip=skip, limit=limit)
+
 @feed_router.get("/{feed_item_id}")
-def read_feed_item(feed_item_id: int, db: Session = Depends(get_db)):
+@coalesced
+def read_feed_item(feed_item_id: int, db: Session = Depends(get_read_db)):
     """
     Получает элемент ленты новостей по его идентификатору.
     
@@ -47,24 +72,33 @@ def read_feed_item(feed_item_id: int, db: Session = Depends(get_db)):
     return db_item
 
 @feed_router.get("/")
-def read_feed_items(skip: int = 0, limit: int = 100, category_id: Optional[int] = None, is_interesting: Optional[bool] = None, db: Session = Depends(get_db)):
+@coalesced
+def read_feed_items(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), category_id: Optional[int] = None, is_interesting: Optional[bool] = None, 
+                    sort: Optional[str] = Query(None, pattern="^trending$"), 
+                    stream: bool = Depends(stream_mode), db: Session = Depends(get_read_db)):
     """
     Получает список элементов ленты новостей с пагинацией и фильтрацией.
     
     Параметры:
     - skip (int): Количество элементов, которые нужно пропустить (по умолчанию: 0).
-    - limit (int): Максимальное количество элементов, которые нужно вернуть (по умолчанию: 100).
+    - limit (int): Максимальное количество элементов, которые нужно вернуть (по умолчанию: 100, не больше MAX_PAGE_SIZE).
     - category_id (int): Фильтр по идентификатору спортивной категории (опционально).
     - is_interesting (bool): Фильтр по флагу "интересный" (опционально).
+    - sort (str): trending - по убыванию рейтинга с учетом давности лайков и просмотров (опционально).
+    - stream (bool): Потоковая выдача всех элементов начиная со skip в порядке sort, limit не применяется (только с заголовком X-Internal-Token).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Список элементов ленты новостей.
     """
-    items = crud.get_feed_items(db, skip=skip, limit=limit, category_id=category_id, is_interesting=is_interesting)
+    if stream:
+        def build_query(stream_db: Session):
+            return crud.stream_feed_items_query(stream_db, skip=skip, category_id=category_id, is_interesting=is_interesting, sort=sort)
+        return StreamingResponse(stream_query(build_query, "json"), media_type=MEDIA_TYPES["json"])
+    items = crud.get_feed_items(db, skip=skip, limit=limit, category_id=category_id, is_interesting=is_interesting, sort=sort)
     return items
 
-@feed_router.put("/{feed_item_id}")
+@feed_router.put("/{feed_item_id}", dependencies=[Depends(require_internal_token)])
 def update_feed_item(feed_item_id: int, title: Optional[str] = None, category_id: Optional[int] = None, image_url: Optional[str] = None, is_interesting: Optional[bool] = None, db: Session = Depends(get_db)):
     """
     Обновляет данные элемента ленты новостей.
@@ -98,7 +132,7 @@ def update_feed_item(feed_item_id: int, title: Optional[str] = None, category_id
         raise HTTPException(status_code=404, detail="Элемент ленты не найден")
     return updated_item
 
-@feed_router.delete("/{feed_item_id}")
+@feed_router.delete("/{feed_item_id}", dependencies=[Depends(require_internal_token)])
 def delete_feed_item(feed_item_id: int, db: Session = Depends(get_db)):
     """
     Удаляет элемент ленты новостей.
@@ -114,13 +148,13 @@ def delete_feed_item(feed_item_id: int, db: Session = Depends(get_db)):
     return {"success": success}
 
 @feed_router.post("/{feed_item_id}/like")
-def like_feed_item(feed_item_id: int, user_id: int, db: Session = Depends(get_db)):
+def like_feed_item(feed_item_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Добавляет лайк к элементу ленты новостей от пользователя.
     
     Параметры:
     - feed_item_id (int): Идентификатор элемента ленты.
-    - user_id (int): Идентификатор пользователя, который ставит лайк.
+    - user_id (int): Пользователь, который ставит лайк (из токена авторизации).
     - db (Session): Сессия базы данных.
     
     Возвращает:
@@ -130,13 +164,13 @@ def like_feed_item(feed_item_id: int, user_id: int, db: Session = Depends(get_db
     return like
 
 @feed_router.delete("/{feed_item_id}/like")
-def unlike_feed_item(feed_item_id: int, user_id: int, db: Session = Depends(get_db)):
+def unlike_feed_item(feed_item_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет лайк пользователя от элемента ленты новостей.
     
     Параметры:
     - feed_item_id (int): Идентификатор элемента ленты.
-    - user_id (int): Идентификатор пользователя, который удаляет лайк.
+    - user_id (int): Пользователь, который удаляет лайк (из токена авторизации).
     - db (Session): Сессия базы данных.
     
     Возвращает:
@@ -145,7 +179,7 @@ def unlike_feed_item(feed_item_id: int, user_id: int, db: Session = Depends(get_
     success = crud.unlike_feed_item(db, feed_item_id=feed_item_id, user_id=user_id)
     return {"success": success}
   
-@feed_router.post("/{feed_item_id}/views/increment")
+@feed_router.post("/{feed_item_id}/views/increment", dependencies=[Depends(current_user_id)])
 def increment_feed_item_views(feed_item_id: int, db: Session = Depends(get_db)):
     """
     Увеличивает счетчик просмотров элемента ленты новостей.
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import configure_mappers
+from starlette.concurrency import run_in_threadpool
+from config import settings
+from database import crud
+from database.base import ROUTE_CLASS_TIMEOUTS, SessionLocal, engine, replica_engines, replica_sessionmaker
+from database.snapshot import snapshot_store
+from routes import event, team, venue
+
+
+logger = logging.getLogger(__name__)
+
+
+# Проверки состояния для балансировщика: /health/live - процесс отвечает,
+# /health/ready - прогрев после запуска завершен и база отвечает
+health_router = APIRouter()
+
+
+class Readiness:
+    def __init__(self):
+        self.warmed_up = False
+        # Выставляется при остановке: балансировщик перестает слать запросы, пока они дорабатывают
+        self.draining = False
+        self._checked_at = 0.0
+        self._database_error = "еще не проверялась"
+
+    async def database_error(self):
+        """
+        Ошибка проверки базы или None. Результат кэшируется на HEALTH_READY_CACHE_SECONDS
+        """
+        now = time.monotonic()
+        if now - self._checked_at >= settings.HEALTH_READY_CACHE_SECONDS:
+            self._checked_at = now
+            try:
+                await run_in_threadpool(_ping_database)
+                self._database_error = None
+            except Exception as exc:
+                self._database_error = str(exc).splitlines()[0] if str(exc) else type(exc).__name__
+        return self._database_error
+
+
+readiness = Readiness()
+
+
+def _ping_database():
+    with engine.connect() as connection:
+        connection.exec_driver_sql("SELECT 1")
+
+
+def _open_pool(db_engine):
+    # Соединения открываются одновременно и возвращаются в пул открытыми
+    count = min(settings.WARMUP_POOL_CONNECTIONS, getattr(db_engine.pool, "size", lambda: 1)())
+    connections = []
+    try:
+        for _ in range(count):
+            connection = db_engine.connect()
+            connections.append(connection)
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def _prime_caches():
+    # Снимок справочников отображается, если его уже собрал другой процесс узла
+    if settings.SNAPSHOT_ENABLED:
+        snapshot_store.current()
+    if not settings.RESULT_CACHE_ENABLED:
+        return
+    db = (replica_sessionmaker() or SessionLocal)()
+    db.info["timeouts"] = ROUTE_CLASS_TIMEOUTS["read"]
+    try:
+        # Первые страницы списков с параметрами по умолчанию и мероприятия популярных категорий
+        # (через те же функции кэша, что и обработчики, поэтому ключи совпадают с ключами запросов)
+        event.cached_events(db)
+        venue.cached_venues(db)
+        team.cached_teams(db)
+        for category in crud.get_sport_categories(db, skip=0, limit=settings.WARMUP_EVENT_CATEGORIES):
+            event.cached_events(db, category_id=category.id)
+    finally:
+        db.close()
+
+
+def warm_up():
+    """
+    Настройка мапперов, открытие соединений пулов и заполнение кэшей
+    """
+    started = time.perf_counter()
+    configure_mappers()
+    for db_engine in [engine, *replica_engines]:
+        _open_pool(db_engine)
+    _prime_caches()
+    logger.info("Прогрев завершен за %.2f с", time.perf_counter() - started)
+
+
+async def run_warmup(stop: asyncio.Event):
+    """
+    Прогрев в пуле потоков; при ошибке (база еще недоступна) - повтор, пока не выставлен stop
+    """
+    if not settings.WARMUP_ENABLED:
+        readiness.warmed_up = True
+        return
+    while not stop.is_set():
+        try:
+            await asyncio.to_thread(warm_up)
+            readiness.warmed_up = True
+            return
+        except Exception:
+            logger.exception("Ошибка прогрева, повтор через %s с", settings.WARMUP_RETRY_SECONDS)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.WARMUP_RETRY_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+@health_router.get("/health/live", include_in_schema=False)
+def read_live():
+    """
+    Процесс запущен и обрабатывает запросы.
+    """
+    return {"status": "ok"}
+
+
+@health_router.get("/health/ready", include_in_schema=False)
+async def read_ready():
+    """
+    Готовность принимать трафик.
+
+    - Возвращает 200, если прогрев завершен и база отвечает, иначе 503 с причиной.
+    """
+    if readiness.draining:
+        return JSONResponse({"ready": False, "reason": "остановка"}, status_code=503)
+    if not readiness.warmed_up:
+        return JSONResponse({"ready": False, "reason": "прогрев"}, status_code=503)
+    error = await readiness.database_error()
+    if error is not None:
+        return JSONResponse({"ready": False, "reason": f"база данных недоступна: {error}"}, status_code=503)
+    return {"ready": True}
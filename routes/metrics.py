@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from monitoring.metrics import REGISTRY
+
+
+# Маршруты для мониторинга
+metrics_router = APIRouter()
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    """
+    Метрики приложения в текстовом формате Prometheus.
+
+    - Возвращает задержки и размеры ответов по шаблонам маршрутов, число запросов в обработке,
+      количество и время SQL-запросов на HTTP-запрос и состояние пула соединений.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
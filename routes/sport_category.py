@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime
 from database import crud
 from database.base import get_db
+from database.snapshot import Snapshot, get_reference_source
+from database.streaming import stream_query, MEDIA_TYPES
+from config import settings
+from config.create_token_check import require_internal_token, stream_mode
+from monitoring.routing import InstrumentedRoute, coalesced
 
 # Маршруты для спортивных категорий
-sport_category_router = APIRouter()
+sport_category_router = APIRouter(route_class=InstrumentedRoute)
 
-@sport_category_router.post("/")
+@sport_category_router.post("/", dependencies=[Depends(require_internal_token)])
 def create_sport_category(name: str, icon_url: Optional[str] = None, db: Session = Depends(get_db)):
     """
     Создает новую спортивную категорию.
@@ -21,34 +27,46 @@ def create_sport_category(name: str, icon_url: Optional[str] = None, db: Session
     return crud.create_sport_category(db=db, name=name, icon_url=icon_url)
 
 @sport_category_router.get("/{category_id}")
-def read_sport_category(category_id: int, db: Session = Depends(get_db)):
+@coalesced
+def read_sport_category(category_id: int, source: Union[Snapshot, Session] = Depends(get_reference_source)):
     """
     Получает спортивную категорию по ее идентификатору.
 
     - **category_id**: Идентификатор спортивной категории.
-    - **db**: Сессия базы данных.
+    - **source**: Снимок справочников или сессия базы данных.
     - Возвращает спортивную категорию.
     - Если спортивная категория не найдена, возвращает ошибку 404 Not Found.
     """
-    db_category = crud.get_sport_category(db, category_id=category_id)
+    if isinstance(source, Snapshot):
+        db_category = source.categories.find(category_id)
+    else:
+        db_category = crud.get_sport_category(source, category_id=category_id)
     if db_category is None:
         raise HTTPException(status_code=404, detail="Спортивная категория не найдена")
     return db_category
 
 @sport_category_router.get("/")
-def read_sport_categories(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@coalesced
+def read_sport_categories(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), 
+                          stream: bool = Depends(stream_mode), source: Union[Snapshot, Session] = Depends(get_reference_source)):
     """
     Получает список спортивных категорий с пагинацией.
 
     - **skip**: Количество категорий, которые нужно пропустить (по умолчанию 0).
-    - **limit**: Максимальное количество категорий, которые нужно вернуть (по умолчанию 100).
-    - **db**: Сессия базы данных.
+    - **limit**: Максимальное количество категорий, которые нужно вернуть (по умолчанию 100, не больше MAX_PAGE_SIZE).
+    - **stream**: Потоковая выдача всех категорий начиная со skip, limit не применяется (только с заголовком X-Internal-Token).
+    - **source**: Снимок справочников или сессия базы данных.
     - Возвращает список спортивных категорий.
     """
-    categories = crud.get_sport_categories(db, skip=skip, limit=limit)
+    if stream:
+        return StreamingResponse(stream_query(lambda stream_db: crud.stream_sport_categories_query(stream_db, skip=skip), "json"), 
+                                 media_type=MEDIA_TYPES["json"])
+    if isinstance(source, Snapshot):
+        return source.categories.page(skip, limit)
+    categories = crud.get_sport_categories(source, skip=skip, limit=limit)
     return categories
 
-@sport_category_router.put("/{category_id}")
+@sport_category_router.put("/{category_id}", dependencies=[Depends(require_internal_token)])
 def update_sport_category(category_id: int, name: Optional[str] = None, icon_url: Optional[str] = None, db: Session = Depends(get_db)):
     """
     Обновляет данные спортивной категории.
@@ -71,7 +89,7 @@ def update_sport_category(category_id: int, name: Optional[str] = None, icon_url
         raise HTTPException(status_code=404, detail="Спортивная категория не найдена")
     return updated_category
 
-@sport_category_router.delete("/{category_id}")
+@sport_category_router.delete("/{category_id}", dependencies=[Depends(require_internal_token)])
 def delete_sport_category(category_id: int, db: Session = Depends(get_db)):
     """
     Удаляет спортивную категорию.
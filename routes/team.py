@@ -1,24 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from database import crud
-from database.base import get_db
+from database.base import get_db, get_read_db
+from database.cache import result_cache, category_tag
+from database.streaming import stream_query, MEDIA_TYPES
+from config import settings
+from config.create_token_check import stream_mode
+from config.jwt_token import current_user_id, require_owner
+from monitoring.routing import InstrumentedRoute, coalesced
 
 
 # Маршруты для команд
-team_router = APIRouter()
+team_router = APIRouter(route_class=InstrumentedRoute)
 
 
 @team_router.post("/")
-def create_team(name: str, sport_category_id: int, creator_id: int, capacity: int = 10, logo_url: Optional[str] = None, is_auto_team: bool = False, event_id: Optional[int] = None, db: Session = Depends(get_db)):
+def create_team(name: str, sport_category_id: int, capacity: int = 10, logo_url: Optional[str] = None, is_auto_team: bool = False, event_id: Optional[int] = None, creator_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Создает новую команду.
 
     Параметры:
     - name (str): Название команды (обязательный).
     - sport_category_id (int): Идентификатор спортивной категории (обязательный).
-    - creator_id (int): Идентификатор пользователя-создателя команды (обязательный).
+    - creator_id (int): Создатель команды - пользователь из токена авторизации.
     - capacity (int): Вместимость команды (по умолчанию: 10).
     - logo_url (str): URL логотипа команды (опционально).
     - is_auto_team (bool): Флаг, указывающий, является ли команда автоматически сформированной (по умолчанию: False).
@@ -40,7 +47,8 @@ def create_team(name: str, sport_category_id: int, creator_id: int, capacity: in
 
 
 @team_router.get("/{team_id}")
-def read_team(team_id: int, db: Session = Depends(get_db)):
+@coalesced
+def read_team(team_id: int, db: Session = Depends(get_read_db)):
     """
     Получает команду по ее идентификатору.
 
@@ -61,28 +69,45 @@ def read_team(team_id: int, db: Session = Depends(get_db)):
 
 
 @team_router.get("/")
-def read_teams(skip: int = 0, limit: int = 100, sport_category_id: Optional[int] = None, event_id: Optional[int] = None, is_auto_team: Optional[bool] = None, db: Session = Depends(get_db)):
+@coalesced
+def read_teams(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), sport_category_id: Optional[int] = None, event_id: Optional[int] = None, is_auto_team: Optional[bool] = None, 
+               stream: bool = Depends(stream_mode), db: Session = Depends(get_read_db)):
     """
     Получает список команд с пагинацией и фильтрацией.
 
     Параметры:
     - skip (int): Количество команд, которые нужно пропустить (по умолчанию: 0).
-    - limit (int): Максимальное количество команд, которые нужно вернуть (по умолчанию: 100).
+    - limit (int): Максимальное количество команд, которые нужно вернуть (по умолчанию: 100, не больше MAX_PAGE_SIZE).
     - sport_category_id (int): Фильтр по идентификатору спортивной категории (опционально).
     - event_id (int): Фильтр по идентификатору мероприятия (опционально).
     - is_auto_team (bool): Фильтр по флагу автоматически сформированной команды (опционально).
+    - stream (bool): Потоковая выдача всех команд начиная со skip, limit не применяется (только с заголовком X-Internal-Token).
     - db (Session): Сессия базы данных.
 
     Возвращает:
     - Список команд.
     """
-    teams = crud.get_teams(db, skip=skip, limit=limit, sport_category_id=sport_category_id,
-                           event_id=event_id, is_auto_team=is_auto_team)
-    return teams
+    if stream:
+        def build_query(stream_db: Session):
+            return crud.stream_teams_query(stream_db, skip=skip, sport_category_id=sport_category_id, 
+                                           event_id=event_id, is_auto_team=is_auto_team)
+        return StreamingResponse(stream_query(build_query, "json"), media_type=MEDIA_TYPES["json"])
+    return cached_teams(db, skip=skip, limit=limit, sport_category_id=sport_category_id, event_id=event_id, 
+                        is_auto_team=is_auto_team)
+
+
+def cached_teams(db: Session, skip: int = 0, limit: int = 100, sport_category_id: Optional[int] = None, 
+                 event_id: Optional[int] = None, is_auto_team: Optional[bool] = None):
+    """
+    Страница команд через кэш результатов (GET /teams/ и прогрев): ключ и загрузка из одних параметров
+    """
+    params = dict(skip=skip, limit=limit, sport_category_id=sport_category_id, event_id=event_id, is_auto_team=is_auto_team)
+    return result_cache.get_or_load("teams", params, lambda session: crud.get_teams(session, **params),
+                                    [category_tag("teams", sport_category_id)], db)
 
 
 @team_router.put("/{team_id}")
-def update_team(team_id: int, name: Optional[str] = None, sport_category_id: Optional[int] = None, capacity: Optional[int] = None, logo_url: Optional[str] = None, is_auto_team: Optional[bool] = None, event_id: Optional[int] = None, db: Session = Depends(get_db)):
+def update_team(team_id: int, name: Optional[str] = None, sport_category_id: Optional[int] = None, capacity: Optional[int] = None, logo_url: Optional[str] = None, is_auto_team: Optional[bool] = None, event_id: Optional[int] = None, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Обновляет данные команды.
 
@@ -94,6 +119,7 @@ def update_team(team_id: int, name: Optional[str] = None, sport_category_id: Opt
     - logo_url (str): Новый URL логотипа команды (опционально).
     - is_auto_team (bool): Новый флаг автоматически сформированной команды (опционально).
     - event_id (int): Новый идентификатор мероприятия, к которому привязана команда (опционально).
+    - current_user (int): Пользователь из токена авторизации (только создатель команды).
     - db (Session): Сессия базы данных.
 
     Возвращает:
@@ -101,7 +127,9 @@ def update_team(team_id: int, name: Optional[str] = None, sport_category_id: Opt
 
     Исключения:
     - HTTPException (status_code=404): Если команда не найдена.
+    - HTTPException (status_code=403): Если команда чужая.
     """
+    require_owner(crud.get_team_creator(db, team_id), current_user, "Команда не найдена")
     team_data = {}
     if name is not None:
         team_data["name"] = name
@@ -123,23 +151,26 @@ def update_team(team_id: int, name: Optional[str] = None, sport_category_id: Opt
 
 
 @team_router.delete("/{team_id}")
-def delete_team(team_id: int, db: Session = Depends(get_db)):
+def delete_team(team_id: int, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет команду.
 
     Параметры:
     - team_id (int): Идентификатор команды.
+    - current_user (int): Пользователь из токена авторизации (только создатель команды).
     - db (Session): Сессия базы данных.
 
     Возвращает:
     - Словарь с ключом "success" и значением True, если команда успешно удалена, иначе False.
+    - Если команда чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_team_creator(db, team_id), current_user, "Команда не найдена")
     success = crud.delete_team(db, team_id=team_id)
     return {"success": success}
 
 
 @team_router.post("/{team_id}/members")
-def add_team_member(team_id: int, user_id: int, role: str = 'player', position: Optional[str] = None, db: Session = Depends(get_db)):
+def add_team_member(team_id: int, user_id: int, role: str = 'player', position: Optional[str] = None, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Добавляет пользователя в команду.
 
@@ -148,19 +179,22 @@ def add_team_member(team_id: int, user_id: int, role: str = 'player', position:
     - user_id (int): Идентификатор пользователя.
     - role (str): Роль пользователя в команде (по умолчанию: 'player').
     - position (str): Позиция игрока в команде (опционально).
+    - current_user (int): Пользователь из токена авторизации (только создатель команды).
     - db (Session): Сессия базы данных.
 
     Возвращает:
     - Объект члена команды.
     - Если команда заполнена или пользователь уже является членом команды, возвращает None.
+    - Если команда чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_team_creator(db, team_id), current_user, "Команда не найдена")
     team_member = crud.add_team_member(
         db, team_id=team_id, user_id=user_id, role=role, position=position)
     return team_member
 
 
 @team_router.get("/{team_id}/members")
-def get_team_member(team_id: int, user_id: int,  db: Session = Depends(get_db)):
+def get_team_member(team_id: int, user_id: int,  db: Session = Depends(get_read_db)):
     """
     Добавляет пользователя в команду.
 
@@ -181,25 +215,30 @@ def get_team_member(team_id: int, user_id: int,  db: Session = Depends(get_db)):
 
 
 @team_router.delete("/{team_id}/members/{user_id}")
-def remove_team_member(team_id: int, user_id: int, db: Session = Depends(get_db)):
+def remove_team_member(team_id: int, user_id: int, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет пользователя из команды.
 
     Параметры:
     - team_id (int): Идентификатор команды.
     - user_id (int): Идентификатор пользователя.
+    - current_user (int): Пользователь из токена авторизации (создатель команды или сам участник).
     - db (Session): Сессия базы данных.
 
     Возвращает:
     - Словарь с ключом "success" и значением True, если пользователь успешно удален, иначе False.
     - Если пользователь является капитаном и в команде есть другие члены, возвращает False.
+    - Если удаляется чужой участник чужой команды, возвращает ошибку 403 Forbidden.
     """
+    # Покинуть команду участник может сам
+    if user_id != current_user:
+        require_owner(crud.get_team_creator(db, team_id), current_user, "Команда не найдена")
     success = crud.remove_team_member(db, team_id=team_id, user_id=user_id)
     return {"success": success}
 
 
 @team_router.put("/{team_id}/members/{user_id}")
-def update_team_member(team_id: int, user_id: int, role: Optional[str] = None, position: Optional[str] = None, db: Session = Depends(get_db)):
+def update_team_member(team_id: int, user_id: int, role: Optional[str] = None, position: Optional[str] = None, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Обновляет данные члена команды.
 
@@ -208,12 +247,15 @@ def update_team_member(team_id: int, user_id: int, role: Optional[str] = None, p
     - user_id (int): Идентификатор пользователя.
     - role (str): Новая роль пользователя в команде (опционально).
     - position (str): Новая позиция игрока в команде (опционально).
+    - current_user (int): Пользователь из токена авторизации (только создатель команды).
     - db (Session): Сессия базы данных.
 
     Возвращает:
     - Обновленный объект члена команды.
     - Если член команды не найден, возвращает None.
+    - Если команда чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_team_creator(db, team_id), current_user, "Команда не найдена")
     member_data = {}
     if role is not None:
         member_data["role"] = role
@@ -226,13 +268,13 @@ def update_team_member(team_id: int, user_id: int, role: Optional[str] = None, p
 
 
 @team_router.post("/{team_id}/requests")
-def create_team_request(team_id: int, user_id: int, db: Session = Depends(get_db)):
+def create_team_request(team_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Создает запрос на вступление в команду.
 
     Параметры:
     - team_id (int): Идентификатор команды.
-    - user_id (int): Идентификатор пользователя.
+    - user_id (int): Пользователь, подающий заявку (из токена авторизации).
     - db (Session): Сессия базы данных.
 
     Возвращает:
@@ -245,26 +287,29 @@ def create_team_request(team_id: int, user_id: int, db: Session = Depends(get_db
 
 
 @team_router.put("/requests/{request_id}")
-def handle_team_request(request_id: int, status: str, db: Session = Depends(get_db)):
+def handle_team_request(request_id: int, status: str, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Обрабатывает запрос на вступление в команду.
 
     Параметры:
     - request_id (int): Идентификатор запроса на вступление в команду.
     - status (str): Новый статус запроса ('accepted' или 'rejected').
+    - current_user (int): Пользователь из токена авторизации (только создатель команды).
     - db (Session): Сессия базы данных.
 
     Возвращает:
     - Обновленный запрос на вступление в команду.
     - Если запрос не найден, возвращает None.
+    - Если команда чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_team_request_creator(db, request_id), current_user, "Запрос не найден")
     updated_request = crud.handle_team_request(
         db, request_id=request_id, status=status)
     return updated_request
 
 
 @team_router.put("/{team_id}/stats")
-def update_team_stats(team_id: int, matches_played: Optional[int] = None, wins: Optional[int] = None, goals_scored: Optional[int] = None, db: Session = Depends(get_db)):
+def update_team_stats(team_id: int, matches_played: Optional[int] = None, wins: Optional[int] = None, goals_scored: Optional[int] = None, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Обновляет статистику команды.
 
@@ -273,11 +318,14 @@ def update_team_stats(team_id: int, matches_played: Optional[int] = None, wins:
     - matches_played (int): Количество сыгранных матчей (опционально).
     - wins (int): Количество побед (опционально).
     - goals_scored (int): Количество забитых голов (опционально).
+    - current_user (int): Пользователь из токена авторизации (только создатель команды).
     - db (Session): Сессия базы данных.
 
     Возвращает:
     - Обновленную статистику команды.
+    - Если команда чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_team_creator(db, team_id), current_user, "Команда не найдена")
     stats_data = {}
     if matches_played is not None:
         stats_data["matches_played"] = matches_played
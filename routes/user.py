@@ -1,69 +1,132 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from database import crud
-from database.base import get_db
+from database.base import get_db, get_read_db
+from database.streaming import stream_query, MEDIA_TYPES
+from config import settings
+from config.create_token_check import stream_mode
+from config.jwt_token import current_user_id, jwt_manager
+from config.passwords import password_hasher
+from monitoring.routing import InstrumentedRoute
 
 # Маршруты для пользователей
-user_router = APIRouter()
+user_router = APIRouter(route_class=InstrumentedRoute)
+
+
+def _require_self(user_id: int, current_user: int):
+    if user_id != current_user:
+        raise HTTPException(status_code=403, detail="Можно изменять только свой профиль")
+
+def _public_user(db_user) -> dict:
+    # Хэш пароля наружу не отдается
+    return {"id": db_user.id, "username": db_user.username, "avatar_url": db_user.avatar_url,
+            "followers_count": db_user.followers_count, "reviews_count": db_user.reviews_count}
+
+async def _authenticate(db: Session, username: str, password: str):
+    """
+    Проверяет пароль в пуле хэширования; устаревший хэш (или открытый текст) заменяется новым
+    """
+    db_user = await run_in_threadpool(crud.get_user_by_username, db, username=username)
+    valid, new_hash = await password_hasher.verify(password, db_user.password if db_user else None)
+    if not valid:
+        return None
+    if new_hash is not None:
+        await run_in_threadpool(crud.update_user_password, db, user_id=db_user.id, password_hash=new_hash)
+    return db_user
 
 @user_router.post("/")
-def create_user(username: str, password: str, avatar_url: Optional[str] = None, db: Session = Depends(get_db)):
+async def create_user(username: str, password: str, avatar_url: Optional[str] = None, db: Session = Depends(get_db)):
     """
     Создает нового пользователя.
 
     - **username**: Имя пользователя (обязательное).
+    - **password**: Пароль (хранится только хэш scrypt).
     - **avatar_url**: URL аватара пользователя (опционально).
     - **db**: Сессия базы данных.
-    - Возвращает созданного пользователя.
+    - Возвращает созданного пользователя и JWT (access_token, token_type), как при входе.
     - Если имя пользователя уже занято, возвращает ошибку 400 Bad Request.
+    - Если пул хэширования перегружен, возвращает ошибку 503 Service Unavailable.
     """
-    db_user = crud.get_user_by_username(db, username=username, password=password)
+    db_user = await run_in_threadpool(crud.get_user_by_username, db, username=username)
     if db_user:
         raise HTTPException(status_code=400, detail="Имя пользователя уже занято")
-    return crud.create_user(db=db, username=username, password=password, avatar_url=avatar_url)
+    password_hash = await password_hasher.hash(password)
+    db_user = await run_in_threadpool(crud.create_user, db=db, username=username, password_hash=password_hash,
+                                      avatar_url=avatar_url)
+    access_token = await jwt_manager.create_token(db_user.id)
+    return {**_public_user(db_user), "access_token": access_token, "token_type": "bearer"}
+
+@user_router.post("/login")
+async def login(username: str, password: str, db: Session = Depends(get_db)):
+    """
+    Выдает JWT для доступа к маршрутам записи.
+
+    - **username**: Имя пользователя.
+    - **password**: Пароль.
+    - **db**: Сессия базы данных.
+    - Возвращает access_token (передается в заголовке Authorization: Bearer), тип токена и идентификатор пользователя.
+    - Если имя пользователя или пароль неверны, возвращает ошибку 401 Unauthorized.
+    - Если пул хэширования перегружен, возвращает ошибку 503 Service Unavailable.
+    """
+    db_user = await _authenticate(db, username, password)
+    if db_user is None:
+        raise HTTPException(status_code=401, detail="Неверное имя пользователя или пароль")
+    access_token = await jwt_manager.create_token(db_user.id)
+    return {"access_token": access_token, "token_type": "bearer", "user_id": db_user.id}
 
 @user_router.get("/{username}")
-def read_user(username: str, password: str,  db: Session = Depends(get_db)):
+async def read_user(username: str, password: str,  db: Session = Depends(get_db)):
     """
-    Получает пользователя по его идентификатору.
+    Получает пользователя по имени и паролю.
 
-    - **username**: Идентификатор пользователя.
+    - **username**: Имя пользователя.
+    - **password**: Пароль.
     - **db**: Сессия базы данных.
-    - Возвращает пользователя.
-    - Если пользователь не найден, возвращает ошибку 404 Not Found.
+    - Возвращает пользователя (без хэша пароля).
+    - Если пользователь не найден или пароль неверен, возвращает ошибку 404 Not Found.
     """
-    db_user = crud.get_user_by_username(db, username=username, password=password)
+    db_user = await _authenticate(db, username, password)
     if db_user is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return db_user
+    return _public_user(db_user)
 
 @user_router.get("/")
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_users(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), 
+               stream: bool = Depends(stream_mode), db: Session = Depends(get_read_db)):
     """
     Получает список пользователей с пагинацией.
 
     - **skip**: Количество пользователей, которые нужно пропустить (по умолчанию 0).
-    - **limit**: Максимальное количество пользователей, которые нужно вернуть (по умолчанию 100).
+    - **limit**: Максимальное количество пользователей, которые нужно вернуть (по умолчанию 100, не больше MAX_PAGE_SIZE).
+    - **stream**: Потоковая выдача всех пользователей начиная со skip, limit не применяется (только с заголовком X-Internal-Token).
     - **db**: Сессия базы данных.
-    - Возвращает список пользователей.
+    - Возвращает список пользователей (без хэшей паролей).
     """
+    if stream:
+        return StreamingResponse(stream_query(lambda stream_db: crud.stream_users_query(stream_db, skip=skip), "json"), 
+                                 media_type=MEDIA_TYPES["json"])
     users = crud.get_users(db, skip=skip, limit=limit)
-    return users
+    return [_public_user(db_user) for db_user in users]
 
 @user_router.put("/{user_id}")
-def update_user(user_id: int, username: Optional[str] = None, avatar_url: Optional[str] = None, db: Session = Depends(get_db)):
+def update_user(user_id: int, username: Optional[str] = None, avatar_url: Optional[str] = None, 
+                current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Обновляет данные пользователя.
 
-    - **user_id**: Идентификатор пользователя.
+    - **user_id**: Идентификатор пользователя (только свой профиль).
     - **username**: Новое имя пользователя (опционально).
     - **avatar_url**: Новый URL аватара пользователя (опционально).
     - **db**: Сессия базы данных.
-    - Возвращает обновленного пользователя.
+    - Возвращает обновленного пользователя (без хэша пароля).
     - Если пользователь не найден, возвращает ошибку 404 Not Found.
+    - Если профиль чужой, возвращает ошибку 403 Forbidden.
     """
+    _require_self(user_id, current_user)
     user_data = {}
     if username is not None:
         user_data["username"] = username
@@ -73,21 +136,23 @@ def update_user(user_id: int, username: Optional[str] = None, avatar_url: Option
     updated_user = crud.update_user(db, user_id=user_id, data=user_data)
     if updated_user is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return updated_user
+    return _public_user(updated_user)
 
 @user_router.delete("/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db)):
+def delete_user(user_id: int, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет пользователя.
 
-    - **user_id**: Идентификатор пользователя.
+    - **user_id**: Идентификатор пользователя (только свой профиль).
     - **db**: Сессия базы данных.
     - Возвращает True, если пользователь успешно удален, иначе False.
+    - Если профиль чужой, возвращает ошибку 403 Forbidden.
     """
+    _require_self(user_id, current_user)
     success = crud.delete_user(db, user_id=user_id)
     return {"success": success}
 
-@user_router.post("/{user_id}/followers/increment")
+@user_router.post("/{user_id}/followers/increment", dependencies=[Depends(current_user_id)])
 def increment_user_followers(user_id: int, db: Session = Depends(get_db)):
     """
     Увеличивает счетчик подписчиков пользователя.
@@ -99,7 +164,7 @@ def increment_user_followers(user_id: int, db: Session = Depends(get_db)):
     success = crud.increment_user_followers(db, user_id=user_id)
     return {"success": success}
 
-@user_router.post("/{user_id}/followers/decrement")
+@user_router.post("/{user_id}/followers/decrement", dependencies=[Depends(current_user_id)])
 def decrement_user_followers(user_id: int, db: Session = Depends(get_db)):
     """
     Уменьшает счетчик подписчиков пользователя.
@@ -111,7 +176,7 @@ def decrement_user_followers(user_id: int, db: Session = Depends(get_db)):
     success = crud.decrement_user_followers(db, user_id=user_id)
     return {"success": success}
 
-@user_router.post("/{user_id}/reviews/increment")
+@user_router.post("/{user_id}/reviews/increment", dependencies=[Depends(current_user_id)])
 def increment_user_reviews(user_id: int, db: Session = Depends(get_db)):
     """
     Увеличивает счетчик отзывов пользователя.
@@ -1,23 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from database import crud
-from database.base import get_db
+from database.base import get_db, get_read_db
+from database.cache import result_cache, category_tag
+from database.streaming import stream_query, MEDIA_TYPES
+from config import settings
+from config.create_token_check import stream_mode
+from config.jwt_token import current_user_id, require_owner
+from monitoring.routing import InstrumentedRoute, coalesced
 
 
 # Маршруты для спортивных площадок
-venue_router = APIRouter()
+venue_router = APIRouter(route_class=InstrumentedRoute)
 
 @venue_router.post("/")
-def create_venue(name: str, address: str, owner_id: int, venue_type: str, sport_category_id: int, description: Optional[str] = None, image_url: Optional[str] = None, db: Session = Depends(get_db)):
+def create_venue(name: str, address: str, venue_type: str, sport_category_id: int, description: Optional[str] = None, image_url: Optional[str] = None, owner_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Создает новую спортивную площадку.
     
     Параметры:
     - name (str): Название площадки (обязательный).
     - address (str): Адрес площадки (обязательный).
-    - owner_id (int): Идентификатор владельца площадки (обязательный).
+    - owner_id (int): Владелец площадки - пользователь из токена авторизации.
     - venue_type (str): Тип площадки (обязательный).
     - sport_category_id (int): Идентификатор спортивной категории (обязательный).
     - description (str): Описание площадки (опционально).
@@ -39,7 +46,8 @@ def create_venue(name: str, address: str, owner_id: int, venue_type: str, sport_
     return crud.create_venue(db=db, data=venue_data)
 
 @venue_router.get("/{venue_id}")
-def read_venue(venue_id: int, db: Session = Depends(get_db)):
+@coalesced
+def read_venue(venue_id: int, db: Session = Depends(get_read_db)):
     """
     Получает спортивную площадку по ее идентификатору.
     
@@ -59,26 +67,40 @@ def read_venue(venue_id: int, db: Session = Depends(get_db)):
     return db_venue
 
 @venue_router.get("/")
-def read_venues(skip: int = 0, limit: int = 100, category_id: Optional[int] = None, venue_type: Optional[str] = None, owner_id: Optional[int] = None, db: Session = Depends(get_db)):
+@coalesced
+def read_venues(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), category_id: Optional[int] = None, venue_type: Optional[str] = None, owner_id: Optional[int] = None, 
+                stream: bool = Depends(stream_mode), db: Session = Depends(get_read_db)):
     """
     Получает список спортивных площадок с пагинацией и фильтрацией.
     
     Параметры:
     - skip (int): Количество площадок, которые нужно пропустить (по умолчанию: 0).
-    - limit (int): Максимальное количество площадок, которые нужно вернуть (по умолчанию: 100).
+    - limit (int): Максимальное количество площадок, которые нужно вернуть (по умолчанию: 100, не больше MAX_PAGE_SIZE).
     - category_id (int): Фильтр по идентификатору спортивной категории (опционально).
     - venue_type (str): Фильтр по типу площадки (опционально).
     - owner_id (int): Фильтр по идентификатору владельца площадки (опционально).
+    - stream (bool): Потоковая выдача всех площадок начиная со skip, limit не применяется (только с заголовком X-Internal-Token).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Список спортивных площадок.
     """
-    venues = crud.get_venues(db, skip=skip, limit=limit, category_id=category_id, venue_type=venue_type, owner_id=owner_id)
-    return venues
+    if stream:
+        def build_query(stream_db: Session):
+            return crud.stream_venues_query(stream_db, skip=skip, category_id=category_id, venue_type=venue_type, owner_id=owner_id)
+        return StreamingResponse(stream_query(build_query, "json"), media_type=MEDIA_TYPES["json"])
+    return cached_venues(db, skip=skip, limit=limit, category_id=category_id, venue_type=venue_type, owner_id=owner_id)
+
+def cached_venues(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, venue_type: Optional[str] = None, owner_id: Optional[int] = None):
+    """
+    Страница площадок через кэш результатов (GET /venues/ и прогрев): ключ и загрузка из одних параметров
+    """
+    params = dict(skip=skip, limit=limit, category_id=category_id, venue_type=venue_type, owner_id=owner_id)
+    return result_cache.get_or_load("venues", params, lambda session: crud.get_venues(session, **params),
+                                    [category_tag("venues", category_id)], db)
 
 @venue_router.put("/{venue_id}")
-def update_venue(venue_id: int, name: Optional[str] = None, address: Optional[str] = None, owner_id: Optional[int] = None, venue_type: Optional[str] = None, sport_category_id: Optional[int] = None, description: Optional[str] = None, image_url: Optional[str] = None, db: Session = Depends(get_db)):
+def update_venue(venue_id: int, name: Optional[str] = None, address: Optional[str] = None, venue_type: Optional[str] = None, sport_category_id: Optional[int] = None, description: Optional[str] = None, image_url: Optional[str] = None, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Обновляет данные спортивной площадки.
     
@@ -86,11 +108,11 @@ def update_venue(venue_id: int, name: Optional[str] = None, address: Optional[st
     - venue_id (int): Идентификатор спортивной площадки.
     - name (str): Новое название площадки (опционально).
     - address (str): Новый адрес площадки (опционально).
-    - owner_id (int): Новый идентификатор владельца площадки (опционально).
     - venue_type (str): Новый тип площадки (опционально).
     - sport_category_id (int): Новый идентификатор спортивной категории (опционально).
     - description (str): Новое описание площадки (опционально).
     - image_url (str): Новый URL изображения площадки (опционально).
+    - current_user (int): Пользователь из токена авторизации (только владелец площадки).
     - db (Session): Сессия базы данных.
     
     Возвращает:
@@ -98,14 +120,14 @@ def update_venue(venue_id: int, name: Optional[str] = None, address: Optional[st
     
     Исключения:
     - HTTPException (status_code=404): Если спортивная площадка не найдена.
+    - HTTPException (status_code=403): Если площадка чужая.
     """
+    require_owner(crud.get_venue_owner(db, venue_id), current_user, "Спортивная площадка не найдена")
     venue_data = {}
     if name is not None:
         venue_data["name"] = name
     if address is not None:
         venue_data["address"] = address
-    if owner_id is not None:
-        venue_data["owner_id"] = owner_id
     if venue_type is not None:
         venue_data["venue_type"] = venue_type
     if sport_category_id is not None:
@@ -121,28 +143,31 @@ def update_venue(venue_id: int, name: Optional[str] = None, address: Optional[st
     return updated_venue
 
 @venue_router.delete("/{venue_id}")
-def delete_venue(venue_id: int, db: Session = Depends(get_db)):
+def delete_venue(venue_id: int, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет спортивную площадку.
     
     Параметры:
     - venue_id (int): Идентификатор спортивной площадки.
+    - current_user (int): Пользователь из токена авторизации (только владелец площадки).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Словарь с ключом "success" и значением True, если спортивная площадка успешно удалена, иначе False.
+    - Если площадка чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_venue_owner(db, venue_id), current_user, "Спортивная площадка не найдена")
     success = crud.delete_venue(db, venue_id=venue_id)
     return {"success": success}
 
 @venue_router.post("/{venue_id}/like")
-def like_venue(venue_id: int, user_id: int, db: Session = Depends(get_db)):
+def like_venue(venue_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Добавляет лайк к спортивной площадке от пользователя.
     
     Параметры:
     - venue_id (int): Идентификатор спортивной площадки.
-    - user_id (int): Идентификатор пользователя, который ставит лайк.
+    - user_id (int): Пользователь, который ставит лайк (из токена авторизации).
     - db (Session): Сессия базы данных.
     
     Возвращает:
@@ -152,13 +177,13 @@ def like_venue(venue_id: int, user_id: int, db: Session = Depends(get_db)):
     return like
 
 @venue_router.delete("/{venue_id}/like")
-def unlike_venue(venue_id: int, user_id: int, db: Session = Depends(get_db)):
+def unlike_venue(venue_id: int, user_id: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет лайк пользователя от спортивной площадки.
     
     Параметры:
     - venue_id (int): Идентификатор спортивной площадки.
-    - user_id (int): Идентификатор пользователя, который удаляет лайк.
+    - user_id (int): Пользователь, который удаляет лайк (из токена авторизации).
     - db (Session): Сессия базы данных.
     
     Возвращает:
@@ -168,7 +193,7 @@ def unlike_venue(venue_id: int, user_id: int, db: Session = Depends(get_db)):
     return {"success": success}
 
 @venue_router.post("/{venue_id}/time-slots")
-def create_time_slot(venue_id: int, start_time: datetime, end_time: datetime, date: Optional[datetime] = None, is_available: bool = True, db: Session = Depends(get_db)):
+def create_time_slot(venue_id: int, start_time: datetime, end_time: datetime, date: Optional[datetime] = None, is_available: bool = True, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Создает временной слот для спортивной площадки.
     
@@ -178,16 +203,20 @@ def create_time_slot(venue_id: int, start_time: datetime, end_time: datetime, da
     - end_time (datetime): Время окончания слота.
     - date (datetime): Дата слота (опционально, по умолчанию: дата из start_time).
     - is_available (bool): Флаг доступности слота (по умолчанию: True).
+    - current_user (int): Пользователь из токена авторизации (только владелец площадки).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Созданный временной слот.
+    - Если площадка чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_venue_owner(db, venue_id), current_user, "Спортивная площадка не найдена")
     time_slot = crud.create_time_slot(db, venue_id=venue_id, start_time=start_time, end_time=end_time, date=date, is_available=is_available)
     return time_slot
 
 @venue_router.get("/{venue_id}/time-slots")
-def read_venue_time_slots(venue_id: int, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, is_available: Optional[bool] = None, db: Session = Depends(get_db)):
+def read_venue_time_slots(venue_id: int, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, is_available: Optional[bool] = None, 
+                          skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=settings.MAX_PAGE_SIZE), db: Session = Depends(get_read_db)):
     """
     Получает временные слоты для спортивной площадки с фильтрацией.
     
@@ -196,16 +225,19 @@ def read_venue_time_slots(venue_id: int, start_date: Optional[datetime] = None,
     - start_date (datetime): Фильтр по начальной дате слотов (опционально).
     - end_date (datetime): Фильтр по конечной дате слотов (опционально).
     - is_available (bool): Фильтр по доступности слотов (опционально).
+    - skip (int): Количество слотов, которые нужно пропустить (по умолчанию: 0).
+    - limit (int): Максимальное количество слотов, которые нужно вернуть (по умолчанию: 100, не больше MAX_PAGE_SIZE).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Список временных слотов.
     """
-    time_slots = crud.get_venue_time_slots(db, venue_id=venue_id, start_date=start_date, end_date=end_date, is_available=is_available)
+    time_slots = crud.get_venue_time_slots(db, venue_id=venue_id, start_date=start_date, end_date=end_date, is_available=is_available, 
+                                           skip=skip, limit=limit)
     return time_slots
 
 @venue_router.put("/time-slots/{time_slot_id}")
-def update_time_slot(time_slot_id: int, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, date: Optional[datetime] = None, is_available: Optional[bool] = None, db: Session = Depends(get_db)):
+def update_time_slot(time_slot_id: int, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, date: Optional[datetime] = None, is_available: Optional[bool] = None, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Обновляет данные временного слота.
     
@@ -215,12 +247,15 @@ def update_time_slot(time_slot_id: int, start_time: Optional[datetime] = None, e
     - end_time (datetime): Новое время окончания слота (опционально).
     - date (datetime): Новая дата слота (опционально).
     - is_available (bool): Новый флаг доступности слота (опционально).
+    - current_user (int): Пользователь из токена авторизации (только владелец площадки).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Обновленный временной слот.
     - Если временной слот не найден, возвращает None.
+    - Если площадка чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_time_slot_owner(db, time_slot_id), current_user, "Временной слот не найден")
     time_slot_data = {}
     if start_time is not None:
         time_slot_data["start_time"] = start_time
@@ -235,22 +270,25 @@ def update_time_slot(time_slot_id: int, start_time: Optional[datetime] = None, e
     return updated_time_slot
 
 @venue_router.delete("/time-slots/{time_slot_id}")
-def delete_time_slot(time_slot_id: int, db: Session = Depends(get_db)):
+def delete_time_slot(time_slot_id: int, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Удаляет временной слот.
     
     Параметры:
     - time_slot_id (int): Идентификатор временного слота.
+    - current_user (int): Пользователь из токена авторизации (только владелец площадки).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Словарь с ключом "success" и значением True, если временной слот успешно удален, иначе False.
+    - Если площадка чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_time_slot_owner(db, time_slot_id), current_user, "Временной слот не найден")
     success = crud.delete_time_slot(db, time_slot_id=time_slot_id)
     return {"success": success}
 
 @venue_router.post("/{venue_id}/services")
-def create_venue_service(venue_id: int, name: str, price: float, description: Optional[str] = None, is_active: bool = True, db: Session = Depends(get_db)):
+def create_venue_service(venue_id: int, name: str, price: float, description: Optional[str] = None, is_active: bool = True, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
     """
     Создает услугу для спортивной площадки.
     
@@ -260,15 +298,18 @@ def create_venue_service(venue_id: int, name: str, price: float, description: Op
     - price (float): Цена услуги (обязательный).
     - description (str): Описание услуги (опционально).
     - is_active (bool): Флаг активности услуги (по умолчанию: True).
+    - current_user (int): Пользователь из токена авторизации (только владелец площадки).
     - db (Session): Сессия базы данных.
     
     Возвращает:
     - Созданную услугу.
+    - Если площадка чужая, возвращает ошибку 403 Forbidden.
     """
+    require_owner(crud.get_venue_owner(db, venue_id), current_user, "Спортивная площадка не найдена")
     return crud.create_venue_service(db, venue_id=venue_id, name=name, price=price, description=description, is_active=is_active)
 
 @venue_router.get("/{venue_id}/services")
-def read_venue_services(venue_id: int, is_active: Optional[bool] = None, db: Session = Depends(get_db)):
+def read_venue_services(venue_id: int, is_active: Optional[bool] = None, db: Session = Depends(get_read_db)):
     """
     Получает услуги для спортивной площадки с фильтрацией.
     
@@ -284,7 +325,7 @@ def read_venue_services(venue_id: int, is_active: Optional[bool] = None, db: Ses
     return services
 
 @venue_router.put("/services/{service_id}")
-def update_venue_service(service_id: int, name: Optional[str] = None, price: Optional[float] = None, description: Optional[str] = None, is_active: Optional[bool] = None, db: Session = Depends(get_db)):
+def update_venue_service(service_id: int, name: Optional[str] = None, price: Optional[float] = None, description: Optional[str] = None, is_active: Optional[bool] = None, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
    """
    Обновляет данные услуги спортивной площадки.
    
@@ -294,12 +335,15 @@ def update_venue_service(service_id: int, name: Optional[str] = None, price: Opt
    - price (float): Новая цена услуги (опционально).
    - description (str): Новое описание услуги (опционально).
    - is_active (bool): Новый флаг активности услуги (опционально).
+   - current_user (int): Пользователь из токена авторизации (только владелец площадки).
    - db (Session): Сессия базы данных.
    
    Возвращает:
    - Обновленную услугу.
    - Если услуга не найдена, возвращает None.
+   - Если площадка чужая, возвращает ошибку 403 Forbidden.
    """
+   require_owner(crud.get_venue_service_owner(db, service_id), current_user, "Услуга не найдена")
    service_data = {}
    if name is not None:
        service_data["name"] = name
@@ -314,16 +358,19 @@ def update_venue_service(service_id: int, name: Optional[str] = None, price: Opt
    return updated_service
 
 @venue_router.delete("/services/{service_id}")
-def delete_venue_service(service_id: int, db: Session = Depends(get_db)):
+def delete_venue_service(service_id: int, current_user: int = Depends(current_user_id), db: Session = Depends(get_db)):
    """
    Удаляет услугу спортивной площадки.
    
    Параметры:
    - service_id (int): Идентификатор услуги.
+   - current_user (int): Пользователь из токена авторизации (только владелец площадки).
    - db (Session): Сессия базы данных.
    
    Возвращает:
    - Словарь с ключом "success" и значением True, если услуга успешно удалена, иначе False.
+   - Если площадка чужая, возвращает ошибку 403 Forbidden.
    """
+   require_owner(crud.get_venue_service_owner(db, service_id), current_user, "Услуга не найдена")
    success = crud.delete_venue_service(db, service_id=service_id)
    return {"success": success}
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+# Окружение задается до импорта приложения: настройки читаются при импорте config.settings
+TEST_DIR = tempfile.mkdtemp()
+os.environ.setdefault("SNAPSHOT_PATH", os.path.join(TEST_DIR, "reference.snapshot"))
+os.environ.setdefault("WARMUP_ENABLED", "false")
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+import database.base as base
+
+# База SQLite в файле: у обработчиков и фоновых задач lifespan свои соединения из пула
+engine = create_engine(f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}", connect_args={"check_same_thread": False})
+base.engine = engine
+base.SessionLocal.configure(bind=engine)
+
+import main  # noqa: E402
+from database import models  # noqa: E402
+from database.cache import result_cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    base.Base.metadata.create_all(engine)
+    yield
+    result_cache.clear()
+    base.Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def app():
+    return main.app
+
+
+@pytest.fixture
+def client(app):
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    session = base.SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def auth_headers(client):
+    """
+    Регистрирует пользователя и возвращает заголовки с его токеном
+    """
+    def register(username: str = "user") -> dict:
+        response = client.post("/users/", params={"username": username, "password": "password"})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return register
+
+
+@pytest.fixture
+def category(db):
+    db_category = models.SportCategory(name="Футбол")
+    db.add(db_category)
+    db.commit()
+    return db_category.id
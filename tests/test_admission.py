@@ -0,0 +1,22 @@
+import asyncio
+from middleware.admission import HIGH, LOW, AdaptiveLimiter
+
+
+def test_eviction_skips_waiter_that_already_timed_out():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", target_latency=1, initial=1, min_limit=1, max_limit=1,
+                                  queue_size=1, queue_timeout=5)
+        assert await limiter.acquire(HIGH)
+        low = asyncio.ensure_future(limiter.acquire(LOW))
+        await asyncio.sleep(0)
+        # Ожидание завершилось (как при таймауте wait_for), но задача еще не убрала себя из очереди
+        limiter._waiters[0][2].cancel()
+
+        high = asyncio.ensure_future(limiter.acquire(HIGH))
+        await asyncio.sleep(0)
+        limiter.release()
+        admitted = await high
+        low.cancel()
+        return admitted
+
+    assert asyncio.run(scenario()) is True
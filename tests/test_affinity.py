@@ -0,0 +1,40 @@
+from sqlalchemy.orm import Session
+from database import crud, models
+from database.affinity import affinity_points
+from database.base import engine
+from config import settings
+
+
+def affinity(db, user_id, category_id):
+    db.expire_all()
+    row = db.get(models.UserCategoryAffinity, (user_id, category_id))
+    return row.score if row is not None else "missing"
+
+
+def test_likes_add_and_remove_affinity(db, category):
+    items = [crud.create_feed_item(db, title=f"Новость {index}", category_id=category) for index in range(2)]
+    likes = [crud.like_feed_item(db, item.id, 1) for item in items]
+
+    expected = crud._log_add(*(affinity_points(settings.AFFINITY_LIKE_WEIGHT, like.created_at) for like in likes))
+    assert abs(affinity(db, 1, category) - expected) < 1e-9
+
+    crud.unlike_feed_item(db, items[0].id, 1)
+    assert abs(affinity(db, 1, category) - affinity_points(settings.AFFINITY_LIKE_WEIGHT, likes[1].created_at)) < 1e-9
+    # Удалены все действия: строка остается с NULL и не попадает в ленту
+    crud.unlike_feed_item(db, items[1].id, 1)
+    assert affinity(db, 1, category) is None
+    assert crud.get_personal_feed(db, 1) == crud.get_personal_feed(db, 2)
+
+    like = crud.like_feed_item(db, items[0].id, 1)
+    assert abs(affinity(db, 1, category) - affinity_points(settings.AFFINITY_LIKE_WEIGHT, like.created_at)) < 1e-9
+
+
+def test_affinity_hook_only_on_app_sessions(db, category):
+    item = crud.create_feed_item(db, title="Новость", category_id=category)
+
+    # Сессии вне SessionLocal (скрипты, сиды) интерес не пересчитывают
+    with Session(engine) as other:
+        other.add(models.FeedLike(feed_item_id=item.id, user_id=1))
+        other.commit()
+
+    assert affinity(db, 1, category) == "missing"
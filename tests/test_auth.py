@@ -0,0 +1,102 @@
+from datetime import datetime
+import pytest
+from config.create_token_check import TOKEN_CHECK
+from database import models
+
+
+@pytest.fixture
+def owned(client, auth_headers, category):
+    """
+    Площадка, слот, бронирование и команда пользователя owner; второй пользователь - other
+    """
+    owner = auth_headers("owner")
+    other = auth_headers("other")
+    venue = client.post("/venues/", params={"name": "Стадион", "address": "Адрес", "venue_type": "outdoor",
+                                            "sport_category_id": category}, headers=owner).json()
+    slot = client.post(f"/venues/{venue['id']}/time-slots", params={
+        "start_time": datetime(2030, 1, 1, 10).isoformat(), "end_time": datetime(2030, 1, 1, 11).isoformat()}, headers=owner).json()
+    booking = client.post("/bookings/", params={"venue_id": venue["id"], "time_slot_id": slot["id"]}, headers=owner).json()
+    team = client.post("/teams/", params={"name": "Команда", "sport_category_id": category}, headers=owner).json()
+    return owner, other, venue["id"], slot["id"], booking["id"], team["id"]
+
+
+def test_write_routes_require_token(client, owned):
+    *_, venue_id, slot_id, booking_id, team_id = owned
+
+    assert client.put(f"/venues/{venue_id}", params={"name": "Чужое"}).status_code in (401, 403)
+    assert client.put(f"/bookings/{booking_id}", params={"status": "paid"}).status_code in (401, 403)
+    assert client.post("/events/1/like").status_code in (401, 403)
+
+
+def test_non_owner_gets_403(client, db, owned):
+    owner, other, venue_id, slot_id, booking_id, team_id = owned
+    other_id = 2
+
+    forbidden = [
+        client.put(f"/venues/{venue_id}", params={"name": "Чужое", "owner_id": other_id}, headers=other),
+        client.delete(f"/venues/{venue_id}", headers=other),
+        client.post(f"/venues/{venue_id}/time-slots", params={
+            "start_time": datetime(2030, 1, 2).isoformat(), "end_time": datetime(2030, 1, 2, 1).isoformat()}, headers=other),
+        client.delete(f"/venues/time-slots/{slot_id}", headers=other),
+        client.put(f"/bookings/{booking_id}", params={"status": "cancelled"}, headers=other),
+        client.put(f"/teams/{team_id}", params={"name": "Чужая"}, headers=other),
+        client.post(f"/teams/{team_id}/members", params={"user_id": other_id}, headers=other),
+        client.put(f"/teams/{team_id}/stats", params={"wins": 100}, headers=other),
+        client.delete(f"/teams/{team_id}/members/1", headers=other),
+    ]
+
+    assert [response.status_code for response in forbidden] == [403] * len(forbidden)
+    db.expire_all()
+    venue = db.get(models.Venue, venue_id)
+    assert (venue.name, venue.owner_id) == ("Стадион", 1)
+    assert db.get(models.Booking, booking_id).status == "created"
+    assert db.get(models.Team, team_id).name == "Команда"
+    # Владелец по-прежнему может менять свои объекты
+    assert client.put(f"/venues/{venue_id}", params={"name": "Новое"}, headers=owner).json()["name"] == "Новое"
+    assert client.put(f"/bookings/{booking_id}", params={"status": "paid"}, headers=owner).json()["status"] == "paid"
+    assert client.put("/venues/999", params={"name": "Нет"}, headers=owner).status_code == 404
+
+
+def test_member_can_leave_team_and_owner_approves_requests(client, owned):
+    owner, other, *_, team_id = owned
+    request_id = client.post(f"/teams/{team_id}/requests", headers=other).json()["id"]
+
+    assert client.put(f"/teams/requests/{request_id}", params={"status": "accepted"}, headers=other).status_code == 403
+    assert client.put(f"/teams/requests/{request_id}", params={"status": "accepted"}, headers=owner).status_code == 200
+    assert client.delete(f"/teams/{team_id}/members/2", headers=other).json() == {"success": True}
+
+
+def test_feed_and_category_writes_require_internal_token(client, auth_headers, category):
+    headers = auth_headers("user")
+
+    assert client.post("/feed/", params={"title": "Новость", "category_id": category}, headers=headers).status_code == 403
+    assert client.post("/sport-categories/", params={"name": "Хоккей"}, headers=headers).status_code == 403
+    created = client.post("/feed/", params={"title": "Новость", "category_id": category},
+                          headers={"X-Internal-Token": TOKEN_CHECK})
+    assert created.status_code == 200, created.text
+
+
+def test_event_and_service_writes_check_owner(client, db, owned, category):
+    owner, other, venue_id, slot_id, *_ = owned
+    # Организатор берется из токена: owner_id в параметрах не подменяет его
+    event = client.post("/events/", params={"title": "Матч", "description": "", "sport_category_id": category,
+                                            "event_date": datetime(2030, 1, 1).isoformat(), "owner_id": 2},
+                        headers=owner).json()
+    service = client.post(f"/venues/{venue_id}/services", params={"name": "Мяч", "price": 100}, headers=owner).json()
+
+    forbidden = [
+        client.put(f"/events/{event['id']}", params={"title": "Чужое"}, headers=other),
+        client.delete(f"/events/{event['id']}", headers=other),
+        client.post(f"/venues/{venue_id}/services", params={"name": "Душ", "price": 1}, headers=other),
+        client.put(f"/venues/services/{service['id']}", params={"price": 1}, headers=other),
+        client.delete(f"/venues/services/{service['id']}", headers=other),
+        client.put(f"/venues/time-slots/{slot_id}", params={"is_available": True}, headers=other),
+    ]
+
+    assert event["owner_id"] == 1
+    assert [response.status_code for response in forbidden] == [403] * len(forbidden)
+    db.expire_all()
+    assert db.get(models.Event, event["id"]).title == "Матч"
+    assert db.get(models.VenueService, service["id"]).price == 100
+    assert client.delete(f"/events/{event['id']}", headers=owner).status_code == 200
+    assert client.delete(f"/events/{event['id']}", headers=owner).status_code == 404
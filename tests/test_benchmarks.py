@@ -0,0 +1,43 @@
+import csv
+import io
+import random
+from benchmarks.report import build_report, compare, percentile
+from benchmarks.seed import TABLES, RowStream, scaled_volumes
+from benchmarks.workload import Recorder
+
+
+def test_generators_match_copy_columns():
+    volumes = scaled_volumes(0.0001)
+
+    for table, columns, generator in TABLES:
+        stream = RowStream(generator(volumes, random.Random(42)))
+        # Маленькие порции: строка CSV может разрываться между вызовами read
+        data = b"".join(iter(lambda: stream.read(7), b"")).decode()
+        rows = list(csv.reader(io.StringIO(data)))
+        assert rows and all(len(row) == len(columns) for row in rows), table
+    assert (volumes["users"], volumes["bookings"]) == (100, 500)
+
+
+def test_row_stream_encodes_csv_values():
+    stream = RowStream(iter([(1, 'Матч "Финал"', None, True, 2.5)]))
+
+    assert stream.read().decode() == '1,"Матч ""Финал""",,t,2.5\n'
+    assert stream.read() == b""
+
+
+def test_report_percentiles_and_regressions():
+    recorder = Recorder()
+    for index in range(100):
+        recorder.record("GET /events/", (index + 1) / 1000, 200)
+    recorder.record("POST /bookings/", 0.5, 503)
+
+    report = build_report(recorder, elapsed=10.0, meta={"revision": "abc"})
+
+    assert percentile([], 0.5) == 0.0
+    assert report["routes"]["GET /events/"]["p50_ms"] == 50.0
+    assert report["routes"]["GET /events/"]["p99_ms"] == 99.0
+    assert report["total"] == {"requests": 101, "throughput_rps": 10.1, "errors": 1}
+    slower = {"routes": {route: dict(stats, p95_ms=stats["p95_ms"] * 2) for route, stats in report["routes"].items()}}
+    assert compare(report, slower) == ["GET /events/ p95_ms: 95.0 -> 190.0 (+100%)",
+                                       "POST /bookings/ p95_ms: 500.0 -> 1000.0 (+100%)"]
+    assert compare(report, report) == []
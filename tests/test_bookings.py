@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+import pytest
+from database import models
+from database.holds import get_hold_store, sweep_once
+
+
+@pytest.fixture
+def slots(db):
+    venue = models.Venue(name="Стадион")
+    db.add(venue)
+    db.flush()
+    start = datetime(2030, 1, 1, 10)
+    db_slots = [models.TimeSlot(venue_id=venue.id, start_time=start + timedelta(hours=hour),
+                                end_time=start + timedelta(hours=hour + 1)) for hour in range(3)]
+    db.add_all(db_slots)
+    db.commit()
+    return venue.id, [slot.id for slot in db_slots]
+
+
+def test_booking_releases_checkout_holds(client, auth_headers, slots):
+    venue_id, (single, *batch) = slots
+    headers = auth_headers("user")
+    store = get_hold_store()
+    for slot_id in (single, *batch):
+        assert client.post("/bookings/holds", params={"time_slot_id": slot_id}, headers=headers).status_code == 200
+
+    booked = client.post("/bookings/", params={"venue_id": venue_id, "time_slot_id": single}, headers=headers)
+    booked_batch = client.post("/bookings/batch", params={"venue_id": venue_id, "time_slot_ids": batch}, headers=headers)
+
+    assert booked.status_code == 200, booked.text
+    assert booked_batch.status_code == 200, booked_batch.text
+    # Занятый слот держит строка бронирования, а не удержание в хранилище
+    assert [store.owner(slot_id) for slot_id in (single, *batch)] == [None, None, None]
+    other = auth_headers("other")
+    assert client.post("/bookings/", params={"venue_id": venue_id, "time_slot_id": single}, headers=other).json() is None
+    assert client.post("/bookings/holds", params={"time_slot_id": single}, headers=other).status_code != 200
+
+
+def test_swept_booking_cannot_be_paid(client, auth_headers, db, slots):
+    venue_id, (slot_id, *_) = slots
+    headers = auth_headers("user")
+    booking_id = client.post("/bookings/", params={"venue_id": venue_id, "time_slot_id": slot_id}, headers=headers).json()["id"]
+    db.query(models.Booking).update({models.Booking.booking_date: datetime(2000, 1, 1)})
+    db.commit()
+
+    assert sweep_once() == 1
+    rebooked = client.post("/bookings/", params={"venue_id": venue_id, "time_slot_id": slot_id}, headers=auth_headers("other"))
+    paid = client.put(f"/bookings/{booking_id}", params={"status": "paid"}, headers=headers)
+    cancelled = client.put(f"/bookings/{booking_id}", params={"status": "cancelled"}, headers=headers)
+
+    assert rebooked.json()["time_slot_id"] == slot_id
+    assert paid.status_code == 409
+    assert cancelled.status_code == 409
+    # Повторная отмена не освобождает слот, занятый новым бронированием
+    db.expire_all()
+    assert db.get(models.TimeSlot, slot_id).is_available is False
+    assert client.put("/bookings/999", params={"status": "paid"}, headers=headers).status_code == 404
+
+
+def test_batch_booking_totals_services_and_rolls_back(client, auth_headers, db, slots):
+    venue_id, (first, second, third) = slots
+    services = [models.VenueService(venue_id=venue_id, name=name, price=price) for name, price in (("Мяч", 100), ("Душ", 250))]
+    db.add_all(services)
+    db.commit()
+    headers = auth_headers("user")
+
+    booked = client.post("/bookings/batch", params={"venue_id": venue_id, "time_slot_ids": [first, second],
+                                                    "service_ids": [service.id for service in services]}, headers=headers)
+    # Второй слот уже занят: свободный третий не должен остаться занятым
+    conflict = client.post("/bookings/batch", params={"venue_id": venue_id, "time_slot_ids": [second, third]},
+                           headers=auth_headers("other"))
+
+    assert booked.status_code == 200, booked.text
+    assert booked.json()["total_price"] == 350
+    assert (booked.json()["time_slot_ids"], len(booked.json()["service_ids"])) == ([first, second], 2)
+    assert conflict.status_code == 409
+    db.expire_all()
+    assert db.get(models.TimeSlot, third).is_available is True
+    assert db.query(models.Booking).count() == 1
+    assert db.query(models.BookingTimeSlot).count() == 2
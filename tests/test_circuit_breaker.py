@@ -0,0 +1,50 @@
+import time
+import pytest
+from sqlalchemy.exc import OperationalError
+from config import settings
+from database import crud
+from database.circuit_breaker import CLOSED, breakers
+
+
+@pytest.fixture
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(breakers, "_breakers", {})
+    monkeypatch.setattr(settings, "DB_BREAKER_MIN_REQUESTS", 3)
+    monkeypatch.setattr(settings, "DB_BREAKER_OPEN_SECONDS", 0.3)
+
+
+def test_breaker_opens_and_returns_503(client, monkeypatch, fresh_breakers):
+    calls = []
+
+    def failing_get_event(db, event_id):
+        calls.append(event_id)
+        raise OperationalError("SELECT", {}, Exception("canceling statement due to statement timeout"))
+
+    original = crud.get_event
+    monkeypatch.setattr(crud, "get_event", failing_get_event)
+
+    failures = [client.get("/events/1") for _ in range(3)]
+    rejected = client.get("/events/1")
+
+    assert [response.status_code for response in failures] == [503] * 3
+    assert all("Retry-After" in response.headers for response in failures)
+    # Открытый автомат отвечает 503 без обращения к базе
+    assert rejected.status_code == 503
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert len(calls) == 3
+    assert breakers.states()["GET /events/{event_id}"] == "open"
+    # Автоматы свои у каждого маршрута
+    assert client.get("/events/").status_code == 200
+
+    # После паузы пробный запрос проходит и закрывает автомат
+    monkeypatch.setattr(crud, "get_event", original)
+    time.sleep(settings.DB_BREAKER_OPEN_SECONDS + 0.1)
+    assert client.get("/events/1").status_code == 404
+    assert breakers.states()["GET /events/{event_id}"] == CLOSED
+
+
+def test_not_found_does_not_open_breaker(client, fresh_breakers):
+    for _ in range(5):
+        assert client.get("/events/999").status_code == 404
+
+    assert breakers.states()["GET /events/{event_id}"] == CLOSED
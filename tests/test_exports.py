@@ -0,0 +1,24 @@
+from datetime import datetime
+
+
+def test_exports_only_for_owner(client, auth_headers, category):
+    owner = auth_headers("owner")
+    other = auth_headers("other")
+    venue_id = client.post("/venues/", params={"name": "Стадион", "address": "Адрес", "venue_type": "outdoor",
+                                               "sport_category_id": category}, headers=owner).json()["id"]
+    slot_id = client.post(f"/venues/{venue_id}/time-slots", params={
+        "start_time": datetime(2030, 1, 1, 10).isoformat(), "end_time": datetime(2030, 1, 1, 11).isoformat()}, headers=owner).json()["id"]
+    client.post("/bookings/", params={"venue_id": venue_id, "time_slot_id": slot_id}, headers=other)
+    event_id = client.post("/events/", params={"title": "Матч", "description": "", "sport_category_id": category,
+                                               "event_date": datetime(2030, 1, 1).isoformat(), "available_seats": 5},
+                           headers=owner).json()["id"]
+    client.post(f"/events/{event_id}/register", headers=other)
+    exports = [f"/bookings/venues/{venue_id}/export", f"/events/{event_id}/registrations/export"]
+
+    for url in exports:
+        assert client.get(url).status_code in (401, 403)
+        assert client.get(url, headers=other).status_code == 403
+        response = client.get(url, params={"format": "ndjson"}, headers=owner)
+        assert response.status_code == 200, response.text
+        assert len(response.text.splitlines()) == 1
+    assert client.get("/bookings/venues/999/export", headers=owner).status_code == 404
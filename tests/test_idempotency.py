@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from config.jwt_token import jwt_manager
+from database import models
+from middleware.idempotency import IN_PROGRESS, IdempotencyMiddleware, MemoryIdempotencyStore, Record
+
+
+def test_booking_replayed_with_same_key(client, auth_headers, db):
+    venue = models.Venue(name="Стадион")
+    db.add(venue)
+    db.flush()
+    db_slots = [models.TimeSlot(venue_id=venue.id, start_time=datetime(2030, 1, 1, hour), end_time=datetime(2030, 1, 1, hour + 1))
+                for hour in (10, 11)]
+    db.add_all(db_slots)
+    db.commit()
+    venue_id, (first, second) = venue.id, [slot.id for slot in db_slots]
+    headers = dict(auth_headers("user"), **{"Idempotency-Key": "checkout-1"})
+
+    created = client.post("/bookings/", params={"venue_id": venue_id, "time_slot_id": first}, headers=headers)
+    replayed = client.post("/bookings/", params={"venue_id": venue_id, "time_slot_id": first}, headers=headers)
+    mismatch = client.post("/bookings/", params={"venue_id": venue_id, "time_slot_id": second}, headers=headers)
+    # Ключ действует в пределах пользователя
+    other = client.post("/bookings/", params={"venue_id": venue_id, "time_slot_id": second},
+                        headers=dict(auth_headers("other"), **{"Idempotency-Key": "checkout-1"}))
+
+    assert created.status_code == 200, created.text
+    assert (replayed.status_code, replayed.json()) == (200, created.json())
+    assert replayed.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in created.headers
+    assert mismatch.status_code == 422
+    assert other.status_code == 200 and other.json()["time_slot_id"] == second
+    assert db.query(models.Booking).count() == 2
+
+
+def test_server_errors_are_not_stored():
+    calls = []
+
+    async def book(request):
+        calls.append(request.url.path)
+        return JSONResponse({"call": len(calls)}, status_code=503 if len(calls) == 1 else 200)
+    app = IdempotencyMiddleware(Starlette(routes=[Route("/bookings/", book, methods=["POST"])]))
+    headers = {"Authorization": f"Bearer {jwt_manager.encode_token(1)}", "Idempotency-Key": "retry"}
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return [(await client.post("/bookings/", headers=headers)) for _ in range(3)]
+    failed, retried, replayed = asyncio.run(run())
+
+    # 503 не сохраняется: повтор выполняется заново, а его успешный ответ уже повторяется из хранилища
+    assert [response.status_code for response in (failed, retried, replayed)] == [503, 200, 200]
+    assert replayed.json() == retried.json() == {"call": 2}
+    assert len(calls) == 2
+
+
+def test_only_owner_abandons_key():
+    store = MemoryIdempotencyStore(max_items=10)
+    store.begin("key", Record(IN_PROGRESS, "fingerprint", owner="first"), ttl=30)
+
+    store.abandon("key", "second")
+    assert store.get("key").owner == "first"
+    store.abandon("key", "first")
+    assert store.get("key") is None
@@ -0,0 +1,70 @@
+import json
+from types import SimpleNamespace
+from sqlalchemy import text
+from database import cache, invalidation, models
+from database.base import engine
+
+
+class NotifyConnection:
+    """
+    Соединение драйвера с уже полученными уведомлениями (как psycopg2 после poll)
+    """
+
+    def __init__(self, *payloads):
+        self.notifies = [SimpleNamespace(payload=payload) for payload in payloads]
+        self.polled = 0
+
+    def poll(self):
+        self.polled += 1
+
+
+def message(origin, tags):
+    return json.dumps({"origin": origin, "tags": tags})
+
+
+def test_drain_skips_own_and_malformed_messages():
+    connection = NotifyConnection(
+        message("other-worker", ["events:category:1", "events"]),
+        message(invalidation.ORIGIN, ["venues:category:2"]),
+        "not json",
+        message("third-worker", ["events", "teams"]),
+    )
+
+    assert invalidation._drain(connection) == {"events:category:1", "events", "teams"}
+    assert (connection.polled, connection.notifies) == (1, [])
+
+
+def test_payload_round_trip_and_overflow():
+    tags = {"events:category:1", "events", "venues:category:*"}
+
+    assert json.loads(invalidation._payload(tags)) == {"origin": invalidation.ORIGIN, "tags": sorted(tags)}
+    # Слишком длинный список тегов заменяется пространствами имен: инвалидация шире, но не теряется
+    many = {f"events:category:{index}" for index in range(2000)} | {"teams:category:1"}
+    payload = invalidation._payload(many)
+    assert len(payload) <= invalidation.MAX_PAYLOAD
+    assert json.loads(payload)["tags"] == ["events", "teams"]
+    assert invalidation._drain(NotifyConnection(payload.replace(invalidation.ORIGIN, "other"))) == {"events", "teams"}
+
+
+def test_publish_is_noop_without_postgres(db, monkeypatch):
+    monkeypatch.setattr(invalidation.settings, "CACHE_INVALIDATION_NOTIFY", True)
+
+    invalidation.publish(db, {"events"})
+
+    assert invalidation.enabled("sqlite") is False
+    assert invalidation.enabled("postgresql") is True
+
+
+def test_notification_from_other_worker_evicts_cached_list(client, category):
+    assert client.get("/events/").json() == []
+    # Запись другого процесса: мимо сессий этого процесса, локальная инвалидация не срабатывает
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO events (title, sport_category_id, event_date, likes_count, views_count) "
+                                "VALUES ('Матч', :category, '2030-01-01', 0, 0)"), {"category": category})
+    assert client.get("/events/").json() == []
+
+    # Теги, которые опубликовал бы другой процесс после создания мероприятия
+    tags = sorted(cache._instance_tags(models.Event(sport_category_id=category), False))
+    cache.invalidate(invalidation._drain(NotifyConnection(message("other-worker", tags))))
+
+    assert [event["title"] for event in client.get("/events/").json()] == ["Матч"]
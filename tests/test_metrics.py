@@ -0,0 +1,33 @@
+from monitoring.metrics import Histogram
+
+
+def test_metrics_exposition(client):
+    assert client.get("/events/12345").status_code == 404
+    assert client.get("/events/").status_code == 200
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    # Метка маршрута - шаблон, а не реальный путь
+    assert any(line.startswith('http_request_duration_seconds_count{method="GET",route="/events/{event_id}",status="404"}')
+               for line in lines)
+    assert not any("/events/12345" in line for line in lines)
+    assert any(line.startswith('http_request_sql_statements_bucket{method="GET",route="/events/",le="+Inf"}') for line in lines)
+    assert any(line.startswith('db_pool_connections{engine="primary",state="checkedout"}') for line in lines)
+    assert "# TYPE http_requests_in_flight gauge" in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe("/a", value=value)
+
+    assert histogram.collect()[2:] == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_count{route="/a"} 4',
+        'latency_seconds_sum{route="/a"} 6.05',
+    ]
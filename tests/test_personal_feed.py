@@ -0,0 +1,22 @@
+from database import crud, models
+from tests.test_single_flight import concurrent_get, slow
+
+
+def test_concurrent_personal_feeds_are_not_shared(app, client, db, auth_headers, monkeypatch):
+    football, hockey = models.SportCategory(name="Футбол"), models.SportCategory(name="Хоккей")
+    db.add_all([football, hockey])
+    db.commit()
+    items = {category.id: [crud.create_feed_item(db, title=f"{category.name} {i}", category_id=category.id).id
+                           for i in range(3)] for category in (football, hockey)}
+    first, second = auth_headers("first"), auth_headers("second")
+    assert client.post(f"/feed/{items[football.id][0]}/like", headers=first).status_code == 200
+    assert client.post(f"/feed/{items[hockey.id][0]}/like", headers=second).status_code == 200
+    calls = slow(monkeypatch, "get_personal_feed")
+
+    responses = concurrent_get(app, [("/feed/personal", first), ("/feed/personal", second), ("/feed/personal", {})])
+
+    assert [response.status_code for response in responses[:2]] == [200, 200]
+    assert responses[2].status_code in (401, 403)
+    assert len(calls) == 2
+    assert responses[0].json()[0]["category_id"] == football.id
+    assert responses[1].json()[0]["category_id"] == hockey.id
@@ -0,0 +1,32 @@
+from collections import Counter
+from config.create_token_check import TOKEN_CHECK
+from monitoring.flamegraph import render_svg, top_functions
+
+INTERNAL = {"X-Internal-Token": TOKEN_CHECK}
+
+
+def test_profiling_requires_internal_token(client):
+    assert "x-profile-id" not in client.get("/events/", headers={"X-Profile": "1"}).headers
+    assert "x-profile-id" not in client.get("/events/", params={"_profile": 1},
+                                            headers={"X-Internal-Token": "wrong"}).headers
+
+    profiled = client.get("/events/", headers=dict(INTERNAL, **{"X-Profile": "1"}))
+
+    assert profiled.status_code == 200
+    profile_id = profiled.headers["x-profile-id"]
+    assert client.get(f"/admin/profiles/{profile_id}").status_code in (401, 403)
+    assert client.get("/admin/profiles").status_code in (401, 403)
+    summaries = client.get("/admin/profiles", headers=INTERNAL).json()
+    assert {"id": profile_id, "method": "GET", "route": "/events/"}.items() <= summaries[0].items()
+    svg = client.get(profiled.headers["x-profile-url"], headers=INTERNAL)
+    assert (svg.status_code, svg.headers["content-type"]) == (200, "image/svg+xml")
+    assert client.get("/admin/profiles/missing", headers=INTERNAL).status_code == 404
+
+
+def test_top_functions_own_and_inclusive():
+    stacks = Counter({"main;handler;query": 3, "main;handler;encode": 1})
+
+    top = top_functions(stacks, limit=1)
+
+    assert top == [{"function": "query", "own_samples": 3, "own_percent": 75.0, "inclusive_percent": 75.0}]
+    assert render_svg(stacks, "GET /events/").startswith("<svg")
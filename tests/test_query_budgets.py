@@ -0,0 +1,101 @@
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from database import crud, models
+from monitoring.query_budget import QUERY_BUDGETS, QueryBudgetExceeded, check_endpoint_budget
+
+
+# Бюджеты с тестом ниже; новый бюджет без теста роняет test_every_budget_is_checked
+CHECKED = {
+    "GET /events/", "GET /events/{event_id}", "GET /feed/", "GET /feed/personal", "GET /venues/", "GET /teams/",
+    "POST /events/{event_id}/like", "PUT /teams/requests/{request_id}", "DELETE /teams/{team_id}/members/{user_id}",
+}
+
+
+@pytest.fixture
+def budget_client(app):
+    # Без lifespan: фоновые задачи (снимок справочников, очистка бронирований) не попадают в счетчик
+    return TestClient(app)
+
+
+@pytest.fixture
+def users(budget_client):
+    """
+    Три пользователя: (id, заголовки с токеном)
+    """
+    result = []
+    for username in ("owner", "member", "guest"):
+        response = budget_client.post("/users/", params={"username": username, "password": "password"})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        result.append((body["id"], {"Authorization": f"Bearer {body['access_token']}"}))
+    return result
+
+
+@pytest.fixture
+def seeded(db, users):
+    """
+    Несколько записей каждого вида со связями: N+1 в списках превысил бы бюджет
+    """
+    owner_id = users[0][0]
+    categories = [models.SportCategory(name=name) for name in ("Футбол", "Хоккей", "Теннис")]
+    db.add_all(categories)
+    db.commit()
+    for index in range(6):
+        category_id = categories[index % 3].id
+        event = crud.create_event(db, {"title": f"Матч {index}", "sport_category_id": category_id, "owner_id": owner_id,
+                                       "event_date": datetime(2030, 1, 1 + index), "available_seats": 10})
+        crud.like_event(db, event.id, owner_id)
+        item = crud.create_feed_item(db, title=f"Новость {index}", category_id=category_id)
+        crud.like_feed_item(db, item.id, owner_id)
+        crud.create_venue(db, {"name": f"Стадион {index}", "sport_category_id": category_id, "owner_id": owner_id})
+        crud.create_team(db, name=f"Команда {index}", sport_category_id=category_id, creator_id=owner_id)
+    return categories
+
+
+@pytest.mark.parametrize("url", ["/events/", "/events/1", "/feed/", "/venues/", "/teams/"])
+def test_read_budgets(budget_client, seeded, url):
+    response = check_endpoint_budget(budget_client, "GET", url)
+    assert response.status_code == 200, response.text
+    assert response.json()
+
+
+def test_personal_feed_budget(budget_client, seeded, users):
+    response = check_endpoint_budget(budget_client, "GET", "/feed/personal", headers=users[0][1])
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == 6
+
+
+def test_event_like_budget(budget_client, seeded, users):
+    # Первый лайк пользователя в категории: самый дорогой путь (создание строки интереса)
+    response = check_endpoint_budget(budget_client, "POST", "/events/1/like", headers=users[2][1])
+    assert response.status_code == 200, response.text
+
+
+def test_team_request_budget(budget_client, db, seeded, users):
+    member_id, member_headers = users[1]
+    request_id = budget_client.post("/teams/1/requests", headers=member_headers).json()["id"]
+
+    response = check_endpoint_budget(budget_client, "PUT", f"/teams/requests/{request_id}",
+                                     params={"status": "accepted"}, headers=users[0][1])
+
+    assert response.status_code == 200, response.text
+    assert db.query(models.TeamMember).filter_by(team_id=1, user_id=member_id).count() == 1
+
+
+@pytest.mark.parametrize("member", [1, 0], ids=["player", "captain"])
+def test_remove_member_budget(budget_client, db, seeded, users, member):
+    if member == 1:
+        crud.add_team_member(db, 1, users[1][0])
+    response = check_endpoint_budget(budget_client, "DELETE", f"/teams/1/members/{users[member][0]}",
+                                     headers=users[0][1])
+    assert response.status_code == 200, response.text
+
+
+def test_budget_exceeded_fails(budget_client, seeded):
+    with pytest.raises(QueryBudgetExceeded):
+        check_endpoint_budget(budget_client, "GET", "/events/", max_queries=0)
+
+
+def test_every_budget_is_checked():
+    assert set(QUERY_BUDGETS) == CHECKED
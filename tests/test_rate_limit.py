@@ -0,0 +1,76 @@
+import asyncio
+import ipaddress
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+import middleware.rate_limit as rate_limit
+from config import settings
+from config.jwt_token import jwt_manager
+
+
+def login_app():
+    async def login(request):
+        return PlainTextResponse("ok")
+    return rate_limit.RateLimitMiddleware(Starlette(routes=[Route("/users/login", login, methods=["POST"])]))
+
+
+def post_logins(app, forwarded_for, peer="203.0.113.7"):
+    async def run():
+        transport = httpx.ASGITransport(app=app, client=(peer, 40000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.post("/users/login", headers={"X-Forwarded-For": address}) for address in forwarded_for]
+    return asyncio.run(run())
+
+
+def test_login_limit_returns_429_with_retry_after():
+    burst = settings.RATE_LIMIT_LOGIN_BURST * settings.RATE_LIMIT_IP_MULTIPLIER
+
+    responses = post_logins(login_app(), ["198.51.100.1"] * (burst + 1))
+
+    assert [response.status_code for response in responses] == [200] * burst + [429]
+    assert int(responses[-1].headers["Retry-After"]) >= 1
+
+
+def test_spoofed_forwarded_for_from_untrusted_peer_shares_bucket():
+    burst = settings.RATE_LIMIT_LOGIN_BURST * settings.RATE_LIMIT_IP_MULTIPLIER
+
+    # Прямое подключение мимо nginx: новый X-Forwarded-For на каждый запрос не дает нового ведра
+    responses = post_logins(login_app(), [f"198.51.100.{index}" for index in range(burst + 1)])
+
+    assert responses[-1].status_code == 429
+
+
+def test_forwarded_for_from_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+    burst = settings.RATE_LIMIT_LOGIN_BURST * settings.RATE_LIMIT_IP_MULTIPLIER
+    app = login_app()
+
+    # Клиент - крайний справа адрес, не принадлежащий доверенным прокси; подделанные слева не учитываются
+    spoofed = post_logins(app, [f"198.51.100.{index}, 192.0.2.1, 10.0.0.2" for index in range(burst + 1)], peer="10.0.0.1")
+    other_client = post_logins(app, ["192.0.2.2"], peer="10.0.0.1")
+
+    assert spoofed[-1].status_code == 429
+    assert other_client[0].status_code == 200
+    assert rate_limit.client_ip({"client": ("10.0.0.1", 1), "headers": [(b"x-forwarded-for", b"10.0.0.3")]}) == "10.0.0.1"
+
+
+def test_like_limit_is_per_user():
+    async def like(request):
+        return PlainTextResponse("ok")
+    app = rate_limit.RateLimitMiddleware(Starlette(routes=[Route("/events/{event_id}/like", like, methods=["POST"])]))
+    burst = settings.RATE_LIMIT_LIKES_BURST
+
+    async def run():
+        transport = httpx.ASGITransport(app=app, client=("203.0.113.7", 40000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            def post(user_id):
+                return client.post("/events/1/like", headers={"Authorization": f"Bearer {jwt_manager.encode_token(user_id)}"})
+            first = [await post(1) for _ in range(burst + 1)]
+            return first, await post(2)
+    first, other_user = asyncio.run(run())
+
+    # Ведро пользователя пусто, общее ведро IP (в RATE_LIMIT_IP_MULTIPLIER раз больше) - нет
+    assert [response.status_code for response in first] == [200] * burst + [429]
+    assert int(first[-1].headers["Retry-After"]) >= 1
+    assert other_user.status_code == 200
@@ -0,0 +1,50 @@
+import os
+import time
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import database.base as base
+from config import settings
+from database import models
+from tests.conftest import TEST_DIR
+
+
+@pytest.fixture
+def replica(monkeypatch, db, category):
+    """
+    Реплика - отдельный файл SQLite: по заголовку мероприятия видно, из какой базы пришел ответ
+    """
+    monkeypatch.setattr(settings, "REPLICA_STICKY_SECONDS", 0.3)
+    replica_engine = create_engine(f"sqlite:///{os.path.join(TEST_DIR, 'replica.db')}",
+                                   connect_args={"check_same_thread": False})
+    base.Base.metadata.create_all(replica_engine)
+    replica_session = sessionmaker(bind=replica_engine)()
+    for session, title in ((db, "Основная"), (replica_session, "Реплика")):
+        session.add(models.Event(id=1, title=title, sport_category_id=category, event_date=datetime(2030, 1, 1)))
+        session.commit()
+    replica_session.close()
+    # Список общий с модулями, импортировавшими его по имени
+    base.ReplicaSessions.append(sessionmaker(autocommit=False, autoflush=False, bind=replica_engine))
+    yield
+    base.ReplicaSessions.clear()
+    base.Base.metadata.drop_all(replica_engine)
+    replica_engine.dispose()
+
+
+def title(client, headers=None):
+    response = client.get("/events/1", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["title"]
+
+
+def test_reads_use_replica_until_user_writes(client, auth_headers, replica):
+    headers = auth_headers("user")
+    assert (title(client), title(client, headers)) == ("Реплика", "Реплика")
+
+    assert client.post("/events/1/like", headers=headers).status_code == 200
+
+    # Окно read-your-writes: автор записи читает основную базу, остальные - реплику
+    assert (title(client, headers), title(client, auth_headers("other")), title(client)) == ("Основная", "Реплика", "Реплика")
+    time.sleep(settings.REPLICA_STICKY_SECONDS + 0.1)
+    assert title(client, headers) == "Реплика"
@@ -0,0 +1,59 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import database.base as base
+from database import models
+from database.cache import result_cache
+
+
+@pytest.fixture
+def replica():
+    """
+    Отстающая реплика: отдельная база, в которую записи основной базы не попадают
+    """
+    replica_engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    base.Base.metadata.create_all(replica_engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    base.ReplicaSessions.append(factory)
+    yield factory
+    base.ReplicaSessions.remove(factory)
+    replica_engine.dispose()
+
+
+def add_event(session, title):
+    session.add(models.SportCategory(id=1, name="Футбол"))
+    session.add(models.Event(id=1, title=title, sport_category_id=1, event_date=datetime(2030, 1, 1), owner_id=1))
+    session.commit()
+
+
+def titles(response):
+    assert response.status_code == 200, response.text
+    return [event["title"] for event in response.json()]
+
+
+def test_reads_after_write_do_not_cache_lagging_replica(client, db, replica, auth_headers):
+    writer = auth_headers("writer")
+    add_event(db, "Старое")
+    replica_db = replica()
+    add_event(replica_db, "Старое")
+    replica_db.close()
+    result_cache._invalidated_at.clear()
+    assert titles(client.get("/events/")) == ["Старое"]
+
+    assert client.put("/events/1", params={"title": "Новое"}, headers=writer).status_code == 200
+
+    # Промах сразу после инвалидации загружается из основной базы, а не из отстающей реплики
+    assert titles(client.get("/events/")) == ["Новое"]
+    assert titles(client.get("/events/", headers=writer)) == ["Новое"]
+
+
+def test_writer_reads_bypass_cache(client, db, replica, auth_headers):
+    writer = auth_headers("writer")
+    add_event(db, "Событие")
+    assert client.put("/events/1", params={"description": "Описание"}, headers=writer).status_code == 200
+    result_cache.clear()
+
+    assert titles(client.get("/events/", headers=writer)) == ["Событие"]
+    assert not result_cache._entries
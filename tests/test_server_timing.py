@@ -0,0 +1,31 @@
+from sqlalchemy import create_engine, event
+from database.base import TimedQueuePool
+from monitoring.context import RequestStats, request_stats
+from tests.conftest import engine
+
+
+def test_pool_wait_is_counted_on_checkout(tmp_path):
+    pooled = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool, pool_size=1)
+    stats = RequestStats()
+    token = request_stats.set(stats)
+    try:
+        with pooled.connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        request_stats.reset(token)
+        pooled.dispose()
+    assert stats.db_wait > 0
+
+
+def test_cached_response_does_not_check_out_connection(client):
+    checkouts = []
+    listener = lambda *args: checkouts.append(args)  # noqa: E731
+    assert client.get("/events/").status_code == 200
+    event.listen(engine.pool, "checkout", listener)
+    try:
+        response = client.get("/events/")
+    finally:
+        event.remove(engine.pool, "checkout", listener)
+    assert response.status_code == 200
+    assert "db-wait" in response.headers["server-timing"]
+    assert checkouts == []
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+import httpx
+import pytest
+from fastapi import APIRouter, Depends
+from config.jwt_token import current_user_id
+from database import crud, models
+from monitoring.routing import InstrumentedRoute, coalesced
+
+
+def concurrent_get(app, requests):
+    """
+    Одновременные GET-запросы к приложению: список (путь, заголовки) -> список ответов
+    """
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(http.get(url, headers=headers) for url, headers in requests))
+    return asyncio.run(run())
+
+
+def slow(monkeypatch, name):
+    """
+    Замедляет функцию crud, чтобы запросы пересеклись, и считает ее вызовы
+    """
+    original = getattr(crud, name)
+    calls = []
+    lock = threading.Lock()
+
+    def wrapper(*args, **kwargs):
+        with lock:
+            calls.append(kwargs)
+        time.sleep(0.3)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(crud, name, wrapper)
+    return calls
+
+
+def test_followers_get_leader_response(app, db, category, monkeypatch):
+    event = models.Event(title="Матч", sport_category_id=category, event_date=datetime(2030, 1, 1))
+    db.add(event)
+    db.commit()
+    calls = slow(monkeypatch, "get_event")
+
+    responses = concurrent_get(app, [(f"/events/{event.id}", {})] * 3)
+
+    assert len(calls) == 1
+    assert [response.status_code for response in responses] == [200] * 3
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert responses[0].json()["title"] == "Матч"
+
+
+def test_declared_headers_split_flights(app, monkeypatch):
+    calls = slow(monkeypatch, "get_feed_items")
+
+    responses = concurrent_get(app, [("/feed/", {"X-Internal-Token": "a"}), ("/feed/", {"X-Internal-Token": "a"}),
+                                     ("/feed/", {"X-Internal-Token": "b"})])
+
+    assert [response.status_code for response in responses] == [200] * 3
+    assert len(calls) == 2
+
+
+def test_auth_route_cannot_be_coalesced():
+    router = APIRouter(route_class=InstrumentedRoute)
+
+    with pytest.raises(ValueError):
+        @router.get("/me")
+        @coalesced
+        def read_me(user_id: int = Depends(current_user_id)):
+            return {"user": user_id}
@@ -0,0 +1,55 @@
+import os
+from datetime import datetime
+from database import models
+from database.snapshot import Snapshot, SnapshotStore
+from tests.conftest import TEST_DIR
+
+
+def test_snapshot_round_trip(db):
+    football, hockey = models.SportCategory(name="Футбол"), models.SportCategory(name="Хоккей", icon_url="/h.png")
+    db.add_all([football, hockey])
+    db.flush()
+    db.add_all([
+        models.Venue(name="Стадион", address="Ленина, 1", owner_id=7, sport_category_id=hockey.id),
+        models.Venue(name="Двор"),
+        models.Venue(name="Арена", venue_type="indoor", sport_category_id=hockey.id),
+        models.Venue(name="Поле", sport_category_id=football.id),
+    ])
+    db.add_all([
+        models.Event(title="Матч «Финал»", sport_category_id=hockey.id, event_date=datetime(2030, 5, 1, 18, 30),
+                     price=1500.5, latitude=55.75, status="active"),
+        models.Event(title="Прошедший", sport_category_id=hockey.id, event_date=datetime(2020, 1, 1), status="completed"),
+        models.Event(title="Турнир", sport_category_id=football.id, event_date=datetime(2030, 6, 1), status="new"),
+    ])
+    db.commit()
+    store = SnapshotStore(os.path.join(TEST_DIR, "round-trip.snapshot"))
+
+    store.rebuild()
+    snapshot = Snapshot.open(store.path)
+
+    assert [row["name"] for row in snapshot.categories.page()] == ["Футбол", "Хоккей"]
+    assert snapshot.categories.find(hockey.id) == {"id": hockey.id, "name": "Хоккей", "icon_url": "/h.png"}
+    assert snapshot.categories.find(999) is None
+    # NULL в целых, строковых и вещественных колонках и датах читается как None
+    assert snapshot.venues.find(2) == {"id": 2, "name": "Двор", "address": None, "image_url": None, "owner_id": None,
+                                       "venue_type": None, "sport_category_id": None}
+    assert [row["name"] for row in snapshot.venues.by_category(hockey.id)] == ["Стадион", "Арена"]
+    assert [row["name"] for row in snapshot.venues.by_category(hockey.id, skip=1, limit=5)] == ["Арена"]
+    assert snapshot.venues.by_category(999) == []
+    # Завершенные мероприятия в снимок не попадают
+    assert [row["title"] for row in snapshot.events.page()] == ["Матч «Финал»", "Турнир"]
+    final = snapshot.events.find(1)
+    assert (final["event_date"], final["price"], final["latitude"], final["longitude"]) == (
+        datetime(2030, 5, 1, 18, 30), 1500.5, 55.75, None)
+    assert (final["registration_end_date"], final["location"]) == (None, None)
+    assert [row["title"] for row in snapshot.events.by_category(football.id)] == ["Турнир"]
+
+
+def test_snapshot_marked_dirty_only_by_its_namespaces():
+    store = SnapshotStore(os.path.join(TEST_DIR, "dirty.snapshot"))
+    store._dirty = False
+
+    store.mark_dirty({"teams:category:1", "teams"})
+    assert store._dirty is False
+    store.mark_dirty({"events:category:1"})
+    assert store._dirty is True
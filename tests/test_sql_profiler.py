@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from config import settings
+from monitoring import sql
+
+
+def test_failed_statement_does_not_leave_start_time(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'profiler.db'}")
+    sql.instrument_engine(engine)
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("SELECT * FROM missing_table")
+        assert "query_start" not in connection.info
+        assert connection.exec_driver_sql("SELECT 1").scalar() == 1
+        assert "query_start" not in connection.info
+    engine.dispose()
+
+
+def test_explain_history_is_bounded(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(sql._explain_executor, "submit", lambda *args: submitted.append(args[-1]))
+    monkeypatch.setattr(sql, "_last_explain", {})
+    monkeypatch.setattr(settings, "SQL_PROFILER_MAX_STATEMENTS", 2)
+    connection = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"), engine=None)
+
+    for index in range(5):
+        sql._maybe_explain(connection, "SELECT 1", (), f"fingerprint {index}")
+    assert submitted == ["fingerprint 0", "fingerprint 1"]
+    assert len(sql._last_explain) == 2
+
+    # После интервала старые записи вытесняются новыми
+    monkeypatch.setattr(settings, "SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS", 0)
+    sql._maybe_explain(connection, "SELECT 1", (), "fingerprint 5")
+    assert submitted[-1] == "fingerprint 5"
+    assert len(sql._last_explain) <= 2
@@ -0,0 +1,40 @@
+from datetime import datetime
+import pytest
+from config import settings
+from config.create_token_check import TOKEN_CHECK
+from database import models
+from database.streaming import encode_rows
+
+
+@pytest.mark.parametrize("url", ["/events/", "/venues/", "/teams/", "/feed/", "/sport-categories/"])
+def test_page_size_is_bounded(client, url):
+    assert client.get(url, params={"limit": settings.MAX_PAGE_SIZE + 1}).status_code == 422
+    assert client.get(url, params={"limit": 0}).status_code == 422
+    assert client.get(url, params={"limit": settings.MAX_PAGE_SIZE}).status_code == 200
+
+
+def test_stream_requires_internal_token(client, db, category):
+    db.add_all([models.Event(title=f"Матч {index}", sport_category_id=category, event_date=datetime(2030, 1, 1 + index))
+                for index in range(3)])
+    db.commit()
+
+    assert client.get("/events/", params={"stream": "true"}).status_code == 403
+    assert client.get("/events/", params={"stream": "true"}, headers={"X-Internal-Token": "wrong"}).status_code == 403
+    # limit в потоковом режиме не применяется, skip - применяется
+    streamed = client.get("/events/", params={"stream": "true", "skip": 1, "limit": 1},
+                          headers={"X-Internal-Token": TOKEN_CHECK})
+    assert streamed.status_code == 200, streamed.text
+    assert streamed.headers["content-type"].startswith("application/json")
+    assert [event["title"] for event in streamed.json()] == ["Матч 1", "Матч 2"]
+
+
+def test_encode_rows_in_batches():
+    rows = [{"id": index, "at": datetime(2030, 1, 1), "name": None} for index in range(5)]
+
+    chunks = list(encode_rows(iter(rows), "ndjson", ["id", "at", "name"], batch_size=2))
+    csv_text = b"".join(encode_rows(iter(rows), "csv", ["id", "at", "name"])).decode()
+
+    assert len(chunks) == 3
+    assert b"".join(chunks).decode().splitlines()[0] == '{"id": 0, "at": "2030-01-01T00:00:00", "name": null}'
+    assert csv_text.splitlines()[:2] == ["id,at,name", "0,2030-01-01T00:00:00,"]
+    assert b"".join(encode_rows(iter([]), "json", ["id"])) == b"[]"
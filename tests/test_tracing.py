@@ -0,0 +1,69 @@
+import types
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+import monitoring.tracing as tracing
+
+
+class CollectingProcessor:
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+    def shutdown(self):
+        pass
+
+
+@pytest.fixture
+def spans(monkeypatch):
+    processor = CollectingProcessor()
+    monkeypatch.setattr(tracing.tracer, "processor", processor)
+    monkeypatch.setattr(tracing.tracer, "sample_ratio", 1.0)
+    return processor.spans
+
+
+def test_traceparent_propagation(spans):
+    engine = create_engine("sqlite://")
+    tracing.instrument_engine_tracing(engine)
+    module = types.ModuleType("store")
+
+    def load(item_id):
+        with engine.connect() as connection:
+            return connection.execute(text("SELECT :id"), {"id": item_id}).scalar()
+    load.__module__ = module.__name__
+    module.load = load
+    tracing.instrument_module(module)
+
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        return {"id": module.load(item_id)}
+
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    client = TestClient(tracing.TracingMiddleware(app))
+    response = client.get("/items/7", headers={"traceparent": f"00-{trace_id}-{parent_id}-01"})
+
+    assert response.json() == {"id": 7}
+    by_name = {span.name: span for span in spans}
+    root, crud_span, sql = by_name["GET /items/{item_id}"], by_name["store.load"], by_name["SQL SELECT"]
+    assert {span.trace_id for span in spans} == {trace_id}
+    assert (root.parent_id, crud_span.parent_id, sql.parent_id) == (parent_id, root.span_id, crud_span.span_id)
+    assert root.attributes["http.status_code"] == 200
+    assert response.headers["traceresponse"] == f"00-{trace_id}-{root.span_id}-01"
+
+
+def test_unsampled_parent_is_not_exported(spans):
+    app = FastAPI()
+    app.get("/ping")(lambda: "pong")
+
+    client = TestClient(tracing.TracingMiddleware(app))
+    response = client.get("/ping", headers={"traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00"})
+
+    assert response.headers["traceresponse"].endswith("-00")
+    assert spans == []
+    assert tracing.parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert tracing.parse_traceparent("garbage") is None
@@ -0,0 +1,47 @@
+from config.create_token_check import TOKEN_CHECK
+from database import crud, models
+from monitoring.query_budget import count_queries
+
+
+def titles(response):
+    assert response.status_code == 200, response.text
+    return [item["title"] for item in response.json()]
+
+
+def test_trending_lists_unscored_items_last(client, db, auth_headers, category):
+    # Элемент, созданный до появления рейтинга, строки в trending_scores не имеет
+    db.add(models.FeedItem(title="Старая", category_id=category))
+    db.commit()
+    crud.create_feed_item(db, title="Новая", category_id=category)
+    liked = crud.create_feed_item(db, title="Популярная", category_id=category)
+    for username in ("first", "second"):
+        assert client.post(f"/feed/{liked.id}/like", headers=auth_headers(username)).status_code == 200
+
+    assert titles(client.get("/feed/", params={"sort": "trending"})) == ["Популярная", "Новая", "Старая"]
+    streamed = client.get("/feed/", params={"sort": "trending", "stream": "true"}, headers={"X-Internal-Token": TOKEN_CHECK})
+    assert titles(streamed) == ["Популярная", "Новая", "Старая"]
+
+
+def test_trending_update_is_one_statement(db, category):
+    item = crud.create_feed_item(db, title="Новость", category_id=category)
+    before = db.get(models.TrendingScore, ("feed", item.id)).score
+
+    with count_queries() as counter:
+        crud._add_trending(db, "feed", item.id, before, category_id=category)
+    db.commit()
+    added = db.get(models.TrendingScore, ("feed", item.id))
+    db.refresh(added)
+    assert counter.count == 1
+    assert abs(added.score - crud._log_add(before, before)) < 1e-9
+
+    crud._add_trending(db, "feed", item.id, before, remove=True)
+    db.commit()
+    db.refresh(added)
+    assert abs(added.score - before) < 1e-9
+    # Вычитание всего остатка (погрешность округления) оставляет строку как есть
+    crud._add_trending(db, "feed", item.id, before + 1, remove=True)
+    crud._add_trending(db, "event", 999, before, remove=True)
+    db.commit()
+    db.refresh(added)
+    assert abs(added.score - before) < 1e-9
+    assert db.get(models.TrendingScore, ("event", 999)) is None
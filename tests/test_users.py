@@ -0,0 +1,11 @@
+def test_user_responses_do_not_expose_password_hash(client, auth_headers):
+    headers = auth_headers("user")
+
+    users = client.get("/users/").json()
+    updated = client.put("/users/1", params={"avatar_url": "https://example.com/a.png"}, headers=headers)
+
+    assert [user["username"] for user in users] == ["user"]
+    assert all("password" not in user for user in users)
+    assert updated.status_code == 200
+    assert updated.json()["avatar_url"] == "https://example.com/a.png"
+    assert "password" not in updated.json()
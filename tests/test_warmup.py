@@ -0,0 +1,18 @@
+from datetime import datetime
+from database import models
+from database.cache import result_cache
+from routes import health
+
+
+def test_primed_keys_match_default_list_requests(client, db, category):
+    db.add(models.Event(title="Матч", sport_category_id=category, event_date=datetime(2030, 1, 1)))
+    db.commit()
+    result_cache.clear()
+
+    health._prime_caches()
+    primed = set(result_cache._entries)
+
+    for path in ("/events/", "/events/?skip=0&limit=100", f"/events/?category_id={category}", "/venues/", "/teams/"):
+        assert client.get(path).status_code == 200
+    assert set(result_cache._entries) == primed
+    assert len(primed) == 4